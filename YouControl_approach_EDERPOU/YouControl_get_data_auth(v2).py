@@ -15,6 +15,7 @@ from typing import Optional, List, Dict
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import WebDriverException, NoSuchElementException, TimeoutException
 from bs4 import BeautifulSoup
 import re
@@ -29,15 +30,23 @@ OUTPUT_DIR = "out"
 OUTPUT_CSV = os.path.join(OUTPUT_DIR, "companies_parsed.csv")
 CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, "checkpoint.txt")
 
-CONCURRENCY = 3           # number of parallel webdriver instances (adjust to resources)
+CONCURRENCY = 3           # number of parallel long-lived webdriver instances (adjust to resources)
 HEADLESS = False          # True to run Chrome headless (but visible browser is often safer)
 IMPLICIT_WAIT = 6         # seconds for Selenium implicit waits
+BASE_URL = "https://youcontrol.com.ua/"
+COMPANY_URL = "https://youcontrol.com.ua/catalog/company_details/{edrpou}/"
+DIRECT_URL = True         # open COMPANY_URL directly; search box only when that is not a company page (404)
+PAGE_LOAD_TIMEOUT = 15    # seconds for WebDriverWait on DOM-ready / search results
+COMPANY_PAGE_MARKER = "table.detail-view, h2.seo-table-name"   # present only on a company details page
+SEARCH_BOX = "input[placeholder*='Введіть назву компанії, ЄДРПОУ']"
+RESULT_LINK = "a.link-details.link-open"
 SEARCH_DELAY_MIN = 1.0    # random sleep before issuing search
 SEARCH_DELAY_MAX = 2.5
 BETWEEN_SEARCH_MIN = 2.0  # sleep between subsequent searches inside same driver
 BETWEEN_SEARCH_MAX = 4.0
 RETRY_MAX = 3
 RETRY_BACKOFF_BASE = 3.0  # exponential backoff base seconds
+DRIVER_START_RETRIES = 3  # attempts to (re)start a logged-in driver before the worker gives up
 
 # -------- logging ----------
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -132,38 +141,65 @@ def login_and_save_cookies(driver: webdriver.Chrome, email: str, password: str,
     else:
         logger.info("Login finished (check page).")
 
+def wait_page_ready(driver: webdriver.Chrome, timeout: float = PAGE_LOAD_TIMEOUT) -> bool:
+    try:
+        WebDriverWait(driver, timeout).until(lambda d: d.execute_script("return document.readyState") == "complete")
+        return True
+    except TimeoutException:
+        return False
+
+def has_element(driver: webdriver.Chrome, css: str) -> bool:
+    """querySelector via JS: unlike find_elements it does not block for IMPLICIT_WAIT when absent."""
+    return bool(driver.execute_script("return !!document.querySelector(arguments[0])", css))
+
+def open_company_page(driver: webdriver.Chrome, edrpou: str) -> Optional[str]:
+    """Navigate straight to COMPANY_URL. None — loaded page is not a company (404 / redirect): fall back to search."""
+    driver.get(COMPANY_URL.format(edrpou=edrpou))
+    if wait_page_ready(driver) and has_element(driver, COMPANY_PAGE_MARKER):
+        return driver.page_source
+    logger.info(f"Direct URL is not a company page for {edrpou} (title {driver.title[:60]!r}), falling back to search")
+    return None
+
 def perform_search_and_get_html(driver: webdriver.Chrome, edrpou: str) -> Optional[str]:
     """Type EDRPOU into search box and return page HTML after navigation."""
     try:
-        # find search box: same selector used earlier
-        search_box = driver.find_element(By.CSS_SELECTOR, "input[placeholder*='Введіть назву компанії, ЄДРПОУ']")
+        if not has_element(driver, SEARCH_BOX):
+            # e.g. after a direct-URL 404 page
+            driver.get(BASE_URL)
+            wait_page_ready(driver)
+        search_box = driver.find_element(By.CSS_SELECTOR, SEARCH_BOX)
         # clear, input and submit
         search_box.clear()
         time.sleep(random.uniform(0.2, 0.6))
         search_box.send_keys(edrpou)
         time.sleep(random.uniform(0.2, 0.8))
         search_box.send_keys('\n')  # Enter
-        # wait for results; give variable delay to mimic human
-        time.sleep(random.uniform(2.0, 5.0))
-        # if result redirects to company details, good; otherwise, ensure click the first result
-        # try to check for direct company page by url or find link
-        current_url = driver.current_url
-        if "/company_details/" in current_url:
-            html = driver.page_source
-            return html
-        # otherwise try to click first result link
-        try:
-            first_link = driver.find_element(By.CSS_SELECTOR, "a.link-details.link-open")
-            first_link.click()
-            time.sleep(random.uniform(1.8, 3.5))
-            return driver.page_source
-        except NoSuchElementException:
-            logger.warning(f"No result link found for {edrpou}")
-            return None
+        # either redirect straight to company details or a results list
+        wait = WebDriverWait(driver, PAGE_LOAD_TIMEOUT)
+        wait.until(lambda d: "/company_details/" in d.current_url or has_element(d, RESULT_LINK))
+        if "/company_details/" not in driver.current_url:
+            driver.find_element(By.CSS_SELECTOR, RESULT_LINK).click()
+            wait.until(lambda d: "/company_details/" in d.current_url)
+        wait_page_ready(driver)
+        return driver.page_source
+    except TimeoutException:
+        logger.warning(f"No result link found for {edrpou}")
+        return None
     except Exception as e:
         logger.exception(f"Search failed for {edrpou}: {e}")
         return None
 
+def get_company_html(driver: webdriver.Chrome, edrpou: str) -> Optional[str]:
+    """Direct detail URL first (DIRECT_URL), search box only as fallback."""
+    if DIRECT_URL:
+        try:
+            html = open_company_page(driver, edrpou)
+            if html:
+                return html
+        except WebDriverException as e:
+            logger.warning(f"Direct URL failed for {edrpou}: {e}")
+    return perform_search_and_get_html(driver, edrpou)
+
 def parse_company_youcontrol_html(html: str) -> Dict:
     """Reuse parsing logic from your auth(v1) — returns dict of fields (EDRPOU_CODE included)."""
     soup = BeautifulSoup(html, "lxml")
@@ -232,62 +268,138 @@ def parse_company_youcontrol_html(html: str) -> Dict:
     result = {k: clean_text(v) for k, v in result.items() if v is not None}
     return result
 
-def worker_task_blocking(edrpou: str, account_email: str, account_password: str, worker_id: int) -> Optional[Dict]:
-    """
-    Blocking function to run inside thread:
-    - creates driver
-    - logs in
-    - searches given EDRPOU
-    - parses and returns dict (or None)
-    """
-    logger.info(f"[W{worker_id}] Starting worker for {edrpou}")
-    driver = None
-    try:
-        driver = create_driver()
-        login_and_save_cookies(driver, account_email, account_password)
-        # small random delay before search to vary timing
-        time.sleep(random.uniform(SEARCH_DELAY_MIN, SEARCH_DELAY_MAX))
-
-        # try multiple retries on transient failures
-        attempt = 0
-        while attempt < RETRY_MAX:
-            html = perform_search_and_get_html(driver, edrpou)
-            if html:
+# --------------- Driver pool (one long-lived logged-in driver per worker) ----------------
+class PooledDriver:
+    """Chrome + login, reused across lookups; restarted only when health_check fails."""
+
+    def __init__(self, worker_id: int, email: str, password: str):
+        self.worker_id = worker_id
+        self.email = email
+        self.password = password
+        self.driver: Optional[webdriver.Chrome] = None
+        self.lookups = 0
+        self.restarts = 0
+
+    def start(self):
+        """Blocking: new Chrome + login. Retries with backoff, raises after DRIVER_START_RETRIES."""
+        for attempt in range(DRIVER_START_RETRIES):
+            self.quit()
+            try:
+                self.driver = create_driver()
+                login_and_save_cookies(self.driver, self.email, self.password)
+                if self.health_check():
+                    logger.info(f"[W{self.worker_id}] Driver ready")
+                    return
+                logger.warning(f"[W{self.worker_id}] Driver unhealthy right after login, attempt {attempt+1}")
+            except Exception as e:
+                logger.warning(f"[W{self.worker_id}] Driver start failed ({attempt+1}/{DRIVER_START_RETRIES}): {e}")
+            time.sleep(RETRY_BACKOFF_BASE * (2 ** attempt) + random.uniform(0.5, 1.5))
+        self.quit()
+        raise RuntimeError(f"[W{self.worker_id}] could not start a logged-in driver")
+
+    def health_check(self) -> bool:
+        """Browser responds, page loaded and the session is not thrown back to sign_in."""
+        if self.driver is None:
+            return False
+        try:
+            state = self.driver.execute_script("return document.readyState")
+            url = self.driver.current_url
+        except WebDriverException:
+            return False
+        return state in ("interactive", "complete") and "sign_in" not in url
+
+    def restart(self):
+        self.restarts += 1
+        logger.warning(f"[W{self.worker_id}] Restarting driver (restart #{self.restarts})")
+        self.start()
+
+    def lookup(self, edrpou: str) -> Optional[Dict]:
+        """Blocking: open (direct URL / search) + parse one EDRPOU with retries; restarts the driver if it went bad."""
+        for attempt in range(RETRY_MAX):
+            html = get_company_html(self.driver, edrpou)
+            if html and self.health_check():
                 parsed = parse_company_youcontrol_html(html)
-                logger.info(f"[W{worker_id}] Parsed {edrpou}: {len(parsed)} fields")
-                # polite pause before leaving
+                self.lookups += 1
+                logger.info(f"[W{self.worker_id}] Parsed {edrpou}: {len(parsed)} fields")
+                # polite pause before the next search in the same driver
                 time.sleep(random.uniform(BETWEEN_SEARCH_MIN, BETWEEN_SEARCH_MAX))
                 return parsed
-            else:
-                backoff = RETRY_BACKOFF_BASE * (2 ** attempt) + random.uniform(0.5, 1.5)
-                logger.warning(f"[W{worker_id}] No HTML for {edrpou}, retry {attempt+1}/{RETRY_MAX} after {backoff:.1f}s")
-                time.sleep(backoff)
-                attempt += 1
-        logger.error(f"[W{worker_id}] Failed to get {edrpou} after retries")
-        return None
-    except Exception as e:
-        logger.exception(f"[W{worker_id}] Worker exception for {edrpou}: {e}")
+            if not self.health_check():
+                # crashed browser / logged out session — html (if any) is not the company page
+                self.restart()
+                continue
+            backoff = RETRY_BACKOFF_BASE * (2 ** attempt) + random.uniform(0.5, 1.5)
+            logger.warning(f"[W{self.worker_id}] No HTML for {edrpou}, retry {attempt+1}/{RETRY_MAX} after {backoff:.1f}s")
+            time.sleep(backoff)
+        logger.error(f"[W{self.worker_id}] Failed to get {edrpou} after retries")
         return None
-    finally:
-        if driver:
+
+    def quit(self):
+        if self.driver:
             try:
-                driver.quit()
+                self.driver.quit()
             except Exception:
                 pass
+        self.driver = None
+
 
 # --------------- ASYNC ORCHESTRATION ----------------
-async def parse_all_edrpous(edrpous: List[str]):
+def load_done_indices() -> set:
+    """Indices already written to OUTPUT_CSV — workers finish out of order, checkpoint alone is not enough."""
+    if not os.path.exists(OUTPUT_CSV):
+        return set()
+    try:
+        done = pd.read_csv(OUTPUT_CSV, usecols=["_EDRPOU_INDEX"], encoding="utf-8-sig")["_EDRPOU_INDEX"]
+        return set(int(x) for x in done.dropna())
+    except Exception as e:
+        logger.warning(f"Could not read done indices from {OUTPUT_CSV}: {e}")
+        return set()
+
+
+async def driver_worker(worker_id: int, queue: asyncio.Queue, ex: ThreadPoolExecutor, on_done):
+    """Takes (idx, edrpou) from the pre-filled queue until it is empty; one PooledDriver for the whole run."""
     loop = asyncio.get_running_loop()
-    ex = ThreadPoolExecutor(max_workers=CONCURRENCY)
+    pooled = PooledDriver(worker_id, LOGIN_EMAIL, LOGIN_PASSWORD)
+    # stagger logins so CONCURRENCY browsers don't sign in in the same second
+    await asyncio.sleep(worker_id * random.uniform(SEARCH_DELAY_MIN, SEARCH_DELAY_MAX))
+    try:
+        await loop.run_in_executor(ex, pooled.start)
+        while True:
+            try:
+                idx, edrpou = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                parsed = await loop.run_in_executor(ex, pooled.lookup, edrpou)
+            except Exception:
+                # restart() gave up — the item goes back for the other workers
+                queue.put_nowait((idx, edrpou))
+                raise
+            on_done(idx, edrpou, parsed)
+    except Exception as e:
+        logger.error(f"[W{worker_id}] Driver lost: {e} — worker exits, remaining workers continue")
+    finally:
+        await loop.run_in_executor(ex, pooled.quit)
+        logger.info(f"[W{worker_id}] Stopped: {pooled.lookups} lookups, {pooled.restarts} restarts")
+
+
+async def parse_all_edrpous(edrpous: List[str]):
     checkpoint = load_checkpoint()
     start_idx = checkpoint + 1 if checkpoint is not None else 0
-    logger.info(f"Starting parsing from index {start_idx} (total {len(edrpous)})")
+    done = load_done_indices()
+    todo = [(idx, edrpous[idx]) for idx in range(start_idx, len(edrpous)) if idx not in done]
+    logger.info(f"Starting parsing from index {start_idx} (total {len(edrpous)}, to do {len(todo)}, "
+                f"workers {CONCURRENCY})")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in todo:
+        queue.put_nowait(item)
 
-    # create tasks in batches to avoid scheduling all at once
-    for idx in range(start_idx, len(edrpous)):
-        edrpou = edrpous[idx]
-        # submit to executor
-        parsed = await loop.run_in_executor(ex, worker_task_blocking, edrpou, LOGIN_EMAIL, LOGIN_PASSWORD, idx % CONCURRENCY)
+    # checkpoint = last index below which everything is processed (results come out of order)
+    finished = set()
+    watermark = [start_idx - 1]
+
+    def on_done(idx: int, edrpou: str, parsed: Optional[Dict]):
         if parsed:
             # attach index and timestamp
             parsed["_EDRPOU_INDEX"] = idx
@@ -296,15 +408,23 @@ async def parse_all_edrpous(edrpous: List[str]):
             logger.info(f"Saved {edrpou} (idx {idx}) to CSV")
         else:
             logger.warning(f"No data for {edrpou} (idx {idx})")
-
-        # update checkpoint after each processed item
-        save_checkpoint(idx)
-
-        # slight randomized delay between tasks to reduce pattern
-        await asyncio.sleep(random.uniform(0.5, 1.5))
-
-    ex.shutdown(wait=True)
-    logger.info("Completed all EDRPOU parsing")
+        finished.add(idx)
+        while watermark[0] + 1 in finished or watermark[0] + 1 in done:
+            watermark[0] += 1
+            finished.discard(watermark[0])
+        save_checkpoint(watermark[0])
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+        workers = [asyncio.create_task(driver_worker(w, queue, ex, on_done)) for w in range(CONCURRENCY)]
+        await asyncio.gather(*workers)
+    left = queue.qsize()
+    if left:
+        logger.error(f"All drivers failed, {left} EDRPOU left unprocessed (restart to resume)")
+    elapsed = time.monotonic() - t0
+    processed = len(todo) - left
+    logger.info(f"Completed EDRPOU parsing: {processed} in {elapsed:.0f}s "
+                f"({elapsed / max(processed, 1):.1f}s per company)")
 
 # --------------- MAIN ----------------
 def main():
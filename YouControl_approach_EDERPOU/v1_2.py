@@ -2,6 +2,8 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 import time
 import pickle
 from bs4 import BeautifulSoup
@@ -16,6 +18,10 @@ INPUT_CSV = r"C:\OTP Draft\YouControl\test_dataset.csv"  # Файл з ЄДРП
 OUTPUT_DIR = "parsed_companies"  # Папка для результатів
 COOKIES_FILE = "cookies.pkl"
 DELAY_BETWEEN_REQUESTS = 3  # Затримка між запитами (секунди)
+COMPANY_URL = "https://youcontrol.com.ua/catalog/company_details/{edrpou}/"
+DIRECT_URL = True  # Одразу відкривати сторінку компанії; пошук — лише якщо це не сторінка компанії (404)
+PAGE_LOAD_TIMEOUT = 15  # Максимальне очікування готовності сторінки (секунди)
+COMPANY_PAGE_MARKER = "table.detail-view, h2.seo-table-name"  # Є лише на сторінці компанії
 
 
 # --- 1. Функції парсингу (без змін) ---
@@ -129,22 +135,53 @@ def load_cookies(driver):
 
 # --- 3. Функція пошуку та парсингу компанії ---
 
+def wait_page_ready(driver, timeout=PAGE_LOAD_TIMEOUT) -> bool:
+    """Чекає document.readyState == complete замість фіксованого time.sleep."""
+    try:
+        WebDriverWait(driver, timeout).until(lambda d: d.execute_script("return document.readyState") == "complete")
+        return True
+    except TimeoutException:
+        return False
+
+
+def is_company_page(driver) -> bool:
+    return bool(driver.execute_script("return !!document.querySelector(arguments[0])", COMPANY_PAGE_MARKER))
+
+
+def open_company_html(driver, edrpou: str):
+    """HTML сторінки компанії за прямим URL або None (404 / редирект) — тоді пошук."""
+    driver.get(COMPANY_URL.format(edrpou=edrpou))
+    if wait_page_ready(driver) and is_company_page(driver):
+        return driver.page_source
+    print(f"⚠️ {edrpou}: прямий URL не відкрив сторінку компанії, шукаємо через пошук")
+    return None
+
+
+def search_company_html(driver, edrpou: str) -> str:
+    """Пошук через поле на головній; чекає переходу на сторінку компанії."""
+    driver.get("https://youcontrol.com.ua/")
+    wait_page_ready(driver)
+
+    search_box = driver.find_element(By.CSS_SELECTOR, "input[placeholder*='Введіть назву компанії, ЄДРПОУ']")
+    search_box.clear()
+    search_box.send_keys(str(edrpou))
+    search_box.send_keys(Keys.ENTER)
+    try:
+        WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
+            lambda d: "/company_details/" in d.current_url or is_company_page(d))
+    except TimeoutException:
+        pass  # парсимо те, що відкрилось (як і раніше після паузи)
+    wait_page_ready(driver)
+    return driver.page_source
+
+
 def search_and_parse_company(driver, edrpou: str) -> dict:
-    """Шукає компанію за ЄДРПОУ та парсить дані."""
+    """Відкриває компанію за ЄДРПОУ (прямий URL, пошук як запасний варіант) та парсить дані."""
     try:
-        # Перехід на головну для пошуку
-        driver.get("https://youcontrol.com.ua/")
-        time.sleep(2)
-        
-        # Пошук компанії
-        search_box = driver.find_element(By.CSS_SELECTOR, "input[placeholder*='Введіть назву компанії, ЄДРПОУ']")
-        search_box.clear()
-        search_box.send_keys(str(edrpou))
-        search_box.send_keys(Keys.ENTER)
-        time.sleep(5)
-        
-        # Отримання HTML
-        html = driver.page_source
+        html = open_company_html(driver, edrpou) if DIRECT_URL else None
+        if html is None:
+            html = search_company_html(driver, edrpou)
+
         company_data = parse_company_youcontrol(html)
         company_data["EDRPOU_INPUT"] = edrpou
         company_data["parse_timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -1,18 +1,34 @@
 import sys
 import os
+import argparse
+import asyncio
 import json
 import time
 import random
 import logging
 import re
+import threading
 import bs4
-import pandas as pd
 import cloudscraper
-from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_cache import HtmlCache, HTML_CACHE_DIR
+from crawl_frontier import KvedFrontier, FRONTIER_DB, KVED_MEMBERSHIPS_CSV
+from kved_discovery import get_kved_tree, KVED_TREE_JSON, DISCOVERY_RETRY_ROUNDS
+from kved_output import KvedDatasetWriter, KVED_DATASET_DIR, KVED_BUFFER_ROWS
+from youcontrol_parser import parse_company_page, profile_dict_rows, beneficiary_dict_rows
 
 
 URL_BASE = "https://youcontrol.com.ua/catalog/kved/"
 CHECKPOINT_FILE = "checkpoint.json"
+ROTATE_EVERY = 80      # запитів на одну cloudscraper-сесію
+FLUSH_EVERY_PAGES = 5      # датасет + page_done після стількох сторінок ...
+FLUSH_EVERY_SECONDS = 60   # ... або стількох секунд — що настане раніше (вікно перекачування при падінні)
+DISCOVERY_CONCURRENCY = 4   # паралельних запитів при пошуку дерева КВЕД
+DISCOVERY_RATE = 1.5        # запитів/сек при пошуку дерева КВЕД
+HTML_CACHE = None      # HtmlCache: --cache зберігає кожну сторінку, --replay читає лише з нього
+REPLAY = False         # без мережі, пауз і чекпоінтів; датасет з префіксом OUTPUT_PREFIX
+OUTPUT_PREFIX = ""
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,11 +40,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-scraper = cloudscraper.create_scraper(
-    delay=10,
-    browser={'browser': 'chrome', 'platform': 'windows', 'mobile': False}
-)
-
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/122.0.0.0 Safari/537.36",
     "Mozilla/5.0 (Windows NT 10.0; Win64; rv:123.0) Gecko/20100101 Firefox/123.0",
@@ -37,11 +48,20 @@ USER_AGENTS = [
 ]
 
 
-REQUEST_COUNT = 0
-scraper = cloudscraper.create_scraper(
-    delay=10,
-    browser={'browser': 'chrome', 'platform': 'windows', 'mobile': False}
-)
+# requests.Session (і cloudscraper) не потокобезпечний: у кожного потоку (основний цикл,
+# потоки discovery) своя сесія і свій лічильник запитів для ротації
+_local = threading.local()
+
+
+def get_scraper():
+    """Cloudflare-сесія поточного потоку (створюється при першому запиті)."""
+    if getattr(_local, "scraper", None) is None:
+        _local.scraper = cloudscraper.create_scraper(
+            delay=10,
+            browser={'browser': 'chrome', 'platform': 'windows', 'mobile': False}
+        )
+        _local.requests = 0
+    return _local.scraper
 
 REFERERS = [
     "https://youcontrol.com.ua/catalog/",
@@ -76,6 +96,8 @@ def get_headers():
 
 def smart_sleep(base_min=1.5, base_max=3.5, jitter=0.8):
     """Коротка адаптивна пауза, з випадковістю та антидетектом."""
+    if REPLAY:
+        return
 
     delay = random.uniform(base_min, base_max) + random.uniform(0, jitter)
     logger.info(f"Sleeping {delay:.2f}s...")
@@ -83,7 +105,7 @@ def smart_sleep(base_min=1.5, base_max=3.5, jitter=0.8):
 
 
 def human_delay():
-    if random.random() < 0.2:
+    if not REPLAY and random.random() < 0.2:
         read_time = random.uniform(2, 6)
         logger.info(f"Emulating user reading for {read_time:.1f}s...")
         time.sleep(read_time)
@@ -91,28 +113,39 @@ def human_delay():
 
 
 
-def click_on_link(url, max_retries=6, long_wait=1800):
+def rotate_scraper(reason):
+    """Нова Cloudflare-сесія поточного потоку (замість перезапуску через os.execv)."""
+    logger.info(f"Rotating scraper fingerprint (new Cloudflare session): {reason}")
+    try:
+        get_scraper().close()
+    except Exception:
+        pass
+    _local.requests = 0
+    _local.scraper = cloudscraper.create_scraper(
+        delay=random.randint(8, 15),
+        browser={'browser': random.choice(['chrome', 'firefox']),
+                 'platform': random.choice(['windows', 'linux']),
+                 'mobile': random.choice([False, True])}
+    )
+
+
+def click_on_link(url, max_retries=6, long_wait=1800, as_text=False):
     """
     Cloudflare-safe запит із антидетектом та сесійною ротацією.
+    У режимі REPLAY сторінка береться з HTML_CACHE (немає в кеші — None).
+    as_text — сирий HTML (str) замість BeautifulSoup.
     """
-    global REQUEST_COUNT, scraper
+    if REPLAY:
+        body = HTML_CACHE.get(url)
+        if not body:
+            return None
+        return body.decode("utf-8", "replace") if as_text else bs4.BeautifulSoup(body, "lxml")
 
-    REQUEST_COUNT += 1
+    get_scraper()
+    _local.requests += 1
 
-    if REQUEST_COUNT % 100 == 0:
-        logger.info("Restarting process to refresh global state.")
-        save_checkpoint({"last_url": None})
-        os.execv(sys.executable, ['python'] + sys.argv)
-
-
-    if REQUEST_COUNT % 80 == 0:
-        logger.info("Rotating scraper fingerprint (new Cloudflare session)")
-        scraper = cloudscraper.create_scraper(
-            delay=random.randint(8, 15),
-            browser={'browser': random.choice(['chrome', 'firefox']),
-                     'platform': random.choice(['windows', 'linux']),
-                     'mobile': random.choice([False, True])}
-        )
+    if _local.requests % ROTATE_EVERY == 0:
+        rotate_scraper(f"{_local.requests} requests on this session")
         smart_sleep(3, 6)
 
     attempt = 0
@@ -121,11 +154,13 @@ def click_on_link(url, max_retries=6, long_wait=1800):
             logger.info(f"[{attempt + 1}] Fetching {url}")
             headers = get_headers()
 
-            resp = scraper.get(url, headers=headers, timeout=(10, 40))
+            resp = get_scraper().get(url, headers=headers, timeout=(10, 40))
 
             if resp.status_code == 200:
+                if HTML_CACHE is not None:
+                    HTML_CACHE.put(url, resp.content)
                 smart_sleep(1.0, 2.0)
-                return bs4.BeautifulSoup(resp.text, "lxml")
+                return resp.text if as_text else bs4.BeautifulSoup(resp.text, "lxml")
 
             elif resp.status_code in [429, 500, 502, 503, 504]:
                 delay = min(2 ** attempt + random.uniform(1, 3), 120)
@@ -135,13 +170,9 @@ def click_on_link(url, max_retries=6, long_wait=1800):
                 continue
 
             elif resp.status_code == 403:
-                logger.warning("Cloudflare block detected Rotating fingerprint and restarting process")
-                save_checkpoint({"last_url": None})
-                time.sleep(random.uniform(10, 20))
-                logger.info("Restarting process to refresh global state...")
-                os.execv(sys.executable, ['python'] + sys.argv)
-
-                time.sleep(random.uniform(15, 30))
+                logger.warning("Cloudflare block detected")
+                rotate_scraper("403")
+                time.sleep(min(random.uniform(10, 20) * (attempt + 1), 300))
                 attempt += 1
                 continue
 
@@ -161,7 +192,12 @@ def click_on_link(url, max_retries=6, long_wait=1800):
 
 
 def load_checkpoint():
-    """Читання JSON чекпоінта."""
+    """
+    Старий JSON чекпоінт (курсор {class_code, page, last_url, class_done} або {"last_url": ...}).
+    Тепер прогрес живе у фронтирі (crawl_frontier.py), чекпоінт читається лише для міграції.
+    """
+    if REPLAY:
+        return {}
     if os.path.exists(CHECKPOINT_FILE):
         with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
             try:
@@ -173,10 +209,19 @@ def load_checkpoint():
     return {}
 
 
-def save_checkpoint(data):
-    """Запис JSON чекпоінта."""
-    with open(CHECKPOINT_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def migrate_checkpoint(frontier):
+    """Позначає у фронтирі done усе, що старий чекпоінт вважав завершеним."""
+    checkpoint = load_checkpoint()
+    class_code = checkpoint.get("class_code")
+    if class_code:
+        if checkpoint.get("class_done"):
+            frontier.mark_done_before(class_code)
+        else:
+            # сторінка курсора записана не повністю — її переглядаємо ще раз
+            frontier.mark_done_before(class_code, (checkpoint.get("page") or 1) - 1)
+        logger.info(f"Migrated checkpoint {checkpoint} -> {frontier.stats()}")
+    if checkpoint:
+        os.replace(CHECKPOINT_FILE, CHECKPOINT_FILE + ".migrated")
 
 
 def clean_text(text):
@@ -185,32 +230,14 @@ def clean_text(text):
 
 
 def fetch_company_details(company_code, url_details, meta):
-    """Отримати дані компанії."""
-    html = click_on_link(url_details)
+    """Отримати дані компанії (таблиці профілю і бенефіціарів — один прохід lxml, youcontrol_parser.py)."""
+    html = click_on_link(url_details, as_text=True)
     if not html:
         return None
 
-    profile_dict = {}
-    block_profile = html.find("div", id="catalog-company-file")
-    if block_profile:
-        for row in block_profile.find_all("div", class_="seo-table-row"):
-            key = clean_text(row.find("div", class_="seo-table-col-1").text)
-            val_elem = row.find("span", class_="copy-file-field") or \
-                       row.find("div", class_="copy-file-field") or \
-                       row.find("p", class_="ucfirst copy-file-field") or \
-                       row.find("div", class_="seo-table-col-2")
-            if val_elem:
-                profile_dict[key] = clean_text(val_elem.text)
-
-    beneficiary_dict = {}
-    block_benef = html.find("div", id="catalog-company-beneficiary")
-    if block_benef:
-        for row in block_benef.find_all("div", class_="seo-table-row"):
-            key = clean_text(row.find("div", class_="seo-table-col-1").text)
-            val = row.find("span", class_="copy-file-field") or \
-                  row.find("div", class_="seo-table-col-2")
-            if val:
-                beneficiary_dict[key] = clean_text(val.text)
+    page = parse_company_page(html)
+    profile_dict = profile_dict_rows(page.profile)
+    beneficiary_dict = beneficiary_dict_rows(page.beneficiary)
 
     row = {
         **meta,
@@ -221,143 +248,158 @@ def fetch_company_details(company_code, url_details, meta):
     return row
 
 
-def parse_all_kved():
-    """Основна функція парсингу."""
-    checkpoint = load_checkpoint()
-    last_url = checkpoint.get("last_url")
-
-    html_sections = click_on_link(URL_BASE)
-    if not html_sections:
-        logger.error("Cannot fetch main catalog page.")
-        return
-
-    section_blocks = html_sections.find_all("div", class_="kved-catalog-table")
-    for section_block in section_blocks:
-        section_code = section_block.find("td", class_="green-col-word").text.strip()
-        section_name = section_block.find("td", class_="caps-col").text.strip()
-
-        chapter_tds = section_block.find_all("td", class_="green-col-num")
-        for chapter_td in chapter_tds:
-            chapter_code = chapter_td.text.strip()
-            chapter_name = chapter_td.find_next_sibling("td").text.strip()
-            url_chapter = URL_BASE + chapter_code
+def seed_frontier(frontier):
+    """
+    Дерево КВЕД (kved_tree.json, поки свіже, інакше паралельне discovery) -> фронтир.
+    click_on_link блокуючий, тож discovery ганяє його в потоках під бюджетом kved_discovery;
+    кожен потік має власну cloudscraper-сесію (get_scraper), ротація не чіпає чужі.
+    """
+    async def fetch(url):
+        return await asyncio.to_thread(click_on_link, url)
+
+    tree = asyncio.run(get_kved_tree(
+        fetch, path=None if REPLAY else KVED_TREE_JSON, refresh=REPLAY,
+        concurrency=DISCOVERY_CONCURRENCY, rate=DISCOVERY_RATE, url_base=URL_BASE,
+        retry_rounds=0 if REPLAY else DISCOVERY_RETRY_ROUNDS,   # у кеші сторінка від повтору не з'явиться
+    ))
+    if tree is None:
+        return False
+    for c in tree["classes"]:
+        frontier.add_class(c["class_code"], c["url_class"], c["max_page"], c["meta"])
+    if tree["complete"]:
+        frontier.mark_discovered()
+    else:
+        # знайдені класи вже у фронтирі; пропущені додасть повторне discovery наступного проходу
+        logger.warning(f"KVED tree incomplete, frontier not marked discovered: {tree.get('missing')}")
+    return True
 
-            html_chapter = click_on_link(url_chapter)
-            if not html_chapter:
-                continue
 
-            table = html_chapter.find("table")
-            if not table:
+def parse_all_kved():
+    """
+    Основна функція парсингу. Дерево КВЕД і незавершені (клас, сторінка) живуть
+    у фронтирі, тож перезапуск одразу продовжує з першої pending-сторінки.
+    Рядки йдуть у партиціонований датасет (kved_output.py); сторінка стає done
+    лише після flush-у writer-а: кожні FLUSH_EVERY_PAGES сторінок або FLUSH_EVERY_SECONDS
+    секунд (і не більше KVED_BUFFER_ROWS рядків у буфері), тож падіння коштує кількох сторінок.
+    Кожен flush — row group у відкритому part-файлі класу; файл закривається після класу.
+    Компанія з кількох класів качається один раз (frontier.claim), інші класи —
+    у kved_memberships.csv.
+    """
+    frontier = KvedFrontier(":memory:" if REPLAY else FRONTIER_DB)
+    writer = KvedDatasetWriter(OUTPUT_PREFIX + KVED_DATASET_DIR, max_buffer_rows=KVED_BUFFER_ROWS)
+    unsaved = []        # [(class_code, page, urls)] — оброблені сторінки, рядки яких ще в буфері
+    last_commit = time.monotonic()
+
+    def commit():
+        nonlocal last_commit
+        last_commit = time.monotonic()
+        n = writer.buffered()
+        writer.flush()
+        for cc, pg, urls in unsaved:
+            frontier.page_done(cc, pg, urls)
+        if n or unsaved:
+            logger.info(f"Saved {n} rows ({len(unsaved)} pages) → {writer.root}")
+        unsaved.clear()
+
+    try:
+        if not frontier.is_discovered():
+            if not seed_frontier(frontier):
+                return
+            migrate_checkpoint(frontier)
+        logger.info(f"Frontier: {frontier.stats()}")
+
+        current_class = None
+        fetched = 0
+
+        for class_code, page, url_class, max_page, meta_class in frontier.pending_pages():
+            if class_code != current_class:
+                if current_class:
+                    commit()
+                    writer.close()
+                    logger.info(f"Completed class {current_class}")
+                    smart_sleep(15, 25)
+                current_class = class_code
+                logger.info(f"Parsing class {class_code} from page {page}, {max_page} pages total.")
+
+            url_page = f"{url_class}?page={page}"
+            html_page = click_on_link(url_page)
+            if not html_page:
+                # лишається pending — підхопиться наступним проходом
                 continue
 
-            rows = table.find_all("tr")
-            current_group_code, current_group_name = None, None
-
-            for row in rows:
-                group_code_td = row.find("td", class_="green-col-word")
-                if group_code_td:
-                    current_group_code = group_code_td.text.strip()
-                    current_group_name = row.find("td", class_="caps-col").text.strip()
-                    continue
-
-                class_code_td = row.find("td", class_="green-col-num")
-                if not (class_code_td and current_group_code):
+            rows, urls = [], []
+            companies = html_page.find_all("a", class_="link-details link-open")
+            for comp in companies:
+                company_code = comp.text.split(",")[0].strip()
+                url_details = "https://youcontrol.com.ua" + comp.get("href")
+                if not frontier.claim(url_details, class_code, page, company_code):
                     continue
 
-                class_code = class_code_td.text.strip()
-                class_name = class_code_td.find_next_sibling("td").text.strip()
-                url_class = url_chapter + f'/{class_code[-2:]}'
-
-                html_class = click_on_link(url_class)
-                if not html_class:
-                    continue
-
-                pagination = html_class.find("ul", class_="pagination")
-                max_page = 1
-                pagination = html_class.find("ul", class_="pagination")
-                if pagination:
-                    page_numbers = [
-                        int(a.text) for a in pagination.find_all("a") if a.text.isdigit()
-                    ]
-                    if page_numbers:
-                        max_page = max(page_numbers)
-                    else:
-                        max_page = 1
-
-
-                logger.info(f"Parsing class {class_code}, {max_page} pages total.")
-                time.sleep(1.4)
-
-                batch = []
-                records_since_last_save = 0
-
-                for page in range(1, max_page + 1):
-                    url_page = f"{url_class}?page={page}"
-                    html_page = click_on_link(url_page)
-                    if not html_page:
-                        continue
-
-                    companies = html_page.find_all("a", class_="link-details link-open")
-                    for idx, comp in enumerate(companies):
-                        company_code = comp.text.split(",")[0].strip()
-                        url_details = "https://youcontrol.com.ua" + comp.get("href")
-
-                        if last_url:
-                            if url_details == last_url:
-                                logger.info(f"Resuming from {url_details}")
-                                last_url = None
-                            else:
-                                continue
-
-                        meta = {
-                            "SECTION_CODE": section_code,
-                            "SECTION_NAME": section_name,
-                            "CHAPTER_CODE": chapter_code,
-                            "CHAPTER_NAME": chapter_name,
-                            "GROUP_CODE": current_group_code,
-                            "GROUP_NAME": current_group_name,
-                            "CLASS_CODE": class_code,
-                            "CLASS_NAME": class_name,
-                            "PAGE": page
-                        }
-
-                        data = fetch_company_details(company_code, url_details, meta)
-                        if data:
-                            batch.append(data)
-                            records_since_last_save += 1
-                            human_delay()
-
-                            if records_since_last_save >= 5:
-                                df = pd.DataFrame(batch)
-                                file_name = f"kved_{class_code}_batch_{uuid4().hex[:6]}.csv"
-                                df.to_csv(file_name, index=False)
-                                logger.info(f"Saved {len(batch)} rows → {file_name}")
-                                save_checkpoint({"last_url": url_details})
-                                batch.clear()
-                                records_since_last_save = 0
-                                smart_sleep(20, 40)
-
-                        smart_sleep(3, 8)
-
-                if batch:
-                    df = pd.DataFrame(batch)
-                    file_name = f"kved_{class_code}_final_{uuid4().hex[:6]}.csv"
-                    df.to_csv(file_name, index=False)
-                    logger.info(f"Saved remaining {len(batch)} rows → {file_name}")
-
-
-
-
-                    smart_sleep(6, 10)
-
-                save_checkpoint({"last_url": None})
-                logger.info(f"Completed class {class_code}")
-                smart_sleep(15, 25)
-
-    logger.info("Completed parsing all KVEDs.")
+                meta = {**meta_class, "PAGE": page}
+                data = fetch_company_details(company_code, url_details, meta)
+                if data:
+                    rows.append(data)
+                    urls.append(url_details)
+                    fetched += 1
+                    human_delay()
+                    if fetched % 5 == 0:
+                        smart_sleep(20, 40)
+                else:
+                    frontier.release(url_details)
+
+                smart_sleep(3, 8)
+
+            # writer сам скидає буфер класу на KVED_BUFFER_ROWS — тоді одразу фіксуємо й сторінки
+            flushed = writer.write(rows)
+            unsaved.append((class_code, page, urls))
+            if (flushed or len(unsaved) >= FLUSH_EVERY_PAGES
+                    or time.monotonic() - last_commit >= FLUSH_EVERY_SECONDS):
+                commit()
+
+        commit()
+        if current_class:
+            logger.info(f"Completed class {current_class}")
+        stats = frontier.stats()
+        if stats["pages_done"] == stats["pages_total"] and stats["discovered"]:
+            # повний прохід завершено — наступний запуск починає каталог заново
+            n = frontier.export_memberships(OUTPUT_PREFIX + KVED_MEMBERSHIPS_CSV)
+            logger.info(f"{n} extra KVED memberships → {OUTPUT_PREFIX + KVED_MEMBERSHIPS_CSV}")
+            frontier.reset()
+            logger.info("Completed parsing all KVEDs.")
+        elif not stats["discovered"]:
+            logger.info(f"Pass finished, KVED tree incomplete — discovery re-runs next pass: {stats}")
+        else:
+            logger.info(f"Pass finished with unfinished pages: {stats}")
+    finally:
+        # повністю оброблені сторінки не губимо й при падінні
+        try:
+            commit()
+            writer.close()
+        except Exception as e:
+            logger.error(f"Final flush failed: {e}")
+        frontier.close()
 
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="YouControl KVED catalog parser")
+    ap.add_argument("--cache", nargs="?", const=HTML_CACHE_DIR, default=None,
+                    help="зберігати кожну завантажену сторінку в спільний HTML-кеш")
+    ap.add_argument("--replay", nargs="?", const=HTML_CACHE_DIR, default=None,
+                    help="без мережі: пройти каталог по HTML-кешу і перепарсити всі компанії")
+    args = ap.parse_args()
+
+    if args.replay:
+        HTML_CACHE = HtmlCache(args.replay)
+        REPLAY = True
+        OUTPUT_PREFIX = "replay_"
+        logger.info(f"Replay from {args.replay}: {HTML_CACHE.stats()}")
+        parse_all_kved()
+        HTML_CACHE.close()
+        sys.exit(0)
+
+    if args.cache:
+        HTML_CACHE = HtmlCache(args.cache)
+
     while True:
         try:
             parse_all_kved()
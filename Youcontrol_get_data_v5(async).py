@@ -11,23 +11,60 @@ import io
 import os
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
+from crawl_frontier import KvedFrontier, FRONTIER_DB, KVED_MEMBERSHIPS_CSV
+from kved_discovery import get_kved_tree
+from youcontrol_http import YouControlHttp, HTTPX_AVAILABLE, PROXY_KEY
+from youcontrol_parser import parse_company_page, header_edrpou, profile_dict_zip, beneficiary_dict_zip
 
 # === Асинхронна конфігурація ===
-executor = ThreadPoolExecutor(max_workers=8)
-semaphore = asyncio.Semaphore(5)
-    
-async def fetch_async(url):
-    """Асинхронне виконання click_on_link через ThreadPool."""
-    loop = asyncio.get_event_loop()  # Замість get_running_loop()
+FETCH_CONCURRENCY = 5                  # одночасних запитів (список + деталі разом)
+DETAIL_WORKERS = 8                     # корутин, що тягнуть деталі з черги
+DETAIL_QUEUE_SIZE = DETAIL_WORKERS * 4 # backpressure: продюсер не тікає далеко вперед
+WRITE_BATCH_ROWS = 100                 # рядків у буфері writer-а до запису на диск
+WRITE_FLUSH_SECONDS = 120              # або не рідше ніж раз на стільки секунд
+THROUGHPUT_REPORT_EVERY = 60           # сек, як часто логувати requests/s
+
+executor = ThreadPoolExecutor(max_workers=8)   # лише фолбек без httpx
+semaphore = None       # створюється в init_async() всередині запущеного loop-а
+http = None            # YouControlHttp: один async-клієнт на прохід (youcontrol_http.py)
+PROXY_FILE = None      # файл проксі 'host:port [cap]' (proxy_pool.py); None — напряму
+REQUEST_COUNT = 0
+
+
+def init_async():
+    """Семафор і httpx-клієнт прив'язані до loop-а: кожен asyncio.run() отримує нові."""
+    global semaphore, http
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    http = YouControlHttp(URL_BASE, proxy_file=PROXY_FILE) if HTTPX_AVAILABLE else None
+
+
+async def close_async():
+    global http
+    if http is not None:
+        logger.info(f"HTTP: {http.stats()}")
+        await http.aclose()
+        http = None
+
+
+async def fetch_async(url, as_text=False):
+    """Запит під семафором: нативний async-клієнт, без httpx — click_on_link через ThreadPool."""
+    global REQUEST_COUNT
+    loop = asyncio.get_running_loop()
     async with semaphore:
         await asyncio.sleep(random.uniform(1.0, 2.5))
-        return await loop.run_in_executor(executor, click_on_link, url)  # Передайте url як аргумент
+        REQUEST_COUNT += 1
+        if http is not None:
+            return await click_on_link_async(url, as_text=as_text)
+        return await loop.run_in_executor(executor, lambda: click_on_link(url, as_text=as_text))
 
 
 
 # === Налаштування ===
 TARGET_CLASS_CODE = "01.11"
 TARGET_PAGES = None
+CHECKPOINT_FILE = "checkpoint.txt"     # старий формат, лише для міграції у фронтир
+DISCOVERY_CONCURRENCY = 5              # паралельних запитів при пошуку дерева КВЕД
+DISCOVERY_RATE = 2.0                   # запитів/сек при пошуку дерева КВЕД
 
 logging.basicConfig(
     level=logging.INFO,
@@ -80,8 +117,8 @@ def get_headers():
 def smart_sleep(base_min=3, base_max=7):
     time.sleep(random.uniform(base_min, base_max))
 
-def click_on_link(url, max_retries=5, long_wait=1800):
-    """Cloudflare-safe request"""
+def click_on_link(url, max_retries=5, long_wait=1800, as_text=False):
+    """Cloudflare-safe request; as_text — сирий HTML замість BeautifulSoup"""
     attempt = 0
     while True:
         try:
@@ -90,7 +127,7 @@ def click_on_link(url, max_retries=5, long_wait=1800):
             
             if resp.status_code == 200:
                 html = resp.text
-                return bs4.BeautifulSoup(html, "lxml")
+                return html if as_text else bs4.BeautifulSoup(html, "lxml")
 
             elif resp.status_code in [429, 500, 502, 503, 504]:
                 delay = 2 ** attempt + random.uniform(1, 3)
@@ -114,6 +151,37 @@ def click_on_link(url, max_retries=5, long_wait=1800):
                 attempt = 0
 
 
+async def click_on_link_async(url, max_retries=5, long_wait=1800, as_text=False):
+    """click_on_link на спільному async-клієнті (youcontrol_http): ті самі повтори, паузи — asyncio.sleep."""
+    attempt = 0
+    while True:
+        logger.info(f"[{attempt+1}] Fetching {url}")
+        status, text = await http.get(url, headers=get_headers())
+
+        if status == 200:
+            return text if as_text else bs4.BeautifulSoup(text, "lxml")
+
+        elif status in [429, 500, 502, 503, 504]:
+            delay = 2 ** attempt + random.uniform(1, 3)
+            logger.warning(f"Server error {status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        elif status is None:
+            logger.warning("Network error, waiting 1 min...")
+            await asyncio.sleep(60)
+            attempt += 1
+            if attempt >= max_retries:
+                logger.error(f"Server unreachable. Waiting {long_wait/60:.0f} minutes.")
+                await asyncio.sleep(long_wait)
+                attempt = 0
+
+        else:
+            logger.error(f"Unexpected HTTP {status}, waiting 5 min")
+            await asyncio.sleep(300)
+            attempt = 0
+
+
 def clean_text(text):
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
@@ -122,50 +190,14 @@ def clean_text(text):
 async def fetch_company_details(company_code, url_details, section_code, section_name,
                                 chapter_code, chapter_name, current_group_code,
                                 current_group_name, class_code, class_name):
-    html_details = await fetch_async(url_details)
+    html_details = await fetch_async(url_details, as_text=True)
     if not html_details:
         return None
 
-    # === Profile block ===
-    block_profile = html_details.find("div", class_="seo-table-contain", id="catalog-company-file")
-    profile_dict = {}
-    if block_profile:
-        profile_rows = block_profile.find_all("div", class_="seo-table-row")
-        profile_data_columns = [r.find("div", class_="seo-table-col-1").text.strip() for r in profile_rows]
-        raw_data = [
-            (r.find("span", class_="copy-file-field") or
-             r.find("div", class_="copy-file-field") or
-             r.find("p", class_="ucfirst copy-file-field") or
-             r.find("div", class_="seo-table-col-2")).text
-            for r in profile_rows
-            if (r.find("span", class_="copy-file-field") or
-                r.find("div", class_="copy-file-field") or
-                r.find("p", class_="ucfirst copy-file-field") or
-                r.find("div", class_="seo-table-col-2"))
-        ]
-        profile_data_text = [clean_text(x) for x in raw_data if x.strip()]
-        profile_dict = dict(zip(profile_data_columns, profile_data_text))
-
-    # === Beneficiary block ===
-    block_beneficiary = html_details.find("div", class_="seo-table-contain", id="catalog-company-beneficiary")
-    data_beneficiary_dict = {}
-    if block_beneficiary:
-        beneficiary_rows = block_beneficiary.find_all("div", class_="seo-table-row")
-        beneficiary_data_columns = [r.find("div", class_="seo-table-col-1").text.strip() for r in beneficiary_rows]
-        raw_edrpou = html_details.find("h2", class_="seo-table-name case-icon short").text
-        edrpou = re.search(r'\d+', raw_edrpou).group() if re.search(r'\d+', raw_edrpou) else None
-        beneficiary_data_columns.append("EDRPOU_CODE")
-        text_beneficiary_spans = [r.find("span", class_="copy-file-field") for r in beneficiary_rows]
-        text_beneficiary_persons = [
-            r.find("div", class_="seo-table-col-2")
-            if r.find("div", class_="seo-table-col-2") and 'copy-hover' not in r.find("div", class_="seo-table-col-2").get("class", [])
-            else None for r in beneficiary_rows
-        ]
-        text_beneficiary_spans = [x for x in text_beneficiary_spans if x]
-        text_beneficiary_persons = [x for x in text_beneficiary_persons if x]
-        data_beneficiary = text_beneficiary_spans + text_beneficiary_persons
-        data_beneficiary_text = [clean_text(x.text) for x in data_beneficiary] + [edrpou]
-        data_beneficiary_dict = dict(zip(beneficiary_data_columns, data_beneficiary_text))
+    # === Profile + beneficiary blocks: один прохід lxml (youcontrol_parser.py) ===
+    page = parse_company_page(html_details)
+    profile_dict = profile_dict_zip(page.profile)
+    data_beneficiary_dict = beneficiary_dict_zip(page.beneficiary, header_edrpou(page))
 
     row_data = {
         "SECTION_CODE": section_code,
@@ -184,146 +216,217 @@ async def fetch_company_details(company_code, url_details, section_code, section
 
 
 # === Основна логіка ===
-async def parse_all_kved():
-    logger.info("Starting KVED parsing")
-
-    # === Завантаження checkpoint ===
-    last_completed = None
-    checkpoint_class, checkpoint_page = None, None
-    if os.path.exists("checkpoint.txt"):
-        with open("checkpoint.txt") as f:
-            line = f.read().strip()
-            if "|" in line:
-                checkpoint_class, checkpoint_page = line.split("|")
-                checkpoint_page = int(checkpoint_page)
-            else:
-                last_completed = line
-        logger.info(f"Checkpoint found: {line}")
-
-    html_sections = await fetch_async(URL_BASE)
-    if not html_sections:
-        logger.error("Cannot fetch main KVED catalog page.")
+def migrate_checkpoint(frontier):
+    """Старий checkpoint.txt ("клас" або "клас|сторінка") -> done у фронтирі."""
+    if not os.path.exists(CHECKPOINT_FILE):
         return
+    with open(CHECKPOINT_FILE) as f:
+        line = f.read().strip()
+    if "|" in line:
+        class_code, page = line.split("|")
+        frontier.mark_done_before(class_code, int(page))
+    elif line:
+        frontier.mark_done_before(line)
+    logger.info(f"Migrated checkpoint {line} -> {frontier.stats()}")
+    os.replace(CHECKPOINT_FILE, CHECKPOINT_FILE + ".migrated")
+
+
+async def seed_frontier(frontier):
+    """Дерево КВЕД (kved_tree.json, поки свіже, інакше паралельне discovery) -> фронтир."""
+    tree = await get_kved_tree(fetch_async, concurrency=DISCOVERY_CONCURRENCY, rate=DISCOVERY_RATE,
+                               url_base=URL_BASE)
+    if tree is None:
+        return False
+    for c in tree["classes"]:
+        frontier.add_class(c["class_code"], c["url_class"], c["max_page"], c["meta"], pages=TARGET_PAGES)
+    if tree["complete"]:
+        frontier.mark_discovered()
+    else:
+        # знайдені класи вже у фронтирі; пропущені додасть повторне discovery наступного проходу
+        logger.warning(f"KVED tree incomplete, frontier not marked discovered: {tree.get('missing')}")
+    return True
+
+
+async def producer(frontier, detail_queue, write_queue, pages_state):
+    """
+    Йде по pending-сторінках фронтиру і кладе в detail_queue кожну компанію, яку ще не
+    записано і не взято в роботу з іншого класу (frontier.claim).
+    """
+    current_class = None
+    for class_code, page, url_class, max_page, meta in frontier.pending_pages():
+        if class_code != current_class:
+            current_class = class_code
+            logger.info(f"Parsing {max_page} pages for class {class_code}, from page {page}")
+
+        html_page = await fetch_async(f"{url_class}?page={page}")
+        if not html_page:
+            continue
+
+        jobs = []
+        for raw_edrpou in html_page.find_all("a", class_="link-details link-open"):
+            company_code = raw_edrpou.text.split(",")[0].strip()
+            url_details = f"https://youcontrol.com.ua{raw_edrpou.get('href')}"
+            if frontier.claim(url_details, class_code, page, company_code):
+                jobs.append((company_code, url_details))
+
+        pages_state[(class_code, page)] = {"outstanding": len(jobs), "failed": False}
+        if not jobs:
+            # порожня або вже збережена сторінка — writer одразу позначить її done
+            await write_queue.put(("page", class_code, page, None, None))
+        for company_code, url_details in jobs:
+            await detail_queue.put((class_code, page, meta, company_code, url_details))
+
+
+async def detail_worker(detail_queue, write_queue, worker_id=0):
+    PROXY_KEY.set(f"detail-{worker_id}")   # воркер тримається свого проксі, поки той здоровий
+    while True:
+        job = await detail_queue.get()
+        if job is None:
+            return
+        class_code, page, meta, company_code, url_details = job
+        try:
+            row = await fetch_company_details(
+                company_code, url_details,
+                meta["SECTION_CODE"], meta["SECTION_NAME"],
+                meta["CHAPTER_CODE"], meta["CHAPTER_NAME"],
+                meta["GROUP_CODE"], meta["GROUP_NAME"],
+                class_code, meta["CLASS_NAME"]
+            )
+        except Exception as e:
+            logger.warning(f"Error parsing {url_details}: {e}")
+            await write_queue.put(("failed", class_code, page, url_details, None))
+            continue
+        await write_queue.put(("row", class_code, page, url_details, row))
+
+
+async def writer(frontier, write_queue, pages_state):
+    """
+    Єдиний, хто пише CSV і фронтир. Рядки буферизуються по класах; після запису
+    URL-и -> companies фронтиру, а сторінки, всі компанії яких вже оброблені, -> done.
+    """
+    buffers = {}            # class_code -> [(page, url, row)]
+    completed = []          # [(class_code, page)] — оброблені, чекають запису
+    buffered = 0
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal buffered, last_flush
+        for class_code, items in buffers.items():
+            rows = [row for _, _, row in items if row]
+            if rows:
+                file_path = f"kved_{class_code}_p{items[-1][0]}_{uuid4().hex[:6]}.csv"
+                pd.DataFrame(rows).to_csv(file_path, index=False)
+                logger.info(f"Saved {len(rows)} rows → {file_path}")
+            by_page = {}
+            for page, url, row in items:
+                if row:
+                    by_page.setdefault(page, []).append(url)
+            for page, urls in by_page.items():
+                frontier.mark_fetched(urls, class_code, page)
+        for class_code, page in completed:
+            frontier.page_done(class_code, page)
+            pages_state.pop((class_code, page), None)
+        buffers.clear()
+        completed.clear()
+        buffered = 0
+        last_flush = time.monotonic()
 
-    section_blocks = html_sections.find_all("div", class_="kved-catalog-table")
-    logger.info(f"Found {len(section_blocks)} section blocks")
-
-    for section_block in section_blocks:
-        section_code = section_block.find("td", class_="green-col-word").text.strip()
-        section_name = section_block.find("td", class_="caps-col").text.strip()
-
-        chapter_tds = section_block.find_all("td", class_="green-col-num")
-        for chapter_td in chapter_tds:
-            chapter_code = chapter_td.text.strip()
-            chapter_name = chapter_td.find_next_sibling("td").text.strip()
-
-            url_chapter = URL_BASE + chapter_code
-            html_chapter = await fetch_async(url_chapter)
-            if not html_chapter:
-                continue
+    while True:
+        try:
+            item = await asyncio.wait_for(write_queue.get(), timeout=WRITE_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            item = "tick"
+        if item is None:
+            flush()
+            return
+        if item != "tick":
+            kind, class_code, page, url, row = item
+            state = pages_state[(class_code, page)]
+            if kind == "row":
+                buffers.setdefault(class_code, []).append((page, url, row))
+                buffered += 1
+                state["outstanding"] -= 1
+                if not row:
+                    # компанія не скачалась/не розпарсилась — сторінка лишається pending
+                    state["failed"] = True
+                    frontier.release(url)
+            elif kind == "failed":
+                state["outstanding"] -= 1
+                state["failed"] = True
+                frontier.release(url)
+            if state["outstanding"] <= 0:
+                if state["failed"]:
+                    # успішні рядки стануть companies, сама сторінка лишиться pending до наступного проходу
+                    pages_state.pop((class_code, page), None)
+                else:
+                    completed.append((class_code, page))
+        if buffered >= WRITE_BATCH_ROWS or (
+            (buffered or completed) and time.monotonic() - last_flush >= WRITE_FLUSH_SECONDS
+        ):
+            flush()
+
+
+async def report_throughput(detail_queue, write_queue):
+    last = REQUEST_COUNT
+    while True:
+        await asyncio.sleep(THROUGHPUT_REPORT_EVERY)
+        rate = (REQUEST_COUNT - last) / THROUGHPUT_REPORT_EVERY
+        last = REQUEST_COUNT
+        logger.info(f"Throughput: {rate:.2f} requests/s, total {REQUEST_COUNT}, "
+                    f"detail queue {detail_queue.qsize()}, write queue {write_queue.qsize()}")
 
-            table = html_chapter.find("table")
-            if not table:
-                continue
 
-            rows = table.find_all("tr")
-            current_group_code, current_group_name = None, None
-
-            for row in rows:
-                group_code_td = row.find("td", class_="green-col-word")
-                if group_code_td:
-                    current_group_code = group_code_td.text.strip()
-                    current_group_name = row.find("td", class_="caps-col").text.strip()
-                    continue
-
-                class_code_td = row.find("td", class_="green-col-num")
-                if not (class_code_td and current_group_code):
-                    continue
-
-                class_code = class_code_td.text.strip()
-                if last_completed:
-                    if class_code == last_completed:
-                        last_completed = None
-                        continue
-                    elif last_completed is not None:
-                        continue
-
-                class_name = class_code_td.find_next_sibling("td").text.strip()
-                url_class = url_chapter + f'/{class_code[-2:]}'
-                html_class = await fetch_async(url_class)
-                if not html_class:
-                    continue
-
-                # === Визначаємо кількість сторінок ===
-                pagination = html_class.find("ul", class_="pagination")
-                max_page = 1
-                if pagination:
-                    for li in pagination.find_all("li"):
-                        a = li.find("a")
-                        if a and a.text.isdigit():
-                            max_page = max(max_page, int(a.text))
-
-                pages_to_parse = TARGET_PAGES if TARGET_PAGES else range(1, max_page + 1)
-                logger.info(f"Parsing {max_page} pages for class {class_code}")
-
-                # === Акумулюємо дані та зберігаємо кожні 10 сторінок або останню ===
-                all_batches = []
-                start_page = 1
-
-                # Якщо є checkpoint для цього класу — продовжуємо з потрібної сторінки
-                if checkpoint_class == class_code and checkpoint_page:
-                    start_page = checkpoint_page + 1
-                    logger.info(f"⏩ Resuming class {class_code} from page {start_page}")
-
-                for page in range(start_page, max_page + 1):
-                    url_page = f"{url_class}?page={page}"
-                    html_page = await fetch_async(url_page)
-                    if not html_page:
-                        continue
-
-                    raw_edrpous = html_page.find_all("a", class_="link-details link-open")
-                    if not raw_edrpous:
-                        continue
-
-                    # === Асинхронна обробка компаній ===
-                    tasks = []
-                    for raw_edrpou in raw_edrpous:
-                        company_code = raw_edrpou.text.split(",")[0].strip()
-                        url_details = f"https://youcontrol.com.ua{raw_edrpou.get('href')}"
-                        tasks.append(fetch_company_details(
-                            company_code, url_details,
-                            section_code, section_name,
-                            chapter_code, chapter_name,
-                            current_group_code, current_group_name,
-                            class_code, class_name
-                        ))
-
-                    results = await asyncio.gather(*tasks)
-                    batch_data = [r for r in results if r]
-                    if batch_data:
-                        all_batches.extend(batch_data)
-                        logger.info(f"Parsed page {page} of {class_code} (buffer {len(all_batches)} records)")
-
-                    # === Зберігаємо кожні 10 сторінок або останню ===
-                    if page % 10 == 0 or page == max_page:
-                        df_partial = pd.DataFrame(all_batches)
-                        file_path = f"kved_{class_code}_p{page}.csv"
-                        df_partial.to_csv(file_path, index=False)
-                        logger.info(f"Saved cumulative data up to page {page} ({len(all_batches)} rows) → {file_path}")
-                        all_batches = []  # очищаємо буфер
-
-                        with open("checkpoint.txt", "w") as f:
-                            f.write(f"{class_code}|{page}")
-
-                        await asyncio.sleep(random.uniform(7, 17))
-
-                # Після завершення класу оновлюємо checkpoint, щоб перейти до наступного
-                with open("checkpoint.txt", "w") as f:
-                    f.write(class_code)
-                logger.info(f"Completed class {class_code}")
-                await asyncio.sleep(random.uniform(15, 20))
-
-    logger.info("Completed parsing all KVEDs.")
+async def parse_all_kved():
+    """
+    Потоковий конвеєр: producer (сторінки списку) -> DETAIL_WORKERS (деталі) -> writer (CSV + фронтир).
+    Черги обмежені, тож N запитів деталей у польоті постійно, незалежно від меж сторінок.
+    """
+    logger.info("Starting KVED parsing")
+    init_async()
+    frontier = KvedFrontier(FRONTIER_DB)
+    try:
+        if not frontier.is_discovered():
+            if not await seed_frontier(frontier):
+                return
+            migrate_checkpoint(frontier)
+        logger.info(f"Frontier: {frontier.stats()}")
+
+        detail_queue = asyncio.Queue(maxsize=DETAIL_QUEUE_SIZE)
+        write_queue = asyncio.Queue(maxsize=DETAIL_QUEUE_SIZE)
+        pages_state = {}    # (class_code, page) -> {"outstanding": n, "failed": bool}
+
+        reporter = asyncio.create_task(report_throughput(detail_queue, write_queue))
+        writer_task = asyncio.create_task(writer(frontier, write_queue, pages_state))
+        workers = [asyncio.create_task(detail_worker(detail_queue, write_queue, i)) for i in range(DETAIL_WORKERS)]
+        t0 = time.monotonic()
+        try:
+            await producer(frontier, detail_queue, write_queue, pages_state)
+            for _ in workers:
+                await detail_queue.put(None)
+            await asyncio.gather(*workers)
+            await write_queue.put(None)
+            await writer_task
+        finally:
+            reporter.cancel()
+            for t in workers + [writer_task]:
+                t.cancel()
+        elapsed = time.monotonic() - t0
+        logger.info(f"Throughput total: {REQUEST_COUNT} requests, {REQUEST_COUNT / max(elapsed, 1e-9):.2f} requests/s")
+
+        stats = frontier.stats()
+        if stats["pages_done"] == stats["pages_total"] and stats["discovered"]:
+            # повний прохід завершено — наступний запуск починає каталог заново
+            n = frontier.export_memberships(KVED_MEMBERSHIPS_CSV)
+            logger.info(f"{n} extra KVED memberships → {KVED_MEMBERSHIPS_CSV}")
+            frontier.reset()
+            logger.info("Completed parsing all KVEDs.")
+        elif not stats["discovered"]:
+            logger.info(f"Pass finished, KVED tree incomplete — discovery re-runs next pass: {stats}")
+        else:
+            logger.info(f"Pass finished with unfinished pages: {stats}")
+    finally:
+        frontier.close()
+        await close_async()
 
 if __name__ == "__main__":
     while True:
@@ -2,14 +2,22 @@
 import os, sys, re, json, time, random, logging, asyncio
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlsplit
 import bs4
 import pandas as pd
 import cloudscraper
 
+from crawl_frontier import KvedFrontier, KVED_MEMBERSHIPS_CSV
+from kved_discovery import RateBudget
+from youcontrol_http import YouControlHttp, HTTPX_AVAILABLE, PROXY_KEY
+from youcontrol_parser import (CompanyPage, parse_company_page, header_edrpou,
+                               profile_dict_zip, beneficiary_dict_zip)
+
 # ---------- CONFIG ----------
 URL_BASE = "https://youcontrol.com.ua/catalog/kved/"
 OUT_DIR = "out"
 CHECKPOINT_FILE = "checkpoint.json"
+COMPANIES_DB = os.path.join(OUT_DIR, "kved_companies.sqlite")   # глобальний seen-set компаній
 ERROR_LOG = "youcontrol_errors.log"
 INFO_LOG  = "youcontrol_info.log"
 
@@ -18,12 +26,18 @@ LIST_CONCURRENCY = 6           # скільки сторінок класів к
 DETAILS_WORKERS  = 12          # скільки воркерів парсити деталі (через ThreadPool)
 QUEUE_MAXSIZE    = 200         # скільки компаній максимум у черзі
 
-# Антибан
-SLEEP_LIST_MIN,   SLEEP_LIST_MAX   = 0.8, 2.0
-SLEEP_DETAIL_MIN, SLEEP_DETAIL_MAX = 0.3, 1.0
+# Антибан: token bucket на хост, окремо для сторінок каталогу і деталей (запитів/сек, сплеск)
+LIST_RATE,   LIST_BURST   = 0.7, 2
+DETAIL_RATE, DETAIL_BURST = 4.0, 4
 
 MAX_RETRIES = 6
 TIMEOUT_SEC = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+PROXY_FILE = None              # файл проксі 'host:port [cap]' (proxy_pool.py); None — напряму
+
+# Чекпоінт: рядки fsync-аться пачками, сторінка стає done лише після fsync усіх її рядків
+FSYNC_EVERY_ROWS = 200
+FSYNC_EVERY_SEC  = 30
 
 # Фільтри
 TARGET_CLASS_CODE = 0.11  # "01.11" щоб парсити лише один клас; або None — всі
@@ -75,9 +89,15 @@ logger.addHandler(fh_err)
 logger.addHandler(sh)
 
 # ---------- Async infra ----------
-executor = ThreadPoolExecutor(max_workers=DETAILS_WORKERS)
+executor = ThreadPoolExecutor(max_workers=DETAILS_WORKERS)   # лише фолбек без httpx
+http: YouControlHttp = None     # нативний async-клієнт (youcontrol_http.py), створюється в main()
 company_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
 result_queue:  asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+frontier: KvedFrontier = None   # лише companies/memberships: одна компанія з кількох класів — один запит
+
+retry_tasks = set()   # відкладені повтори деталей (asyncio.Task), ще не повернуті в company_queue
+checkpoint: dict = {}  # {"pages_done": {class: [page]}, "classes_done": [class]} — спільний для producer/writer
+crawl_stats = {"list_failed": 0, "pages_failed": 0}   # незавершене в цьому запуску
 
 # Один глобальний cloudscraper (як у v5)
 scraper = cloudscraper.create_scraper(delay=10, browser={
@@ -86,6 +106,10 @@ scraper = cloudscraper.create_scraper(delay=10, browser={
 
 # === 2) Checkpoint & HTTP helpers ===
 def load_checkpoint():
+    """
+    {"pages_done": {class_code: [page, ...]}, "classes_done": [class_code, ...], "ts": ...}.
+    Старий курсор {"class_code", "page"} лишається в файлі, producer пропускає все до нього.
+    """
     if os.path.exists(CHECKPOINT_FILE):
         try:
             with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
@@ -94,157 +118,116 @@ def load_checkpoint():
             return {}
     return {}
 
-def save_checkpoint(class_code=None, page=None):
-    data = load_checkpoint()
-    if class_code is not None and page is not None:
-        data["class_code"] = class_code
-        data["page"] = page
-        data["ts"] = datetime.utcnow().isoformat()
-    with open(CHECKPOINT_FILE, "w", encoding="utf-8") as f:
+def save_checkpoint(data: dict):
+    """Атомарний запис (tmp + fsync + replace): після падіння чекпоінт або старий, або новий."""
+    data["ts"] = datetime.utcnow().isoformat()
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CHECKPOINT_FILE)
 
 def clean_text(text: str) -> str:
     return re.sub(r"\s+", " ", text or "").strip()
 
-def http_get_soup(url: str):
+class HostRateLimiter:
     """
-    Cloudflare-safe GET → BeautifulSoup or None
-    (блочна функція, викликається через executor)
+    Спільний async token bucket на (host, kind): kind "list" — сторінки каталогу,
+    "detail" — сторінки компаній. Чекання — в корутинах, а не в потоках.
     """
-    attempt = 0
-    while attempt < MAX_RETRIES:
-        try:
-            resp = scraper.get(url, headers=get_headers(), timeout=TIMEOUT_SEC)
-            code = resp.status_code
-            if code == 200:
-                return bs4.BeautifulSoup(resp.text, "lxml")
-            elif code in (429, 500, 502, 503, 504):
-                delay = min(2**attempt + random.uniform(0.5, 2.0), 60)
-                logger.warning(f"[{code}] retry in {delay:.1f}s → {url}")
-                time.sleep(delay)
-                attempt += 1
-            else:
-                logger.error(f"Unexpected HTTP {code} for {url}, sleep 60s and retry")
-                time.sleep(60)
-                attempt += 1
-        except Exception as e:
-            time.sleep(min(2**attempt, 30))
-            attempt += 1
-    logger.error(f"HTTP failed after retries: {url}")
-    return None
+    def __init__(self, budgets):
+        self.budgets = budgets      # kind -> (rate, burst)
+        self.buckets = {}
 
-async def fetch_html(url: str):
-    """Async обгортка над http_get_soup через ThreadPoolExecutor."""
-    loop = asyncio.get_running_loop()
-    await asyncio.sleep(random.uniform(SLEEP_LIST_MIN, SLEEP_LIST_MAX))
-    return await loop.run_in_executor(executor, http_get_soup, url)
+    def _bucket(self, host, kind):
+        key = (host, kind)
+        if key not in self.buckets:
+            self.buckets[key] = RateBudget(*self.budgets[kind])
+        return self.buckets[key]
 
+    async def acquire(self, url: str, kind: str):
+        await self._bucket(urlsplit(url).netloc, kind).acquire()
 
-# === 2) Checkpoint & HTTP helpers ===
-def load_checkpoint():
-    if os.path.exists(CHECKPOINT_FILE):
-        try:
-            with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+    def pause(self, url: str, seconds: float):
+        """429 — хост просить зачекати: зупиняємо всі його бюджети."""
+        host = urlsplit(url).netloc
+        for kind in self.budgets:
+            self._bucket(host, kind).pause(seconds)
 
-def save_checkpoint(class_code=None, page=None):
-    data = load_checkpoint()
-    if class_code is not None and page is not None:
-        data["class_code"] = class_code
-        data["page"] = page
-        data["ts"] = datetime.utcnow().isoformat()
-    with open(CHECKPOINT_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+limiter = HostRateLimiter({"list": (LIST_RATE, LIST_BURST), "detail": (DETAIL_RATE, DETAIL_BURST)})
 
-def clean_text(text: str) -> str:
-    return re.sub(r"\s+", " ", text or "").strip()
-
-def http_get_soup(url: str):
+def http_get_once(url: str, as_text: bool = False):
     """
-    Cloudflare-safe GET → BeautifulSoup or None
-    (блочна функція, викликається через executor)
+    Один Cloudflare-safe GET → (status, soup або None); status None — мережева помилка.
+    as_text — сирий HTML замість soup. Блокуюча, фолбек без httpx; без пауз і повторів.
     """
-    attempt = 0
-    while attempt < MAX_RETRIES:
-        try:
-            resp = scraper.get(url, headers=get_headers(), timeout=TIMEOUT_SEC)
-            code = resp.status_code
-            if code == 200:
-                return bs4.BeautifulSoup(resp.text, "lxml")
-            elif code in (429, 500, 502, 503, 504):
-                delay = min(2**attempt + random.uniform(0.5, 2.0), 60)
-                logger.warning(f"[{code}] retry in {delay:.1f}s → {url}")
-                time.sleep(delay)
-                attempt += 1
-            else:
-                logger.error(f"Unexpected HTTP {code} for {url}, sleep 60s and retry")
-                time.sleep(60)
-                attempt += 1
-        except Exception as e:
-            time.sleep(min(2**attempt, 30))
-            attempt += 1
-    logger.error(f"HTTP failed after retries: {url}")
+    try:
+        resp = scraper.get(url, headers=get_headers(), timeout=TIMEOUT_SEC)
+    except Exception as e:
+        logger.warning(f"GET failed: {e} → {url}")
+        return None, None
+    if resp.status_code == 200:
+        return 200, resp.text if as_text else bs4.BeautifulSoup(resp.text, "lxml")
+    return resp.status_code, None
+
+def retry_delay(url: str, code, attempt: int):
+    """Пауза (сек) перед повтором attempt-ї невдалої спроби або None — більше не пробуємо."""
+    if attempt + 1 >= MAX_RETRIES or code == 404:
+        logger.error(f"HTTP failed after retries ({code}): {url}")
+        return None
+    if code is None:
+        return min(2**attempt, 30)
+    if code in RETRY_STATUSES:
+        delay = min(2**attempt + random.uniform(0.5, 2.0), 60)
+        logger.warning(f"[{code}] retry in {delay:.1f}s → {url}")
+        if code == 429:
+            limiter.pause(url, delay)
+        return delay
+    logger.error(f"Unexpected HTTP {code} for {url}, retry in 60s")
+    return 60
+
+async def get_once(url: str, as_text: bool = False):
+    """
+    Один GET → (status, soup / HTML або None): спільний httpx-клієнт з cookies від cloudscraper,
+    без httpx — http_get_once у потоці executor-а.
+    """
+    if http is not None:
+        code, text = await http.get(url, headers=get_headers())
+        if code != 200:
+            return code, None
+        return code, text if as_text else bs4.BeautifulSoup(text, "lxml")
+    return await asyncio.get_running_loop().run_in_executor(executor, http_get_once, url, as_text)
+
+async def fetch_html(url: str, kind: str = "list"):
+    """GET під бюджетом хоста; між повторами чекає корутина, а не потік."""
+    for attempt in range(MAX_RETRIES):
+        await limiter.acquire(url, kind)
+        code, soup = await get_once(url)
+        if soup is not None:
+            return soup
+        delay = retry_delay(url, code, attempt)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
     return None
 
-async def fetch_html(url: str):
-    """Async обгортка над http_get_soup через ThreadPoolExecutor."""
-    loop = asyncio.get_running_loop()
-    await asyncio.sleep(random.uniform(SLEEP_LIST_MIN, SLEEP_LIST_MAX))
-    return await loop.run_in_executor(executor, http_get_soup, url)
-
-# === 3) HTML parsers (profile + beneficiary) ===
-def parse_profile_block(soup: bs4.BeautifulSoup) -> dict:
-    block = soup.find("div", class_="seo-table-contain", id="catalog-company-file")
-    if not block:
-        return {}
-    rows = block.find_all("div", class_="seo-table-row")
-    cols = [clean_text(r.find("div", class_="seo-table-col-1").get_text()) for r in rows]
-    vals_raw = []
-    for r in rows:
-        node = (r.find("span", class_="copy-file-field") or
-                r.find("div", class_="copy-file-field") or
-                r.find("p", class_="ucfirst copy-file-field") or
-                r.find("div", class_="seo-table-col-2"))
-        if node and clean_text(node.get_text()):
-            vals_raw.append(clean_text(node.get_text()))
-    return dict(zip(cols, vals_raw))
-
-def parse_beneficiary_block(soup: bs4.BeautifulSoup) -> dict:
-    block = soup.find("div", class_="seo-table-contain", id="catalog-company-beneficiary")
-    if not block:
-        return {}
-    rows = block.find_all("div", class_="seo-table-row")
-    cols = [clean_text(r.find("div", class_="seo-table-col-1").get_text()) for r in rows]
-    # EDRPOU з заголовка
-    h2 = soup.find("h2", class_="seo-table-name case-icon short")
-    edrpou = None
-    if h2:
-        m = re.search(r'\d+', h2.get_text())
-        edrpou = m.group(0) if m else None
-    if edrpou:
-        cols.append("EDRPOU_CODE")
-
-    spans = [r.find("span", class_="copy-file-field") for r in rows]
-    spans = [x for x in spans if x]
-    persons = []
-    for r in rows:
-        c2 = r.find("div", class_="seo-table-col-2")
-        if c2 and 'copy-hover' not in (c2.get("class") or []):
-            persons.append(c2)
-    data_nodes = spans + persons
-    vals = [clean_text(n.get_text()) for n in data_nodes]
-    if edrpou:
-        vals.append(edrpou)
-    return dict(zip(cols, vals))
+
+# === 3) HTML parsers (profile + beneficiary): один прохід lxml, youcontrol_parser.py ===
+def parse_profile_block(page: CompanyPage) -> dict:
+    return profile_dict_zip(page.profile, clean_keys=True)
+
+def parse_beneficiary_block(page: CompanyPage) -> dict:
+    # EDRPOU з заголовка — лише якщо він є
+    return beneficiary_dict_zip(page.beneficiary, header_edrpou(page), clean_keys=True, require_edrpou=True)
 
 
 # === 4) PRODUCER: put company detail jobs into queue ===
 async def producer():
     logger.info("Starting KVED crawl (producer)")
-    cp = load_checkpoint()
+    cp = checkpoint
+    classes_done = set(cp.get("classes_done", []))
+    pages_done = {c: set(p) for c, p in cp.get("pages_done", {}).items()}
     resume_class = cp.get("class_code")
     resume_page  = cp.get("page")
     skip_until_class = bool(resume_class)
@@ -253,6 +236,7 @@ async def producer():
     sections = await fetch_html(URL_BASE)
     if not sections:
         logger.error("Cannot fetch main KVED catalog page.")
+        crawl_stats["list_failed"] += 1
         return
 
     section_blocks = sections.find_all("div", class_="kved-catalog-table")
@@ -269,6 +253,7 @@ async def producer():
             url_chapter = URL_BASE + chapter_code
             html_chapter = await fetch_html(url_chapter)
             if not html_chapter:
+                crawl_stats["list_failed"] += 1
                 continue
 
             table = html_chapter.find("table")
@@ -294,7 +279,10 @@ async def producer():
                 if TARGET_CLASS_CODE and class_code != TARGET_CLASS_CODE:
                     continue
 
-                # Резюм після аварії: пропускаємо до потрібного класу
+                if class_code in classes_done:
+                    continue
+
+                # Резюм зі старого курсора: пропускаємо до потрібного класу
                 if skip_until_class:
                     if class_code == resume_class:
                         skip_until_class = False
@@ -304,6 +292,7 @@ async def producer():
                 url_class = url_chapter + f'/{class_code[-2:]}'
                 html_class = await fetch_html(url_class)
                 if not html_class:
+                    crawl_stats["list_failed"] += 1
                     continue
 
                 # Пагінація
@@ -318,29 +307,34 @@ async def producer():
                 pages_iter = TARGET_PAGES if TARGET_PAGES else range(1, max_page+1)
                 logger.info(f"[{class_code}] pages: {max_page}")
 
+                done_here = pages_done.get(class_code, set())
                 for page in pages_iter:
-                    # Резюм: пропустити до потрібної сторінки
+                    # Резюм: пропустити до потрібної сторінки старого курсора
                     if skip_until_page:
                         if page == resume_page:
                             skip_until_page = False
                         else:
                             continue
+                    if page in done_here:
+                        continue
 
                     url_page = f"{url_class}?page={page}"
                     html_page = await fetch_html(url_page)
                     if not html_page:
+                        crawl_stats["list_failed"] += 1
                         continue
 
                     items = html_page.find_all("a", class_="link-details link-open")
                     if not items:
                         logger.info(f"[{class_code}] page {page}: no items")
-                        # все одно оновимо чекпоінт
-                        await result_queue.put({"type": "PAGE_DONE", "class_code": class_code, "page": page})
-                        continue
 
+                    jobs = []
                     for a in items:
                         edrpou = clean_text((a.get_text() or "").split(",")[0])
                         url_details = f"https://youcontrol.com.ua{a.get('href')}"
+                        # вже записана / в роботі з іншого класу — лише членство в класі
+                        if not frontier.claim(url_details, class_code, page, edrpou):
+                            continue
                         job = {
                             "type": "DETAIL",
                             "url": url_details,
@@ -355,25 +349,44 @@ async def producer():
                             "CLASS_NAME": class_name,
                             "page": page
                         }
+                        jobs.append(job)
+
+                    # райтер рахує деталі сторінки до того, як прийде перший її ROW
+                    await result_queue.put({"type": "PAGE", "class_code": class_code, "page": page,
+                                            "jobs": len(jobs)})
+                    for job in jobs:
                         await company_queue.put(job)
 
-                    # сигнал райтеру: цю сторінку поставили в роботу
-                    await result_queue.put({"type": "PAGE_DONE", "class_code": class_code, "page": page})
+                # усі сторінки класу в роботі — клас done, щойно всі вони стануть done
+                await result_queue.put({"type": "CLASS_QUEUED", "class_code": class_code,
+                                        "pages": list(pages_iter)})
 
-    # сигнал кінця продюсера
-    for _ in range(DETAILS_WORKERS):
-        await company_queue.put({"type": "STOP"})
-    await result_queue.put({"type": "CRAWL_DONE"})
 
 
 # === 5) CONSUMERS & WRITER ===
-def _fetch_detail_blocking(url: str):
-    """Блокуюча функція: HTML деталей компанії → soup або None."""
-    return http_get_soup(url)
+def schedule_retry(job: dict, delay: float):
+    """Повертає job у company_queue через delay сек; воркер тим часом бере наступну компанію."""
+    async def requeue():
+        await asyncio.sleep(delay)
+        await company_queue.put(job)
+    task = asyncio.create_task(requeue())
+    retry_tasks.add(task)
+    task.add_done_callback(retry_tasks.discard)
+
+async def drain_details():
+    """Чекає, поки оброблено всі деталі, включно з відкладеними повторами."""
+    while True:
+        await company_queue.join()
+        if not retry_tasks:
+            return
+        await asyncio.gather(*retry_tasks)
 
 async def detail_worker(worker_id: int):
-    """Async-воркер деталей (OLX-стиль: окремий етап на деталі)."""
-    loop = asyncio.get_running_loop()
+    """
+    Async-воркер деталей (OLX-стиль: окремий етап на деталі). Невдалий запит не тримає
+    ні воркер, ні потік: job повертається в чергу з затримкою (schedule_retry).
+    """
+    PROXY_KEY.set(f"detail-{worker_id}")   # воркер тримається свого проксі, поки той здоровий
     while True:
         job = await company_queue.get()
         if job.get("type") == "STOP":
@@ -385,14 +398,21 @@ async def detail_worker(worker_id: int):
             continue
 
         try:
-            await asyncio.sleep(random.uniform(SLEEP_DETAIL_MIN, SLEEP_DETAIL_MAX))
-            soup = await loop.run_in_executor(executor, _fetch_detail_blocking, job["url"])
-            if not soup:
-                company_queue.task_done()
+            await limiter.acquire(job["url"], "detail")
+            code, html = await get_once(job["url"], as_text=True)
+            if html is None:
+                attempt = job.get("attempt", 0)
+                delay = retry_delay(job["url"], code, attempt)
+                if delay is None:
+                    await result_queue.put({"type": "FAILED", "class_code": job["CLASS_CODE"],
+                                            "page": job["page"], "url": job["url"]})
+                else:
+                    schedule_retry({**job, "attempt": attempt + 1}, delay)
                 continue
 
-            profile = parse_profile_block(soup)
-            benef   = parse_beneficiary_block(soup)
+            page    = parse_company_page(html)
+            profile = parse_profile_block(page)
+            benef   = parse_beneficiary_block(page)
 
             row = {
                 "SECTION_CODE": job["SECTION_CODE"],
@@ -415,55 +435,124 @@ async def detail_worker(worker_id: int):
                     continue
                 row[k] = v
 
-            await result_queue.put({"type": "ROW", "class_code": job["CLASS_CODE"], "row": row})
+            await result_queue.put({"type": "ROW", "class_code": job["CLASS_CODE"], "page": job["page"],
+                                    "url": job["url"], "row": row})
         except Exception as e:
             logger.warning(f"[worker {worker_id}] error: {e}")
+            await result_queue.put({"type": "FAILED", "class_code": job["CLASS_CODE"],
+                                    "page": job["page"], "url": job["url"]})
         finally:
             company_queue.task_done()
 
 async def writer_task():
     """
     Приймає:
+      - PAGE → скільки деталей сторінки в роботі (outstanding)
       - ROW → пише у out/kved_{CLASS}.jsonl
-      - PAGE_DONE → оновлює checkpoint
-      - CRAWL_DONE → завершується після спорожнення черг
+      - FAILED → звільняє URL (компанію може взяти інший клас), сторінка лишається незавершеною
+      - CLASS_QUEUED → усі сторінки класу в роботі
+      - CRAWL_DONE → останній commit і завершення (main шле його, коли воркери вже зупинені)
+
+    commit (кожні FSYNC_EVERY_ROWS рядків / FSYNC_EVERY_SEC сек): fsync файлів → URL-и в companies
+    фронтиру → сторінки, всі деталі яких записані, у checkpoint. Тож після падіння завершена
+    сторінка не повторюється, а незавершена повторюється лише для ще не записаних компаній.
     """
-    open_files = {}  # class_code -> file handle
-    pending_pages = {}  # class_code -> найбільша завершена сторінка (для грубого чекпоінта)
+    open_files = {}     # class_code -> file handle
+    pages_state = {}    # (class_code, page) -> {"outstanding": n, "failed": bool}
+    class_pages = {}    # class_code -> {page} — повний список сторінок класу (після CLASS_QUEUED)
+    unsynced = []       # [(class_code, page, url)] — записані, але ще без fsync
+    completed = []      # [(class_code, page)] — усі деталі оброблені, чекають fsync
+    pages_done = checkpoint.setdefault("pages_done", {})
+    classes_done = checkpoint.setdefault("classes_done", [])
+    last_commit = time.monotonic()
+
+    def commit():
+        nonlocal last_commit
+        for fp in open_files.values():
+            fp.flush()
+            os.fsync(fp.fileno())
+        by_page = {}
+        for cls, page, url in unsynced:
+            by_page.setdefault((cls, page), []).append(url)
+        for (cls, page), urls in by_page.items():
+            frontier.mark_fetched(urls, cls, page)
+        for cls, page in completed:
+            pages_done.setdefault(cls, []).append(page)
+        for cls in {c for c, _ in completed} | set(class_pages):
+            if cls not in classes_done and cls in class_pages and class_pages[cls] <= set(pages_done.get(cls, [])):
+                classes_done.append(cls)
+                pages_done.pop(cls, None)
+                class_pages.pop(cls)
+        if completed:
+            frontier.flush()    # членства сторінок, що стають done
+            save_checkpoint(checkpoint)
+            logger.info(f"[checkpoint] {len(unsynced)} rows, pages {completed}")
+        unsynced.clear()
+        completed.clear()
+        last_commit = time.monotonic()
+
+    def finish_one(cls, page, failed=False):
+        state = pages_state[(cls, page)]
+        state["outstanding"] -= 1
+        state["failed"] |= failed
+        if state["outstanding"] <= 0:
+            pages_state.pop((cls, page))
+            if state["failed"]:
+                crawl_stats["pages_failed"] += 1
+            else:
+                completed.append((cls, page))
 
     try:
         while True:
-            msg = await result_queue.get()
+            try:
+                msg = await asyncio.wait_for(result_queue.get(), timeout=FSYNC_EVERY_SEC)
+            except asyncio.TimeoutError:
+                msg = {"type": "TICK"}
             typ = msg.get("type")
 
-            if typ == "ROW":
+            if typ == "PAGE":
+                pages_state[(msg["class_code"], msg["page"])] = {"outstanding": msg["jobs"], "failed": False}
+                if not msg["jobs"]:
+                    # порожня або вся вже записана з інших класів
+                    pages_state.pop((msg["class_code"], msg["page"]))
+                    completed.append((msg["class_code"], msg["page"]))
+
+            elif typ == "ROW":
                 cls = msg["class_code"]
-                row = msg["row"]
                 fp = open_files.get(cls)
                 if fp is None:
                     path = os.path.join(OUT_DIR, f"kved_{cls}.jsonl")
                     fp = open(path, "a", encoding="utf-8")
                     open_files[cls] = fp
-                fp.write(json.dumps(row, ensure_ascii=False) + "\n")
+                fp.write(json.dumps(msg["row"], ensure_ascii=False) + "\n")
+                unsynced.append((cls, msg["page"], msg["url"]))
+                finish_one(cls, msg["page"])
 
-            elif typ == "PAGE_DONE":
-                cls = msg["class_code"]
-                page = msg["page"]
-                prev = pending_pages.get(cls, 0)
-                if page > prev:
-                    pending_pages[cls] = page
-                    # цей чекпоінт є «досягнули сторінку page» у класі cls
-                    save_checkpoint(class_code=cls, page=page)
-                    logger.info(f"[checkpoint] {cls}|{page}")
+            elif typ == "FAILED":
+                frontier.release(msg["url"])
+                finish_one(msg["class_code"], msg["page"], failed=True)
+
+            elif typ == "CLASS_QUEUED":
+                class_pages[msg["class_code"]] = set(msg["pages"])
 
             elif typ == "CRAWL_DONE":
-                # дочекаємося повного спорожнення черг
-                await company_queue.join()
-                # після цього більше ROW не прийде
+                # усі ROW/FAILED прийшли раніше за нього — черга результатів вже порожня
+                commit()
+                result_queue.task_done()
                 break
 
-            result_queue.task_done()
+            if typ != "TICK":
+                result_queue.task_done()
+            if len(unsynced) >= FSYNC_EVERY_ROWS or (
+                (unsynced or completed) and time.monotonic() - last_commit >= FSYNC_EVERY_SEC
+            ):
+                commit()
     finally:
+        # падіння / Ctrl+C: записане не губимо
+        try:
+            commit()
+        except Exception as e:
+            logger.error(f"Final commit failed: {e}")
         for fp in open_files.values():
             try:
                 fp.close()
@@ -473,21 +562,38 @@ async def writer_task():
 
 # === 6) MAIN ===
 async def main():
+    global frontier, http
     logger.info("YouControl v6 hybrid started")
+    frontier = KvedFrontier(COMPANIES_DB)
+    http = YouControlHttp(URL_BASE, proxy_file=PROXY_FILE) if HTTPX_AVAILABLE else None
+    checkpoint.update(load_checkpoint())
     # tasks
     writer = asyncio.create_task(writer_task())
     consumers = [asyncio.create_task(detail_worker(i+1)) for i in range(DETAILS_WORKERS)]
     prod = asyncio.create_task(producer())
 
-    # порядок завершення:
+    # порядок завершення: продюсер → усі деталі (з повторами) → воркери → райтер
     await prod
-    await company_queue.join()
-    await result_queue.join()
-
-    # зупинка воркерів (вже надіслані STOP у producer)
-    for c in consumers:
-        await c
+    await drain_details()
+    for _ in consumers:
+        await company_queue.put({"type": "STOP"})
+    await asyncio.gather(*consumers)
+    await result_queue.put({"type": "CRAWL_DONE"})
     await writer
+    if crawl_stats["list_failed"] or crawl_stats["pages_failed"]:
+        # наступний запуск продовжить з чекпоінта лише незавершені сторінки
+        logger.info(f"Unfinished: {crawl_stats}, checkpoint kept")
+    else:
+        memberships_csv = os.path.join(OUT_DIR, KVED_MEMBERSHIPS_CSV)
+        logger.info(f"{frontier.export_memberships(memberships_csv)} extra KVED memberships → {memberships_csv}")
+        # обхід завершено — наступний запуск качає каталог заново
+        frontier.reset()
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+    frontier.close()
+    if http is not None:
+        logger.info(f"HTTP: {http.stats()}")
+        await http.aclose()
     logger.info("Done.")
 
 if __name__ == "__main__":
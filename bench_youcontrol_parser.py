@@ -0,0 +1,394 @@
+"""
+Перевірка і бенчмарк однопрохідного lxml-парсера company_details (youcontrol_parser.py)
+проти старих BeautifulSoup-парсерів v5 / v6 / v8 (їх копії нижче — еталон).
+
+  python bench_youcontrol_parser.py golden [kved_01.11.csv]
+      з кожного рядка CSV будується сторінка в розмітці YouControl (значення в span / div /
+      p.ucfirst copy-file-field / голому col-2, зайві пробіли, коментарі, <script> у комірках);
+      новий парсер кожного стилю має повернути рівно значення з CSV, старий — те саме, що новий;
+      плюс сторінка з рядком без col-1 (MALFORMED_PAGE) — новий парсер має дати часткові дані
+  python bench_youcontrol_parser.py parity [--cache DIR] [--dir DIR]
+      старий vs новий на справжніх сторінках: HTML-кеш (html_cache.py) і/або *.html у теці
+  python bench_youcontrol_parser.py bench [--cache DIR] [--dir DIR] [--repeats N]
+      ms/page до і після (побудова дерева + обидві таблиці); без сторінок — синтетичні з CSV
+
+Exit code 1, якщо хоч одна сторінка розходиться.
+"""
+import argparse, glob, html, os, random, re, sys, time
+
+import bs4
+import pandas as pd
+
+from youcontrol_parser import (clean_text, parse_company_page, header_edrpou, profile_dict_zip,
+                               beneficiary_dict_zip, profile_dict_rows, beneficiary_dict_rows)
+
+GOLDEN_CSV = "kved_01.11.csv"
+DETAILS_PREFIX = "https://youcontrol.com.ua/company_details"
+META_COLUMNS = ["SECTION_CODE", "SECTION_NAME", "CHAPTER_CODE", "CHAPTER_NAME",
+                "GROUP_CODE", "GROUP_NAME", "CLASS_CODE", "CLASS_NAME", "EDRPOU_CODE"]
+FILLER_BLOCKS = 300     # сторонньої розмітки на синтетичну сторінку, щоб розмір був ближчий до справжньої
+
+
+# --- еталон: старі bs4-парсери (як були у скриптах) ---
+def legacy_v5(soup):
+    """v4 / v5 fetch_company_details."""
+    block_profile = soup.find("div", class_="seo-table-contain", id="catalog-company-file")
+    profile_dict = {}
+    if block_profile:
+        profile_rows = block_profile.find_all("div", class_="seo-table-row")
+        profile_data_columns = [r.find("div", class_="seo-table-col-1").text.strip() for r in profile_rows]
+        raw_data = [
+            (r.find("span", class_="copy-file-field") or
+             r.find("div", class_="copy-file-field") or
+             r.find("p", class_="ucfirst copy-file-field") or
+             r.find("div", class_="seo-table-col-2")).text
+            for r in profile_rows
+            if (r.find("span", class_="copy-file-field") or
+                r.find("div", class_="copy-file-field") or
+                r.find("p", class_="ucfirst copy-file-field") or
+                r.find("div", class_="seo-table-col-2"))
+        ]
+        profile_data_text = [clean_text(x) for x in raw_data if x.strip()]
+        profile_dict = dict(zip(profile_data_columns, profile_data_text))
+
+    block_beneficiary = soup.find("div", class_="seo-table-contain", id="catalog-company-beneficiary")
+    data_beneficiary_dict = {}
+    if block_beneficiary:
+        beneficiary_rows = block_beneficiary.find_all("div", class_="seo-table-row")
+        beneficiary_data_columns = [r.find("div", class_="seo-table-col-1").text.strip() for r in beneficiary_rows]
+        raw_edrpou = soup.find("h2", class_="seo-table-name case-icon short").text
+        edrpou = re.search(r'\d+', raw_edrpou).group() if re.search(r'\d+', raw_edrpou) else None
+        beneficiary_data_columns.append("EDRPOU_CODE")
+        text_beneficiary_spans = [r.find("span", class_="copy-file-field") for r in beneficiary_rows]
+        text_beneficiary_persons = [
+            r.find("div", class_="seo-table-col-2")
+            if r.find("div", class_="seo-table-col-2") and 'copy-hover' not in r.find("div", class_="seo-table-col-2").get("class", [])
+            else None for r in beneficiary_rows
+        ]
+        text_beneficiary_spans = [x for x in text_beneficiary_spans if x]
+        text_beneficiary_persons = [x for x in text_beneficiary_persons if x]
+        data_beneficiary = text_beneficiary_spans + text_beneficiary_persons
+        data_beneficiary_text = [clean_text(x.text) for x in data_beneficiary] + [edrpou]
+        data_beneficiary_dict = dict(zip(beneficiary_data_columns, data_beneficiary_text))
+    return profile_dict, data_beneficiary_dict
+
+
+def legacy_v6(soup):
+    """v6 parse_profile_block / parse_beneficiary_block."""
+    profile = {}
+    block = soup.find("div", class_="seo-table-contain", id="catalog-company-file")
+    if block:
+        rows = block.find_all("div", class_="seo-table-row")
+        cols = [clean_text(r.find("div", class_="seo-table-col-1").get_text()) for r in rows]
+        vals_raw = []
+        for r in rows:
+            node = (r.find("span", class_="copy-file-field") or
+                    r.find("div", class_="copy-file-field") or
+                    r.find("p", class_="ucfirst copy-file-field") or
+                    r.find("div", class_="seo-table-col-2"))
+            if node and clean_text(node.get_text()):
+                vals_raw.append(clean_text(node.get_text()))
+        profile = dict(zip(cols, vals_raw))
+
+    benef = {}
+    block = soup.find("div", class_="seo-table-contain", id="catalog-company-beneficiary")
+    if block:
+        rows = block.find_all("div", class_="seo-table-row")
+        cols = [clean_text(r.find("div", class_="seo-table-col-1").get_text()) for r in rows]
+        h2 = soup.find("h2", class_="seo-table-name case-icon short")
+        edrpou = None
+        if h2:
+            m = re.search(r'\d+', h2.get_text())
+            edrpou = m.group(0) if m else None
+        if edrpou:
+            cols.append("EDRPOU_CODE")
+        spans = [r.find("span", class_="copy-file-field") for r in rows]
+        spans = [x for x in spans if x]
+        persons = []
+        for r in rows:
+            c2 = r.find("div", class_="seo-table-col-2")
+            if c2 and 'copy-hover' not in (c2.get("class") or []):
+                persons.append(c2)
+        vals = [clean_text(n.get_text()) for n in spans + persons]
+        if edrpou:
+            vals.append(edrpou)
+        benef = dict(zip(cols, vals))
+    return profile, benef
+
+
+def legacy_v8(soup):
+    """v8 fetch_company_details."""
+    profile_dict = {}
+    block_profile = soup.find("div", id="catalog-company-file")
+    if block_profile:
+        for row in block_profile.find_all("div", class_="seo-table-row"):
+            key = clean_text(row.find("div", class_="seo-table-col-1").text)
+            val_elem = row.find("span", class_="copy-file-field") or \
+                       row.find("div", class_="copy-file-field") or \
+                       row.find("p", class_="ucfirst copy-file-field") or \
+                       row.find("div", class_="seo-table-col-2")
+            if val_elem:
+                profile_dict[key] = clean_text(val_elem.text)
+
+    beneficiary_dict = {}
+    block_benef = soup.find("div", id="catalog-company-beneficiary")
+    if block_benef:
+        for row in block_benef.find_all("div", class_="seo-table-row"):
+            key = clean_text(row.find("div", class_="seo-table-col-1").text)
+            val = row.find("span", class_="copy-file-field") or \
+                  row.find("div", class_="seo-table-col-2")
+            if val:
+                beneficiary_dict[key] = clean_text(val.text)
+    return profile_dict, beneficiary_dict
+
+
+# --- новий парсер у тих самих стилях ---
+def fast_v5(page):
+    return profile_dict_zip(page.profile), beneficiary_dict_zip(page.beneficiary, header_edrpou(page))
+
+
+def fast_v6(page):
+    return (profile_dict_zip(page.profile, clean_keys=True),
+            beneficiary_dict_zip(page.beneficiary, header_edrpou(page), clean_keys=True, require_edrpou=True))
+
+
+def fast_v8(page):
+    return profile_dict_rows(page.profile), beneficiary_dict_rows(page.beneficiary)
+
+
+STYLES = {"v5": (legacy_v5, fast_v5), "v6": (legacy_v6, fast_v6), "v8": (legacy_v8, fast_v8)}
+
+
+def run_legacy(style, text):
+    try:
+        return STYLES[style][0](bs4.BeautifulSoup(text, "lxml")), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def run_fast(style, text):
+    try:
+        return STYLES[style][1](parse_company_page(text)), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+# --- синтетичні сторінки з golden CSV ---
+def is_beneficiary_column(name):
+    return "бенефіціар" in name
+
+
+def _value_html(value, variant, rng):
+    words = [html.escape(w) for w in value.split(" ")]
+    # зайві пробіли / переноси всередині значення мають зникнути після clean_text
+    body = "".join(w + rng.choice([" ", "  ", "\n   ", " \t"]) for w in words).rstrip()
+    if rng.random() < 0.2:
+        body = f"<!-- copy -->{body}<script>var t = 1;</script>"
+    if variant == "span":
+        return f'<div class="seo-table-col-2 copy-hover">\n  <span class="copy-file-field">{body}</span>\n</div>'
+    if variant == "div":
+        return f'<div class="seo-table-col-2 copy-hover"><div class="copy-file-field">{body}</div></div>'
+    if variant == "p":
+        return f'<div class="seo-table-col-2"><p class="ucfirst copy-file-field">{body}</p></div>'
+    return f'<div class="seo-table-col-2">\n{body}\n</div>'
+
+
+def _label_html(label):
+    return f'<div class="seo-table-col-1">\n      {html.escape(label)}  \n</div>'
+
+
+def render_page(row, rng, filler=FILLER_BLOCKS):
+    """Рядок golden CSV -> HTML сторінки компанії."""
+    profile, beneficiary = [], []
+    for col, value in row.items():
+        if col in META_COLUMNS or value is None or (isinstance(value, float) and pd.isna(value)):
+            continue
+        if is_beneficiary_column(col):
+            # бенефіціари: значення в span усередині col-2.copy-hover (як на сайті)
+            beneficiary.append(f'<div class="seo-table-row">{_label_html(col)}'
+                               f'{_value_html(value, "span", rng)}</div>')
+        else:
+            variant = rng.choice(["span", "div", "p", "plain"])
+            profile.append(f'<div class="seo-table-row">{_label_html(col)}'
+                           f'{_value_html(value, variant, rng)}</div>')
+    noise = "".join(
+        f'<div class="card"><a href="/x/{i}">Пункт {i}</a><span class="hint">Підказка {i}</span></div>'
+        for i in range(filler)
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Компанія</title>"
+        "<script>window.dataLayer = [];</script></head><body>"
+        f"<nav>{noise}</nav>"
+        f"<h2 class=\"seo-table-name case-icon short\">Код ЄДРПОУ {row['EDRPOU_CODE']}</h2>"
+        f"<div class=\"seo-table-contain\" id=\"catalog-company-file\">{''.join(profile)}</div>"
+        + (f"<div class=\"seo-table-contain\" id=\"catalog-company-beneficiary\">{''.join(beneficiary)}</div>"
+           if beneficiary else "")
+        + f"<footer>{noise}</footer></body></html>"
+    )
+
+
+# битий рядок без col-1 у кожному блоці: старі v4/v5 на ньому падали, новий парсер дає ключ ""
+MALFORMED_PAGE = (
+    "<html><body><h2 class=\"seo-table-name case-icon short\">Код ЄДРПОУ 12345678</h2>"
+    "<div class=\"seo-table-contain\" id=\"catalog-company-file\">"
+    f'<div class="seo-table-row">{_label_html("Назва")}<div class="seo-table-col-2">ТОВ  Альфа</div></div>'
+    '<div class="seo-table-row"><div class="seo-table-col-2"><span class="copy-file-field">Без назви</span></div></div>'
+    f'<div class="seo-table-row">{_label_html("Статус")}<div class="seo-table-col-2">зареєстровано</div></div>'
+    "</div><div class=\"seo-table-contain\" id=\"catalog-company-beneficiary\">"
+    f'<div class="seo-table-row">{_label_html("Кінцевий бенефіціар")}{_value_html("Іван Петренко", "span", random.Random(0))}</div>'
+    f'<div class="seo-table-row">{_value_html("Петро Іваненко", "span", random.Random(0))}</div>'
+    "</div></body></html>"
+)
+MALFORMED_PROFILE = {"Назва": "ТОВ Альфа", "": "Без назви", "Статус": "зареєстровано"}
+MALFORMED_BENEFICIARY = {"Кінцевий бенефіціар": "Іван Петренко", "": "Петро Іваненко"}
+MALFORMED_EXPECTED = {
+    "v5": (MALFORMED_PROFILE, {**MALFORMED_BENEFICIARY, "EDRPOU_CODE": "12345678"}),
+    "v6": (MALFORMED_PROFILE, {**MALFORMED_BENEFICIARY, "EDRPOU_CODE": "12345678"}),
+    "v8": (MALFORMED_PROFILE, MALFORMED_BENEFICIARY),
+}
+
+
+def golden_expected(row, style):
+    """Що мав повернути парсер стилю style для цього рядка CSV (profile, beneficiary)."""
+    key = (lambda k: k) if style == "v5" else clean_text
+    profile, benef = {}, {}
+    for col, value in row.items():
+        if col in META_COLUMNS or value is None or (isinstance(value, float) and pd.isna(value)):
+            continue
+        (benef if is_beneficiary_column(col) else profile)[key(col.strip())] = value
+    if benef and style != "v8":
+        benef["EDRPOU_CODE"] = str(row["EDRPOU_CODE"])
+    return profile, benef
+
+
+def load_golden(path):
+    df = pd.read_csv(path, dtype=str)
+    return df.to_dict("records")
+
+
+def load_pages(cache_dir=None, html_dir=None):
+    """[(name, html str)] зі справжніх збережених сторінок company_details."""
+    pages = []
+    if cache_dir:
+        from html_cache import HtmlCache
+        cache = HtmlCache(cache_dir)
+        for url, _, body in cache.iter_latest(DETAILS_PREFIX):
+            pages.append((url, body.decode("utf-8", "replace")))
+        cache.close()
+    if html_dir:
+        for path in sorted(glob.glob(os.path.join(html_dir, "**", "*.htm*"), recursive=True)):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append((os.path.relpath(path, html_dir), f.read()))
+    return pages
+
+
+def synthetic_pages(csv_path, seed=0):
+    rng = random.Random(seed)
+    return [(f"{csv_path}#{i} ({row['EDRPOU_CODE']})", render_page(row, rng))
+            for i, row in enumerate(load_golden(csv_path))] + [("malformed (row without col-1)", MALFORMED_PAGE)]
+
+
+# --- команди ---
+def compare(name, style, pages_out):
+    (ref, ref_err), (fast, fast_err) = pages_out
+    if fast_err:
+        return [] if ref_err else [f"{style}: lxml error={fast_err}"]
+    if ref_err:
+        # старий парсер падав на битій розмітці (рядок без col-1, бенефіціари без h2) — новий
+        # повертає що знайшов; це не розбіжність, лише повідомляємо
+        print(f"[i] {name}: {style} bs4 error={ref_err}, lxml ok")
+        return []
+    out = []
+    for part, a, b in (("profile", ref[0], fast[0]), ("beneficiary", ref[1], fast[1])):
+        if a != b:
+            for k in a.keys() | b.keys():
+                if a.get(k) != b.get(k):
+                    out.append(f"{style}.{part}[{k[:40]!r}]: bs4={a.get(k)!r:.60} lxml={b.get(k)!r:.60}")
+            if not out and list(a) != list(b):
+                out.append(f"{style}.{part}: різний порядок ключів")
+    return out
+
+
+def cmd_parity(pages):
+    mismatched = 0
+    for name, text in pages:
+        diffs = []
+        for style in STYLES:
+            diffs += compare(name, style, (run_legacy(style, text), run_fast(style, text)))
+        if diffs:
+            mismatched += 1
+            print(f"[X] {name}")
+            for d in diffs[:10]:
+                print(f"    {d}")
+    print(f"Сторінок: {len(pages)}, розбіжностей: {mismatched}")
+    return 1 if mismatched else 0
+
+
+def cmd_golden(csv_path):
+    rows = load_golden(csv_path)
+    rng = random.Random(0)
+    failed = 0
+    for i, row in enumerate(rows):
+        text = render_page(row, rng)
+        diffs = []
+        for style in STYLES:
+            fast, err = run_fast(style, text)
+            expected = golden_expected(row, style)
+            if err:
+                diffs.append(f"{style}: {err}")
+            elif fast != expected:
+                for part, got, exp in (("profile", fast[0], expected[0]), ("beneficiary", fast[1], expected[1])):
+                    for k in got.keys() | exp.keys():
+                        if got.get(k) != exp.get(k):
+                            diffs.append(f"{style}.{part}[{k[:40]!r}]: got={got.get(k)!r:.60} csv={exp.get(k)!r:.60}")
+            diffs += compare(csv_path, style, (run_legacy(style, text), (fast, err)))
+        if diffs:
+            failed += 1
+            print(f"[X] {csv_path}#{i} ({row['EDRPOU_CODE']})")
+            for d in diffs[:10]:
+                print(f"    {d}")
+    for style in STYLES:
+        fast, err = run_fast(style, MALFORMED_PAGE)
+        if err or fast != MALFORMED_EXPECTED[style]:
+            failed += 1
+            print(f"[X] malformed (row without col-1) {style}: {err or fast}")
+    print(f"Golden {csv_path}: рядків {len(rows)} + битий рядок, розбіжностей {failed}")
+    return 1 if failed else 0
+
+
+def cmd_bench(pages, repeats):
+    n = len(pages) * repeats
+    avg_kb = sum(len(t) for _, t in pages) / len(pages) / 1024
+    print(f"Сторінок: {len(pages)} (~{avg_kb:.0f} KB) x {repeats} повторів, ms/page")
+    print(f"{'style':<8}{'bs4':>10}{'lxml':>10}{'speedup':>10}")
+    for style, (legacy, fast) in STYLES.items():
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            for _, text in pages:
+                legacy(bs4.BeautifulSoup(text, "lxml"))
+        t_old = (time.perf_counter() - t0) * 1000 / n
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            for _, text in pages:
+                fast(parse_company_page(text))
+        t_new = (time.perf_counter() - t0) * 1000 / n
+        print(f"{style:<8}{t_old:>10.2f}{t_new:>10.2f}{t_old / t_new:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="YouControl company_details parser: golden / parity / bench")
+    ap.add_argument("command", choices=["golden", "parity", "bench"])
+    ap.add_argument("csv", nargs="?", default=GOLDEN_CSV, help="golden CSV (для golden і синтетичних сторінок)")
+    ap.add_argument("--cache", help="тека HTML-кешу (html_cache.py) зі сторінками company_details")
+    ap.add_argument("--dir", help="тека зі збереженими *.html")
+    ap.add_argument("--repeats", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.command == "golden":
+        sys.exit(cmd_golden(args.csv))
+    pages = load_pages(args.cache, args.dir)
+    if not pages:
+        print(f"[i] Справжніх сторінок немає — синтетичні з {args.csv}")
+        pages = synthetic_pages(args.csv)
+    sys.exit(cmd_parity(pages) if args.command == "parity" else cmd_bench(pages, args.repeats))
@@ -0,0 +1,234 @@
+"""
+Персистентний фронтир обходу каталогу КВЕД YouControl (v4 / v5 / v6 / v8).
+
+Замість лінійного проходу всього дерева з пропуском до чекпоінта зберігаємо
+в SQLite саму роботу, що лишилась:
+  classes     — знайдені класи КВЕД (мета секції/розділу/групи, url, max_page, порядок обходу)
+  pages       — (class_code, page) зі статусом pending / done
+  companies   — глобальний seen-set: URL компаній, рядки яких вже записані (клас/сторінка першого запису)
+  memberships — усі (компанія, клас, сторінка), де компанія трапилась у каталозі
+
+Перезапуск: якщо дерево вже знайдене (discovered) — одразу беремо pending-сторінки,
+жодна завершена сторінка каталогу повторно не завантажується.
+Сторінку позначають done лише після того, як її рядки записані на диск.
+
+Одна компанія буває в кількох класах КВЕД: claim() перед постановкою запиту деталей
+пропускає вже записані (або вже взяті в роботу) компанії, а додатковий клас лише
+записується в memberships. Рядок компанії один — з класу, де її завантажили першою;
+додаткові класи — export_memberships().
+"""
+import argparse, csv, json, os, sqlite3, time
+
+FRONTIER_DB = "kved_frontier.sqlite"
+KVED_MEMBERSHIPS_CSV = "kved_memberships.csv"
+
+
+class KvedFrontier:
+    def __init__(self, path=FRONTIER_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS classes (
+                class_code TEXT PRIMARY KEY,
+                ord        INTEGER NOT NULL,
+                url_class  TEXT NOT NULL,
+                max_page   INTEGER NOT NULL,
+                meta       TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                class_code TEXT NOT NULL,
+                page       INTEGER NOT NULL,
+                status     TEXT NOT NULL DEFAULT 'pending',
+                PRIMARY KEY (class_code, page)
+            );
+            CREATE TABLE IF NOT EXISTS companies (
+                url        TEXT PRIMARY KEY,
+                class_code TEXT NOT NULL,
+                page       INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS memberships (
+                url        TEXT NOT NULL,
+                edrpou     TEXT,
+                class_code TEXT NOT NULL,
+                page       INTEGER,
+                PRIMARY KEY (url, class_code)
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key   TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        # фронтир зі старим seen (у межах класу) -> глобальний companies
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seen'").fetchone():
+            self.conn.execute("INSERT OR IGNORE INTO companies (url, class_code, page) "
+                              "SELECT url, class_code, page FROM seen")
+            self.conn.execute("DROP TABLE seen")
+        self.conn.commit()
+        self.claimed = {}           # url -> class_code: деталі в роботі, рядок ще не записаний
+        self._memberships = []      # [(url, edrpou, class_code, page)] — ще не в БД
+
+    # --- дерево ---
+    def is_discovered(self):
+        return self.conn.execute("SELECT 1 FROM state WHERE key = 'discovered'").fetchone() is not None
+
+    def mark_discovered(self):
+        self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('discovered', ?)", (str(time.time()),))
+        self.conn.commit()
+
+    def has_class(self, class_code):
+        return self.conn.execute("SELECT 1 FROM classes WHERE class_code = ?", (class_code,)).fetchone() is not None
+
+    def add_class(self, class_code, url_class, max_page, meta, pages=None):
+        """meta — dict SECTION_* / CHAPTER_* / GROUP_* / CLASS_*; pages — підмножина сторінок (за замовчуванням усі)."""
+        ord_ = self.conn.execute("SELECT COALESCE(MAX(ord), -1) + 1 FROM classes").fetchone()[0]
+        self.conn.execute(
+            "INSERT OR IGNORE INTO classes (class_code, ord, url_class, max_page, meta) VALUES (?, ?, ?, ?, ?)",
+            (class_code, ord_, url_class, max_page, json.dumps(meta, ensure_ascii=False)),
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO pages (class_code, page) VALUES (?, ?)",
+            [(class_code, p) for p in (pages or range(1, max_page + 1))],
+        )
+        self.conn.commit()
+
+    # --- робота ---
+    def pending_pages(self):
+        """[(class_code, page, url_class, max_page, meta)] у порядку обходу каталогу."""
+        rows = self.conn.execute(
+            "SELECT p.class_code, p.page, c.url_class, c.max_page, c.meta FROM pages p "
+            "JOIN classes c ON c.class_code = p.class_code "
+            "WHERE p.status = 'pending' ORDER BY c.ord, p.page"
+        ).fetchall()
+        return [(cc, page, url, mp, json.loads(meta)) for cc, page, url, mp, meta in rows]
+
+    def pages_left(self, class_code):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM pages WHERE class_code = ? AND status = 'pending'", (class_code,)
+        ).fetchone()[0]
+
+    def page_done(self, class_code, page, urls=()):
+        """Сторінка повністю записана: її URL -> companies, статус -> done (одна транзакція)."""
+        self._insert_fetched(urls, class_code, page)
+        self.conn.execute(
+            "UPDATE pages SET status = 'done' WHERE class_code = ? AND page = ?", (class_code, page)
+        )
+        self.conn.commit()
+
+    def mark_fetched(self, urls, class_code, page=None):
+        """Рядки записані, але сторінка ще не вся — щоб після падіння не качати їх вдруге."""
+        self._insert_fetched(urls, class_code, page)
+        self.conn.commit()
+
+    def _insert_fetched(self, urls, class_code, page):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO companies (url, class_code, page) VALUES (?, ?, ?)",
+            [(u, class_code, page) for u in urls],
+        )
+        for u in urls:
+            self.claimed.pop(u, None)
+        self._flush_memberships()
+
+    def _flush_memberships(self):
+        if self._memberships:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO memberships (url, edrpou, class_code, page) VALUES (?, ?, ?, ?)",
+                self._memberships,
+            )
+            self._memberships.clear()
+
+    # --- дедуплікація компаній між класами ---
+    def claim(self, url, class_code, page=None, edrpou=None):
+        """
+        True — деталі компанії треба завантажити (URL тепер у claimed до mark_fetched/page_done
+        або release). False — компанія вже записана чи в роботі; клас лише додано в memberships.
+        """
+        self._memberships.append((url, edrpou, class_code, page))
+        if url in self.claimed or self.conn.execute(
+            "SELECT 1 FROM companies WHERE url = ?", (url,)
+        ).fetchone():
+            return False
+        self.claimed[url] = class_code
+        return True
+
+    def release(self, url):
+        """Деталі не завантажились — інший клас (або наступний прохід) може взяти компанію знову."""
+        self.claimed.pop(url, None)
+
+    def flush(self):
+        """Записати накопичені memberships без зміни сторінок."""
+        self._flush_memberships()
+        self.conn.commit()
+
+    def export_memberships(self, path=KVED_MEMBERSHIPS_CSV):
+        """
+        CSV додаткових класів: компанія, клас/сторінка, де її пропущено, і клас її рядка
+        в основному виході (PRIMARY_CLASS_CODE). Повертає кількість рядків.
+        """
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT m.edrpou, m.class_code, m.page, c.class_code, m.url FROM memberships m "
+            "JOIN companies c ON c.url = m.url WHERE m.class_code != c.class_code "
+            "ORDER BY m.class_code, m.page"
+        ).fetchall()
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["EDRPOU_CODE", "CLASS_CODE", "PAGE", "PRIMARY_CLASS_CODE", "URL"])
+            w.writerows(rows)
+        os.replace(tmp, path)
+        return len(rows)
+
+    def mark_done_before(self, class_code, page=None):
+        """
+        Міграція зі старого чекпоінта: класи до class_code -> done;
+        сторінки class_code <= page -> done (page=None — увесь клас).
+        """
+        row = self.conn.execute("SELECT ord FROM classes WHERE class_code = ?", (class_code,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute(
+            "UPDATE pages SET status = 'done' WHERE class_code IN (SELECT class_code FROM classes WHERE ord < ?)",
+            (row[0],),
+        )
+        self.conn.execute(
+            "UPDATE pages SET status = 'done' WHERE class_code = ? AND (? IS NULL OR page <= ?)",
+            (class_code, page, page),
+        )
+        self.conn.commit()
+
+    def stats(self):
+        classes = self.conn.execute("SELECT COUNT(*) FROM classes").fetchone()[0]
+        done, total = self.conn.execute(
+            "SELECT COALESCE(SUM(status = 'done'), 0), COUNT(*) FROM pages"
+        ).fetchone()
+        companies = self.conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+        listings = self.conn.execute("SELECT COUNT(*) FROM memberships").fetchone()[0]
+        return {"classes": classes, "pages_done": done, "pages_total": total, "companies": companies,
+                "listings": listings, "discovered": self.is_discovered()}
+
+    def reset(self):
+        """Прохід завершено — наступний починає каталог заново."""
+        self.conn.executescript(
+            "DELETE FROM pages; DELETE FROM companies; DELETE FROM memberships; "
+            "DELETE FROM classes; DELETE FROM state;"
+        )
+        self.conn.commit()
+        self.claimed.clear()
+        self._memberships.clear()
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="KVED crawl frontier")
+    ap.add_argument("command", choices=["stats", "memberships"])
+    ap.add_argument("--db", default=FRONTIER_DB)
+    ap.add_argument("--out", default=KVED_MEMBERSHIPS_CSV)
+    args = ap.parse_args()
+    frontier = KvedFrontier(args.db)
+    if args.command == "memberships":
+        print(f"Додаткових членств: {frontier.export_memberships(args.out)} -> {args.out}")
+    print(frontier.stats())
+    frontier.close()
@@ -0,0 +1,209 @@
+"""
+Спільний дисковий кеш сирого HTML для всіх парсерів (YouControl, uBKI, OLX).
+
+Структура (HTML_CACHE_DIR):
+  index.sqlite          — pages(url, fetched_at, sha, status) + blobs(sha, size)
+  blobs/ab/abcdef....zst — тіло відповіді, стиснене zstd (без zstandard — zlib, *.zz)
+
+Блоби адресуються sha256 від тіла: однакові сторінки (заглушки, "не знайдено")
+зберігаються один раз. Кожне завантаження — окремий рядок pages (URL + час),
+get() віддає найсвіжіше.
+
+Витіснення: рядки старші за ttl, далі найстаріші — поки сумарний розмір блобів
+більший за max_bytes; блоби без посилань видаляються з диска.
+
+CLI:  python html_cache.py stats | evict     [--dir DIR]
+"""
+import argparse, hashlib, os, sqlite3, threading, time, zlib
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except Exception:
+    ZSTD_AVAILABLE = False
+
+HTML_CACHE_DIR = os.environ.get("HTML_CACHE_DIR", "html_cache")
+HTML_CACHE_TTL = 90 * 24 * 3600           # сек; старіші завантаження витісняються
+HTML_CACHE_MAX_BYTES = 20 * 1024 ** 3     # стиснений розмір блобів
+EVICT_EVERY = 1000                        # put-ів між автоматичними evict()
+ZSTD_LEVEL = 6
+
+
+class HtmlCache:
+    def __init__(self, root=HTML_CACHE_DIR, ttl=HTML_CACHE_TTL, max_bytes=HTML_CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.ext = ".zst" if ZSTD_AVAILABLE else ".zz"
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        # один конекшн на процес під локом: парсери OLX / v6 пишуть з потоків
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url        TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                sha        TEXT NOT NULL,
+                status     INTEGER,
+                PRIMARY KEY (url, fetched_at)
+            );
+            CREATE INDEX IF NOT EXISTS pages_fetched ON pages (fetched_at);
+            CREATE INDEX IF NOT EXISTS pages_sha ON pages (sha);
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha  TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+        """)
+        self.conn.commit()
+        self._puts = 0
+
+    # --- блоби ---
+    def _blob_path(self, sha):
+        return os.path.join(self.root, "blobs", sha[:2], sha + self.ext)
+
+    def _compress(self, body):
+        if ZSTD_AVAILABLE:
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+        return zlib.compress(body, ZSTD_LEVEL)
+
+    def _decompress(self, data):
+        if ZSTD_AVAILABLE:
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    # --- запис / читання ---
+    def put(self, url, body, status=200, fetched_at=None):
+        """Зберігає тіло відповіді (bytes або str). Повертає sha256 блоба."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(sha)
+        data = None if os.path.exists(path) else self._compress(body)
+        # перевірка наявності блоба і запис в індекс — в одній BEGIN IMMEDIATE транзакції
+        # (write-lock SQLite, спільний для всіх процесів на цей кеш, напр. uBKI --jobs N):
+        # evict() іншого процесу видаляє orphan-и теж усередині своєї такої транзакції
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(data if data is not None else self._compress(body))
+                    os.replace(tmp, path)
+                self.conn.execute("INSERT OR IGNORE INTO blobs (sha, size) VALUES (?, ?)", (sha, os.path.getsize(path)))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pages (url, fetched_at, sha, status) VALUES (?, ?, ?, ?)",
+                    (url, fetched_at or time.time(), sha, status),
+                )
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self._puts += 1
+            due = self._puts % EVICT_EVERY == 0
+        if due:
+            self.evict()
+        return sha
+
+    def _read_blob(self, sha):
+        try:
+            with open(self._blob_path(sha), "rb") as f:
+                return self._decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        except Exception:
+            # пошкоджений zstd-кадр
+            return None
+
+    def get(self, url, max_age=None):
+        """
+        Найсвіжіше тіло для URL (bytes) або None. max_age — сек, старіші ігноруються.
+        Рядок індексу без файлу блоба (видалений / пошкоджений) — теж промах, None.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sha, fetched_at FROM pages WHERE url = ? ORDER BY fetched_at DESC LIMIT 1", (url,)
+            ).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return self._read_blob(row[0])
+
+    def iter_latest(self, url_prefix=""):
+        """(url, fetched_at, body) — по одному найсвіжішому завантаженню на URL з префіксом."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT url, MAX(fetched_at), sha FROM pages WHERE url >= ? AND url < ? GROUP BY url ORDER BY url",
+                (url_prefix, url_prefix + "￿"),
+            ).fetchall()
+        for url, fetched_at, sha in rows:
+            body = self._read_blob(sha)
+            if body is not None:
+                yield url, fetched_at, body
+
+    # --- витіснення ---
+    def evict(self):
+        """TTL, потім розмір. Повертає кількість видалених блобів."""
+        with self._lock:
+            # усе, включно з видаленням файлів, — в одній BEGIN IMMEDIATE транзакції:
+            # put() іншого процесу не вставить посилання на блоб між перевіркою і unlink
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.ttl,))
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+                if total > self.max_bytes:
+                    # найстаріші завантаження першими; блоб звільняється, коли на нього не лишилось посилань
+                    for url, fetched_at, sha, size in self.conn.execute(
+                        "SELECT p.url, p.fetched_at, p.sha, b.size FROM pages p JOIN blobs b ON b.sha = p.sha "
+                        "ORDER BY p.fetched_at"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        self.conn.execute("DELETE FROM pages WHERE url = ? AND fetched_at = ?", (url, fetched_at))
+                        if not self.conn.execute("SELECT 1 FROM pages WHERE sha = ? LIMIT 1", (sha,)).fetchone():
+                            total -= size
+                orphans = [r[0] for r in self.conn.execute(
+                    "SELECT sha FROM blobs WHERE sha NOT IN (SELECT sha FROM pages)"
+                ).fetchall()]
+                removed = 0
+                for sha in orphans:
+                    if self.conn.execute("SELECT 1 FROM pages WHERE sha = ? LIMIT 1", (sha,)).fetchone():
+                        continue
+                    self.conn.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+                    try:
+                        os.remove(self._blob_path(sha))
+                    except OSError:
+                        pass
+                    removed += 1
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return removed
+
+    def stats(self):
+        with self._lock:
+            pages, urls, first, last = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT url), MIN(fetched_at), MAX(fetched_at) FROM pages"
+            ).fetchone()
+            blobs, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"pages": pages, "urls": urls, "blobs": blobs, "bytes": size,
+                "oldest": first and time.strftime("%Y-%m-%d %H:%M", time.localtime(first)),
+                "newest": last and time.strftime("%Y-%m-%d %H:%M", time.localtime(last))}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Кеш сирого HTML")
+    ap.add_argument("command", choices=["stats", "evict"])
+    ap.add_argument("--dir", default=HTML_CACHE_DIR)
+    args = ap.parse_args()
+    cache = HtmlCache(args.dir)
+    if args.command == "evict":
+        print(f"Видалено блобів: {cache.evict()}")
+    print(cache.stats())
+    cache.close()
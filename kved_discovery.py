@@ -0,0 +1,224 @@
+"""
+Паралельне знаходження дерева КВЕД YouControl: секції -> розділи -> класи + max_page.
+
+Замість послідовного обходу (кожен рівень чекає попередній запит) сторінки розділів,
+а потім класів, завантажуються паралельно під спільним бюджетом:
+  DISCOVERY_CONCURRENCY — одночасних запитів, DISCOVERY_RATE — запитів/сек (token bucket).
+
+Сторінки, що не відкрились, перезапитуються до DISCOVERY_RETRY_ROUNDS разів.
+
+Результат — kved_tree.json:
+  {"generated_at": ts, "complete": bool, "missing": {"chapters": [...], "classes": [...]},
+   "classes": [{class_code, url_class, max_page, meta}, ...]}
+у порядку каталогу. Файл перевикористовується між запусками, поки молодший за
+KVED_TREE_TTL і complete (усі сторінки класів завантажились). Неповне дерево не можна
+вважати каталогом: викликач не позначає фронтир discovered, і наступний прохід
+запускає discovery знову.
+
+fetch — async-функція url -> BeautifulSoup | None (fetch_async у v4/v5,
+click_on_link через asyncio.to_thread у v8).
+"""
+import asyncio, json, logging, os, time
+
+logger = logging.getLogger(__name__)
+
+URL_BASE = "https://youcontrol.com.ua/catalog/kved/"
+KVED_TREE_JSON = "kved_tree.json"
+KVED_TREE_TTL = 7 * 24 * 3600        # сек
+DISCOVERY_CONCURRENCY = 8
+DISCOVERY_RATE = 3.0                 # запитів/сек на весь discovery
+DISCOVERY_RETRY_ROUNDS = 2           # повторних раундів для сторінок, що не відкрились
+DISCOVERY_RETRY_PAUSE = 30           # сек перед кожним повторним раундом
+
+
+class RateBudget:
+    """Token bucket: не більше rate запитів/сек у середньому, сплеск до burst."""
+
+    def __init__(self, rate=DISCOVERY_RATE, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Жодних токенів наступні seconds (хост відповів 429); після паузи — без сплеску."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_sections(html_sections):
+    """[(section_code, section_name, chapter_code, chapter_name)] з головної сторінки каталогу."""
+    chapters = []
+    for section_block in html_sections.find_all("div", class_="kved-catalog-table"):
+        section_code = section_block.find("td", class_="green-col-word").text.strip()
+        section_name = section_block.find("td", class_="caps-col").text.strip()
+        for chapter_td in section_block.find_all("td", class_="green-col-num"):
+            chapter_code = chapter_td.text.strip()
+            chapter_name = chapter_td.find_next_sibling("td").text.strip()
+            chapters.append((section_code, section_name, chapter_code, chapter_name))
+    return chapters
+
+
+def parse_chapter(html_chapter, url_chapter, section):
+    """[(class_code, url_class, meta)] зі сторінки розділу."""
+    section_code, section_name, chapter_code, chapter_name = section
+    table = html_chapter.find("table")
+    if not table:
+        return []
+    classes = []
+    current_group_code, current_group_name = None, None
+    for row in table.find_all("tr"):
+        group_code_td = row.find("td", class_="green-col-word")
+        if group_code_td:
+            current_group_code = group_code_td.text.strip()
+            current_group_name = row.find("td", class_="caps-col").text.strip()
+            continue
+
+        class_code_td = row.find("td", class_="green-col-num")
+        if not (class_code_td and current_group_code):
+            continue
+
+        class_code = class_code_td.text.strip()
+        class_name = class_code_td.find_next_sibling("td").text.strip()
+        classes.append((class_code, url_chapter + f'/{class_code[-2:]}', {
+            "SECTION_CODE": section_code,
+            "SECTION_NAME": section_name,
+            "CHAPTER_CODE": chapter_code,
+            "CHAPTER_NAME": chapter_name,
+            "GROUP_CODE": current_group_code,
+            "GROUP_NAME": current_group_name,
+            "CLASS_CODE": class_code,
+            "CLASS_NAME": class_name,
+        }))
+    return classes
+
+
+def parse_max_page(html_class):
+    pagination = html_class.find("ul", class_="pagination")
+    if pagination:
+        page_numbers = [int(a.text) for a in pagination.find_all("a") if a.text.isdigit()]
+        if page_numbers:
+            return max(page_numbers)
+    return 1
+
+
+async def discover_kved_tree(fetch, concurrency=DISCOVERY_CONCURRENCY, rate=DISCOVERY_RATE, url_base=URL_BASE,
+                             retry_rounds=DISCOVERY_RETRY_ROUNDS, retry_pause=DISCOVERY_RETRY_PAUSE):
+    """
+    Повертає {"generated_at", "complete", "missing", "classes"} або None, якщо не відкрилась
+    головна сторінка. complete=False — частина розділів / класів не відкрилась і після повторів.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    budget = RateBudget(rate)
+
+    async def limited(url):
+        async with sem:
+            await budget.acquire()
+            try:
+                return await fetch(url)
+            except Exception as e:
+                logger.warning(f"Discovery fetch failed {url}: {e}")
+                return None
+
+    async def fetch_all(urls):
+        pages = list(await asyncio.gather(*(limited(u) for u in urls)))
+        for round_ in range(1, retry_rounds + 1):
+            failed = [i for i, page in enumerate(pages) if not page]
+            if not failed:
+                break
+            logger.warning(f"Discovery: {len(failed)} pages failed, retry round {round_}/{retry_rounds} "
+                           f"in {retry_pause}s")
+            await asyncio.sleep(retry_pause)
+            for i, page in zip(failed, await asyncio.gather(*(limited(urls[i]) for i in failed))):
+                pages[i] = page
+        return pages
+
+    t0 = time.monotonic()
+    html_sections = await limited(url_base)
+    if not html_sections:
+        logger.error("Cannot fetch main KVED catalog page.")
+        return None
+    sections = parse_sections(html_sections)
+
+    chapter_urls = [url_base + s[2] for s in sections]
+    chapter_pages = await fetch_all(chapter_urls)
+    missing_chapters = []
+    class_rows = []
+    for section, url_chapter, html_chapter in zip(sections, chapter_urls, chapter_pages):
+        if html_chapter:
+            class_rows.extend(parse_chapter(html_chapter, url_chapter, section))
+        else:
+            missing_chapters.append(section[2])
+    logger.info(f"Discovery: {len(sections)} chapters -> {len(class_rows)} classes "
+                f"({time.monotonic() - t0:.0f}s)")
+
+    class_pages = await fetch_all([url_class for _, url_class, _ in class_rows])
+    classes, missing_classes = [], []
+    for (class_code, url_class, meta), html_class in zip(class_rows, class_pages):
+        if not html_class:
+            missing_classes.append(class_code)
+            continue
+        classes.append({"class_code": class_code, "url_class": url_class,
+                        "max_page": parse_max_page(html_class), "meta": meta})
+    complete = not missing_chapters and not missing_classes
+    logger.info(f"Discovery done: {len(classes)} classes, "
+                f"{sum(c['max_page'] for c in classes)} pages, complete={complete} "
+                f"({time.monotonic() - t0:.0f}s)")
+    if not complete:
+        logger.warning(f"Discovery incomplete, skipped: chapters {missing_chapters or '-'} "
+                       f"(with all their classes), classes {missing_classes or '-'}")
+    return {"generated_at": time.time(), "complete": complete,
+            "missing": {"chapters": missing_chapters, "classes": missing_classes}, "classes": classes}
+
+
+def load_kved_tree(path=KVED_TREE_JSON, ttl=KVED_TREE_TTL):
+    """Дерево з диска, якщо воно повне і свіже; інакше None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            tree = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        logger.warning(f"{path} corrupted, ignoring.")
+        return None
+    age = time.time() - tree.get("generated_at", 0)
+    if not tree.get("complete") or age > ttl:
+        logger.info(f"{path} is stale (age {age / 3600:.1f}h, complete={tree.get('complete')})")
+        return None
+    return tree
+
+
+def save_kved_tree(tree, path=KVED_TREE_JSON):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(tree, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+async def get_kved_tree(fetch, path=KVED_TREE_JSON, ttl=KVED_TREE_TTL, refresh=False, **kwargs):
+    """Свіже дерево з path або нове discovery (збережене в path)."""
+    tree = None if refresh else load_kved_tree(path, ttl)
+    if tree is not None:
+        logger.info(f"Using {path}: {len(tree['classes'])} classes")
+        return tree
+    tree = await discover_kved_tree(fetch, **kwargs)
+    if tree is not None and path:
+        save_kved_tree(tree, path)
+    return tree
@@ -0,0 +1,263 @@
+"""
+Вихід парсера каталогу КВЕД: партиціонований Parquet-датасет замість тисяч дрібних CSV.
+
+  kved_dataset/SECTION_CODE=A/CHAPTER_CODE=01/CLASS_CODE=01.11/part-000000.parquet
+
+KvedDatasetWriter буферизує рядки по класах (не більше max_buffer_rows на клас).
+На клас — один відкритий pq.ParquetWriter, кожен flush = нова row group у ньому; новий
+part-файл — лише при нових колонках, після KVED_ROWS_PER_FILE рядків і при close().
+Відкритий файл (part-N.parquet.inprogress) без footer-а не читається, тому рядки ще й
+дописуються в part-N.jsonl (fsync на flush): після падіння конструктор відновлює з нього
+part-N.parquet. Усі колонки — nullable string. Назви колонок нормалізуються
+("... (cтаном на 07.10.2025)" -> "..."), тож файли різних днів мають одну схему.
+Без pyarrow — один CSV на клас (kved_dataset/kved_<class>.csv).
+
+CLI:
+  python kved_output.py compact [files/globs ...] [--out DIR] [--delete]
+      зливає старі kved_*_batch_*.csv / kved_*_final_*.csv / kved_*_p*.csv у датасет
+  python kved_output.py stats [--out DIR]
+"""
+import argparse, glob, json, os, re
+from collections import OrderedDict
+
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+KVED_DATASET_DIR = "kved_dataset"
+KVED_BUFFER_ROWS = 200
+KVED_ROWS_PER_FILE = 100_000   # рядків у part-файлі класу, далі — наступний
+KVED_MAX_OPEN_FILES = 32       # відкритих part-файлів (LRU); найдавніший закривається
+PARTITION_COLS = ("SECTION_CODE", "CHAPTER_CODE", "CLASS_CODE")
+LEGACY_CSV_GLOBS = ("kved_*_batch_*.csv", "kved_*_final_*.csv", "kved_*_p*.csv")
+
+_DATE_SUFFIX = re.compile(r"\s*\(\s*[cсCС]таном на [\d.]+\s*\)\s*$")
+
+
+def normalize_column(name):
+    """Прибирає дату зрізу "(cтаном на dd.mm.yyyy)" і зайві пробіли/переноси з назви колонки."""
+    name = _DATE_SUFFIX.sub("", str(name))
+    return re.sub(r"\s+", " ", name).strip()
+
+
+def fix_kved_code(value, width):
+    """
+    Коди, що пройшли через float у старих CSV: "1" -> "01", "1.1" (клас) -> "01.10".
+    width — кількість цифр після крапки (група 1, клас 2).
+    """
+    if not value or not re.fullmatch(r"\d{1,2}(\.\d{1,2})?", value):
+        return value
+    head, _, tail = value.partition(".")
+    return head.zfill(2) + ("." + tail.ljust(width, "0") if width else "")
+
+
+def normalize_row(row):
+    out = {}
+    for k, v in row.items():
+        key = normalize_column(k)
+        if key not in out or out[key] in (None, ""):
+            out[key] = None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v)
+    for col, width in (("CHAPTER_CODE", 0), ("GROUP_CODE", 1), ("CLASS_CODE", 2)):
+        if out.get(col):
+            out[col] = fix_kved_code(out[col], width)
+    return out
+
+
+def _partition_dir(root, row):
+    return os.path.join(root, *(f"{c}={row.get(c) or '_'}" for c in PARTITION_COLS))
+
+
+def _table(rows, columns):
+    return pa.table({c: pa.array([r.get(c) for r in rows], type=pa.string()) for c in columns})
+
+
+class KvedDatasetWriter:
+    def __init__(self, root=KVED_DATASET_DIR, max_buffer_rows=KVED_BUFFER_ROWS,
+                 rows_per_file=KVED_ROWS_PER_FILE, max_open_files=KVED_MAX_OPEN_FILES):
+        self.root = root
+        self.max_buffer_rows = max_buffer_rows
+        self.rows_per_file = rows_per_file
+        self.max_open_files = max_open_files
+        self.buffers = {}           # partition dir -> [row]
+        self.files = OrderedDict()  # partition dir -> відкритий part-файл, останній — найсвіжіший
+        self.rows_written = 0
+        os.makedirs(root, exist_ok=True)
+        if PYARROW_AVAILABLE:
+            self._recover()
+
+    def write(self, rows):
+        """Буферизує рядки. True — якщо якийсь буфер при цьому записано на диск."""
+        flushed = False
+        for row in rows:
+            row = normalize_row(row)
+            key = _partition_dir(self.root, row)
+            buf = self.buffers.setdefault(key, [])
+            buf.append(row)
+            if len(buf) >= self.max_buffer_rows:
+                self._flush_one(key)
+                flushed = True
+        return flushed
+
+    def buffered(self):
+        return sum(len(b) for b in self.buffers.values())
+
+    def flush(self):
+        for key in list(self.buffers):
+            self._flush_one(key)
+
+    def close(self):
+        """flush() і закриття всіх part-файлів (-> part-N.parquet). Writer лишається придатним."""
+        self.flush()
+        while self.files:
+            self._close_file(next(iter(self.files)))
+
+    def _flush_one(self, key):
+        rows = self.buffers.pop(key, None)
+        if not rows:
+            return
+        if PYARROW_AVAILABLE:
+            self._write_parquet(key, rows)
+        else:
+            self._write_csv(rows)
+        self.rows_written += len(rows)
+
+    def _recover(self):
+        """part-N.jsonl, що лишився після падіння -> part-N.parquet."""
+        for jsonl in sorted(glob.glob(os.path.join(self.root, "**", "part-*.jsonl"), recursive=True)):
+            if not re.fullmatch(r"part-\d+\.jsonl", os.path.basename(jsonl)):
+                continue
+            base = jsonl[:-len(".jsonl")]
+            rows = []
+            with open(jsonl, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass    # обрізаний останній рядок — сторінку ще не позначено done
+            if rows:
+                columns = {}
+                for row in rows:
+                    columns.update(dict.fromkeys(row))
+                pq.write_table(_table(rows, columns), base + ".parquet.tmp")
+                os.replace(base + ".parquet.tmp", base + ".parquet")
+            for leftover in (base + ".parquet.inprogress", jsonl):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            print(f"[kved_output] Відновлено {len(rows)} рядків незакритого part-файлу -> {base}.parquet")
+
+    def _open_file(self, key, columns):
+        os.makedirs(key, exist_ok=True)
+        seqs = [int(m.group(1)) for m in (re.match(r"part-(\d+)\.", f) for f in os.listdir(key)) if m]
+        base = os.path.join(key, f"part-{max(seqs, default=-1) + 1:06d}")
+        schema = pa.schema([(c, pa.string()) for c in columns])
+        self.files[key] = {"base": base, "schema": schema, "rows": 0,
+                           "writer": pq.ParquetWriter(base + ".parquet.inprogress", schema),
+                           "journal": open(base + ".jsonl", "a", encoding="utf-8")}
+        if len(self.files) > self.max_open_files:
+            self._close_file(next(iter(self.files)))
+        return self.files[key]
+
+    def _close_file(self, key):
+        f = self.files.pop(key)
+        f["writer"].close()
+        os.replace(f["base"] + ".parquet.inprogress", f["base"] + ".parquet")
+        f["journal"].close()
+        os.remove(f["base"] + ".jsonl")
+
+    def _write_parquet(self, key, rows):
+        f = self.files.get(key)
+        columns = dict.fromkeys(f["schema"].names) if f is not None else {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        if f is not None and (len(columns) > len(f["schema"].names) or f["rows"] >= self.rows_per_file):
+            self._close_file(key)
+            f = None
+        if f is None:
+            f = self._open_file(key, list(columns))
+        self.files.move_to_end(key)
+        for row in rows:
+            f["journal"].write(json.dumps(row, ensure_ascii=False) + "\n")
+        f["journal"].flush()
+        os.fsync(f["journal"].fileno())
+        f["writer"].write_table(_table(rows, f["schema"].names), row_group_size=len(rows))
+        f["rows"] += len(rows)
+
+    def _write_csv(self, rows):
+        """Фолбек: один rolling CSV на клас; нова колонка -> файл переписується з ширшим заголовком."""
+        path = os.path.join(self.root, f"kved_{rows[0].get('CLASS_CODE') or '_'}.csv")
+        df = pd.DataFrame(rows)
+        if os.path.exists(path):
+            header = list(pd.read_csv(path, nrows=0).columns)
+            if set(df.columns) - set(header):
+                old = pd.read_csv(path, dtype=str)
+                pd.concat([old, df], ignore_index=True).to_csv(path, index=False)
+                return
+            df.reindex(columns=header).to_csv(path, mode="a", index=False, header=False)
+        else:
+            df.to_csv(path, index=False)
+
+
+def load_kved_dataset(root=KVED_DATASET_DIR, class_code=None):
+    """Весь датасет (або один клас) в один DataFrame з об'єднанням колонок part-файлів."""
+    pattern = "**/*.parquet" if class_code is None else f"**/CLASS_CODE={class_code}/*.parquet"
+    files = sorted(glob.glob(os.path.join(root, pattern), recursive=True))
+    if files and PYARROW_AVAILABLE:
+        return pa.concat_tables([pq.read_table(f) for f in files], promote_options="default").to_pandas()
+    pattern = "kved_*.csv" if class_code is None else f"kved_{class_code}.csv"
+    csvs = sorted(glob.glob(os.path.join(root, pattern)))
+    if not csvs:
+        return pd.DataFrame()
+    return pd.concat([pd.read_csv(f, dtype=str) for f in csvs], ignore_index=True)
+
+
+def compact_csvs(paths, root=KVED_DATASET_DIR, delete=False, chunk_files=500):
+    """Зливає старі batch-CSV у датасет з уніфікацією колонок. Повертає кількість рядків."""
+    writer = KvedDatasetWriter(root, max_buffer_rows=50000)
+    total = 0
+    done = []
+    for i, path in enumerate(paths, 1):
+        try:
+            df = pd.read_csv(path, dtype=str)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            print(f"[!] Пропускаю {path}: {e}")
+            continue
+        writer.write(df.to_dict("records"))
+        total += len(df)
+        done.append(path)
+        if i % chunk_files == 0:
+            writer.flush()
+            print(f"  {i}/{len(paths)} файлів, {total} рядків")
+    writer.close()
+    if delete:
+        for path in done:
+            os.remove(path)
+    return total
+
+
+def _expand(patterns):
+    paths = []
+    for p in patterns:
+        paths.extend(sorted(glob.glob(p)) if any(ch in p for ch in "*?[") else [p])
+    # файл, що підпав під кілька glob-ів, — один раз
+    return list(dict.fromkeys(p for p in paths if os.path.isfile(p)))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="KVED output dataset")
+    ap.add_argument("command", choices=["compact", "stats"])
+    ap.add_argument("files", nargs="*", help=f"CSV або glob-и (за замовчуванням {' '.join(LEGACY_CSV_GLOBS)})")
+    ap.add_argument("--out", default=KVED_DATASET_DIR)
+    ap.add_argument("--delete", action="store_true", help="видалити CSV після успішного злиття")
+    args = ap.parse_args()
+
+    if args.command == "compact":
+        paths = _expand(args.files or LEGACY_CSV_GLOBS)
+        print(f"Файлів: {len(paths)} -> {args.out}")
+        print(f"Рядків злито: {compact_csvs(paths, args.out, args.delete)}")
+    df = load_kved_dataset(args.out)
+    print(f"{args.out}: {len(df)} рядків, {len(df.columns)} колонок, "
+          f"{df['CLASS_CODE'].nunique() if 'CLASS_CODE' in df else 0} класів")
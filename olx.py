@@ -129,8 +129,14 @@ import random
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+import argparse
+import sys
 from tqdm import tqdm
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from html_cache import HtmlCache, HTML_CACHE_DIR
+from proxy_pool import ProxyPool
+
 # ========= Константы =========
 HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
@@ -149,6 +155,11 @@ USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
 ]
 
+HTML_CACHE = None   # HtmlCache: --cache сохраняет ответы, --replay читает только из него
+REPLAY = False      # без сети и пауз, результат в olx_<category>.replay.json
+PROXY_POOL = None   # ProxyPool: --proxies FILE, у каждого прокси своя requests.Session (cookies)
+PROXY_STATS_FILE = "olx_proxy_stats.csv"
+
 # Локи для потоков
 file_lock = threading.Lock()
 count_lock = threading.Lock()
@@ -162,6 +173,38 @@ def save_data_to_file(file_name, new_entry):
         json.dump(new_entry, file, ensure_ascii=False)
         file.write('\n')
 
+def make_proxy_session(proxy):
+    session = requests.Session()
+    session.proxies = {"http": proxy, "https": proxy}
+    return session
+
+def proxied_get(url, headers):
+    """
+    GET напрямую или через здоровый прокси из PROXY_POOL; результат идёт в его статистику.
+    Ключ — имя потока: поток держится своего прокси (и его cookies), пока тот здоров.
+    """
+    proxy = PROXY_POOL.acquire_blocking(threading.current_thread().name) if PROXY_POOL is not None else None
+    if proxy is None:
+        return requests.get(url, headers=headers, timeout=10)
+    t0 = time.monotonic()
+    try:
+        resp = PROXY_POOL.session(proxy).get(url, headers=headers, timeout=10)
+    except Exception as e:
+        PROXY_POOL.report(proxy, None, time.monotonic() - t0, e)
+        raise
+    PROXY_POOL.report(proxy, resp.status_code, time.monotonic() - t0)
+    return resp
+
+def cached_get(url, headers):
+    """(status_code, body bytes). В режиме REPLAY — только из кэша, без сети."""
+    if REPLAY:
+        body = HTML_CACHE.get(url)
+        return (200, body) if body is not None else (404, b"")
+    resp = proxied_get(url, headers)
+    if resp.status_code == 200 and HTML_CACHE is not None:
+        HTML_CACHE.put(url, resp.content)
+    return resp.status_code, resp.content
+
 def get_data_by_id(ad_id, retries=3, delay=2):
     base_url = (
         '/www.olx.ua/api/v1/targeting/data/'
@@ -171,22 +214,26 @@ def get_data_by_id(ad_id, retries=3, delay=2):
 
     for attempt in range(1, retries + 1):
         try:
-            resp = requests.get(base_url, headers=headers, timeout=10)
-            if resp.status_code != 200:
+            status, body = cached_get(base_url, headers)
+            if status != 200:
+                if REPLAY:
+                    return None
                 time.sleep(delay)
                 continue
 
-            data = resp.json()
+            data = json.loads(body)
             ad_url = data['data']['targeting'].get('ad_url')
             if not ad_url:
                 return None
 
-            page = requests.get(ad_url, headers=headers, timeout=10)
-            if page.status_code != 200:
+            status, page = cached_get(ad_url, headers)
+            if status != 200:
+                if REPLAY:
+                    return None
                 time.sleep(delay)
                 continue
 
-            soup = BeautifulSoup(page.text, 'html.parser')
+            soup = BeautifulSoup(page.decode('utf-8', 'replace'), 'html.parser')
             date_span = soup.find('span', {'data-cy': 'ad-posted-at'})
             date_text = date_span.text.strip() if date_span else ""
             desc_div = soup.find('div', {'data-testid': 'ad_description'}) 
@@ -199,6 +246,8 @@ def get_data_by_id(ad_id, retries=3, delay=2):
             data['data']['targeting']['attributes'] = attrs
             return data
         except Exception:
+            if REPLAY:
+                return None
             time.sleep(delay)
 
     return None
@@ -210,7 +259,8 @@ def process_category(category, max_workers=8, limit=None):
     if limit:
         ids = ids[:limit]
 
-    json_path = os.path.join(directory + category + '/', f'olx_{category}.json')
+    suffix = '.replay' if REPLAY else ''
+    json_path = os.path.join(directory + category + '/', f'olx_{category}{suffix}.json')
     # очистка файла
     open(json_path, 'w').close()
 
@@ -233,8 +283,27 @@ def process_category(category, max_workers=8, limit=None):
     pbar.close()
 
 if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description="OLX ad parser")
+    ap.add_argument("--cache", nargs="?", const=HTML_CACHE_DIR, default=None,
+                    help="сохранять ответы API и страницы объявлений в общий HTML-кэш")
+    ap.add_argument("--replay", nargs="?", const=HTML_CACHE_DIR, default=None,
+                    help="без сети: перепарсить объявления из HTML-кэша")
+    ap.add_argument("--proxies", default=None,
+                    help="файл прокси (строка 'host:port [cap]'), см. proxy_pool.py")
+    args = ap.parse_args()
+    if args.replay or args.cache:
+        HTML_CACHE = HtmlCache(args.replay or args.cache)
+    REPLAY = bool(args.replay)
+    if args.proxies and not REPLAY:
+        PROXY_POOL = ProxyPool.from_file(args.proxies, session_factory=make_proxy_session)
+
     # Для всех категорий
     categories = ['houses', 'commercials', 'garages', 'flats', 'lands']
     for cat in categories:
         print(f"Запуск парсинга категории: {cat}")
-        process_category(cat, max_workers=8, limit=200)
\ No newline at end of file
+        process_category(cat, max_workers=8, limit=200)
+        if PROXY_POOL is not None:
+            PROXY_POOL.export_stats(PROXY_STATS_FILE)
+            print(f"Прокси: {PROXY_POOL.summary()} → {PROXY_STATS_FILE}")
+    if PROXY_POOL is not None:
+        PROXY_POOL.close_sessions()
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Спільний менеджер проксі для uBKI / YouControl / OLX.
+
+- Здоров'я кожного проксі: EWMA латентності і частки успішних відповідей.
+- Circuit breaker: бан (403 / 429 / челендж) або PROXY_FAILURE_THRESHOLD помилок поспіль —
+  проксі "відкритий" PROXY_OPEN_SECONDS (кожне наступне відкриття поспіль — удвічі довше, до
+  PROXY_MAX_OPEN_SECONDS). Після паузи — одна пробна спроба (half-open): успіх закриває, невдача
+  відкриває знову.
+- Вибір: випадковий, зважений success_ewma^2 / latency_ewma серед закритих проксі з вільним
+  слотом (ліміт одночасних запитів на проксі, cap).
+- Sticky: key (воркер, домен, ...) тримається свого проксі, поки той здоровий; session(proxy) —
+  окремий клієнт зі своїм cookie jar на кожен проксі (cf_clearance і сесійні cookies прив'язані до IP).
+- stats() / export_stats(path) — знімок по кожному проксі, CSV або JSON.
+
+Порожній список — прямі запити: acquire() повертає None, report(None, ...) нічого не робить,
+тож код викликача однаковий з проксі і без. Потокобезпечний: acquire() для asyncio,
+acquire_blocking() для потоків (requests).
+
+Файл проксі (load_proxy_file / ProxyPool.from_file): рядок "host:port", "user:pass@host:port"
+або "scheme://...", через пробіл — необов'язковий cap; # — коментар.
+"""
+import asyncio, csv, json, logging, os, random, re, threading, time
+
+logger = logging.getLogger(__name__)
+
+PROXY_MAX_INFLIGHT = 2           # одночасних запитів на проксі, якщо cap не вказано
+PROXY_EWMA_ALPHA = 0.2           # вага нового спостереження в EWMA
+PROXY_DEFAULT_LATENCY = 1.0      # сек, стартова оцінка латентності
+PROXY_FAILURE_THRESHOLD = 3      # помилок поспіль до відкриття circuit-а
+PROXY_OPEN_SECONDS = 60          # перше відкриття
+PROXY_MAX_OPEN_SECONDS = 30 * 60
+PROXY_MIN_WEIGHT = 0.01          # навіть слабкий проксі зрідка отримує запит
+PROXY_POLL_INTERVAL = 0.2        # сек між перевірками, коли вільних проксі немає
+BAN_STATUSES = (403, 429)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def load_proxy_file(path, default_cap=PROXY_MAX_INFLIGHT):
+    """{proxy_url: cap} з файлу проксі."""
+    caps = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            raw = line.strip()
+            if not raw or raw.startswith("#"):
+                continue
+            parts = raw.split()
+            url = parts[0] if "://" in parts[0] else f"http://{parts[0]}"
+            caps[url] = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else default_cap
+    return caps
+
+
+def mask_proxy(url):
+    """Пароль проксі не потрапляє в логи і статистику."""
+    return re.sub(r"(://[^:/@]+):[^@]+@", r"\1:***@", url or "")
+
+
+class ProxyState:
+    def __init__(self, url, cap):
+        self.url = url
+        self.cap = max(1, int(cap))
+        self.state = CLOSED
+        self.inflight = 0
+        self.requests = self.successes = self.failures = self.bans = 0
+        self.success_ewma = 1.0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.opened = 0                 # відкриттів поспіль (скидається успіхом)
+        self.open_until = 0.0
+        self.last_error = ""
+
+    def weight(self):
+        latency = self.latency_ewma if self.latency_ewma is not None else PROXY_DEFAULT_LATENCY
+        return max(self.success_ewma ** 2 / max(latency, 0.05), PROXY_MIN_WEIGHT)
+
+
+class ProxyPool:
+    def __init__(self, proxies=(), default_cap=PROXY_MAX_INFLIGHT, session_factory=None,
+                 alpha=PROXY_EWMA_ALPHA, failure_threshold=PROXY_FAILURE_THRESHOLD,
+                 open_seconds=PROXY_OPEN_SECONDS, max_open_seconds=PROXY_MAX_OPEN_SECONDS,
+                 ban_statuses=BAN_STATUSES):
+        """
+        proxies — список URL або {url: cap}. session_factory(proxy) -> клієнт з власним cookie jar
+        (httpx.AsyncClient(proxy=...), requests.Session, ...) для session(proxy).
+        """
+        caps = proxies if isinstance(proxies, dict) else {p: default_cap for p in proxies}
+        self.proxies = {url: ProxyState(url, cap) for url, cap in caps.items()}
+        self.session_factory = session_factory
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.ban_statuses = tuple(ban_statuses)
+        self.sticky = {}                # key -> proxy url
+        self.sessions = {}              # proxy url -> клієнт
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, default_cap=PROXY_MAX_INFLIGHT, **kwargs):
+        return cls(load_proxy_file(path, default_cap), default_cap=default_cap, **kwargs)
+
+    @property
+    def enabled(self):
+        return bool(self.proxies)
+
+    def capacity(self):
+        return sum(st.cap for st in self.proxies.values())
+
+    # --- вибір ---
+    def _usable(self, st, now):
+        if st.state == OPEN:
+            if now < st.open_until:
+                return False
+            st.state = HALF_OPEN
+        if st.state == HALF_OPEN:
+            return st.inflight == 0     # лише одна пробна спроба
+        return st.inflight < st.cap
+
+    def try_acquire(self, key=None):
+        """-> (proxy, 0) або (None, сек до наступної спроби). Лише для enabled-пулу."""
+        now = time.monotonic()
+        with self._lock:
+            st = self.proxies.get(self.sticky.get(key)) if key is not None else None
+            if st is None or not self._usable(st, now):
+                usable = [s for s in self.proxies.values() if self._usable(s, now)]
+                if not usable:
+                    opens = [s.open_until - now for s in self.proxies.values() if s.state == OPEN]
+                    return None, min([PROXY_POLL_INTERVAL] + [max(w, 0.01) for w in opens])
+                st = random.choices(usable, weights=[s.weight() for s in usable])[0]
+                if key is not None:
+                    self.sticky[key] = st.url
+            st.inflight += 1
+            st.requests += 1
+            return st.url, 0
+
+    async def acquire(self, key=None):
+        """Проксі з вільним слотом (чекає, якщо всі зайняті / відкриті); None — пул порожній."""
+        if not self.proxies:
+            return None
+        while True:
+            proxy, wait = self.try_acquire(key)
+            if proxy is not None:
+                return proxy
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, key=None):
+        if not self.proxies:
+            return None
+        while True:
+            proxy, wait = self.try_acquire(key)
+            if proxy is not None:
+                return proxy
+            time.sleep(wait)
+
+    # --- результат ---
+    def report(self, proxy, status=None, latency=None, error=None, banned=None):
+        """
+        Звільняє слот і оновлює здоров'я. status None + error — мережева помилка / таймаут.
+        banned — явно (наприклад, челендж Cloudflare з кодом 200); інакше за ban_statuses.
+        404 вважається успіхом: проксі відповів, сторінки просто немає.
+        """
+        if proxy is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            st = self.proxies.get(proxy)
+            if st is None:
+                return
+            st.inflight = max(0, st.inflight - 1)
+            if banned is None:
+                banned = status in self.ban_statuses
+            ok = status is not None and not banned and (status < 400 or status == 404)
+            st.success_ewma = self.alpha * ok + (1 - self.alpha) * st.success_ewma
+            if status is not None and latency is not None:
+                st.latency_ewma = latency if st.latency_ewma is None else \
+                    self.alpha * latency + (1 - self.alpha) * st.latency_ewma
+            if ok:
+                st.successes += 1
+                st.consecutive_failures = 0
+                st.opened = 0
+                st.state = CLOSED
+                return
+            st.failures += 1
+            st.consecutive_failures += 1
+            st.last_error = f"HTTP {status}" if status is not None else (repr(error)[:200] if error else "error")
+            if banned:
+                st.bans += 1
+            if st.state == OPEN:
+                return      # запит стартував до відкриття — паузу не подовжуємо
+            if banned or st.state == HALF_OPEN or st.consecutive_failures >= self.failure_threshold:
+                self._open(st, now)
+
+    def _open(self, st, now):
+        st.opened += 1
+        pause = min(self.open_seconds * 2 ** (st.opened - 1), self.max_open_seconds)
+        st.state = OPEN
+        st.open_until = now + pause
+        for key in [k for k, url in self.sticky.items() if url == st.url]:
+            del self.sticky[key]
+        logger.warning(f"Proxy {mask_proxy(st.url)} open for {pause:.0f}s ({st.last_error}, "
+                       f"{st.consecutive_failures} failures in a row)")
+
+    # --- сесії ---
+    def session(self, proxy):
+        """Клієнт, прив'язаний до проксі (створюється session_factory один раз)."""
+        with self._lock:
+            client = self.sessions.get(proxy)
+            if client is None:
+                client = self.sessions[proxy] = self.session_factory(proxy)
+            return client
+
+    def close_sessions(self):
+        for client in self.sessions.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        self.sessions.clear()
+
+    async def aclose(self):
+        for client in self.sessions.values():
+            try:
+                if hasattr(client, "aclose"):
+                    await client.aclose()
+                else:
+                    await client.close()
+            except Exception:
+                pass
+        self.sessions.clear()
+
+    # --- статистика ---
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "proxy": mask_proxy(st.url),
+                "state": st.state,
+                "cap": st.cap,
+                "inflight": st.inflight,
+                "requests": st.requests,
+                "successes": st.successes,
+                "failures": st.failures,
+                "bans": st.bans,
+                "success_ewma": round(st.success_ewma, 3),
+                "latency_ewma_ms": round(st.latency_ewma * 1000) if st.latency_ewma is not None else None,
+                "open_for_s": round(max(st.open_until - now, 0), 1) if st.state == OPEN else 0,
+                "last_error": st.last_error,
+            } for st in self.proxies.values()]
+
+    def summary(self):
+        states = [st.state for st in self.proxies.values()]
+        return (f"proxies {len(states)}: closed {states.count(CLOSED)}, open {states.count(OPEN)}, "
+                f"half-open {states.count(HALF_OPEN)}")
+
+    def export_stats(self, path):
+        """Знімок stats() у path: .json — JSON, інакше CSV. Атомарно."""
+        rows = self.stats()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            if path.endswith(".json"):
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            else:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["proxy"])
+                writer.writeheader()
+                writer.writerows(rows)
+        os.replace(tmp, path)
+        return path
@@ -0,0 +1,125 @@
+"""
+Регресійний бенчмарк: скільки HTTP-запитів робить UBKIParser на одну компанію.
+
+Піднімає локальний fixture-сервер (fixtures/ubki_company.html на будь-який /ua/<edrpou>),
+проганяє UBKIParser по N синтетичних ЄДРПОУ і рахує:
+  - звернення до fixture-сервера по кожному ЄДРПОУ;
+  - всі вихідні запити через httpx / requests (cloudscraper) — щоб зловити
+    повторні завантаження сторінки повз сервер (як було в parse_ubki_universal).
+Очікується рівно 1 запит на ЄДРПОУ, інакше exit code 1.
+
+Запуск: python bench_http_calls.py [N]
+"""
+import asyncio, os, sys, tempfile, threading, time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(HERE, "fixtures", "ubki_company.html")
+
+server_hits = Counter()
+outbound_urls = Counter()
+_hits_lock = threading.Lock()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    body = b""
+
+    def do_GET(self):
+        with _hits_lock:
+            server_hits[self.path] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fixture_server():
+    with open(FIXTURE, "rb") as f:
+        FixtureHandler.body = f.read()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def patch_outbound_counters():
+    """Рахуємо кожен вихідний запит, незалежно від того, куди він іде."""
+    import httpx
+    orig_send = httpx.AsyncClient.send
+
+    async def counting_send(self, request, *args, **kwargs):
+        outbound_urls[str(request.url)] += 1
+        return await orig_send(self, request, *args, **kwargs)
+
+    httpx.AsyncClient.send = counting_send
+
+    try:
+        import requests
+    except Exception:
+        return
+    orig_req_send = requests.Session.send
+
+    def counting_req_send(self, request, **kwargs):
+        outbound_urls[request.url] += 1
+        return orig_req_send(self, request, **kwargs)
+
+    requests.Session.send = counting_req_send
+
+
+def main(n: int = 50):
+    # чекпоінт / лог / csv пишуться в cwd — ізолюємо прогін у тимчасовій папці
+    workdir = tempfile.mkdtemp(prefix="ubki_bench_")
+    os.chdir(workdir)
+
+    import fetcher
+    import orchestrator
+
+    server = start_fixture_server()
+    port = server.server_address[1]
+
+    async def no_delay(*args, **kwargs):
+        return None
+
+    orchestrator.BASE_URL_TEMPLATE = f"http://127.0.0.1:{port}/ua/{{edrpou}}"
+    orchestrator.REALISTIC_PREFETCH_PROB = 0
+    fetcher.human_delay = no_delay
+    patch_outbound_counters()
+
+    edrpous = [str(10000000 + i) for i in range(n)]
+    parser = orchestrator.UBKIParser(edrpous)
+
+    t0 = time.perf_counter()
+    asyncio.run(parser.run())
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+
+    per_edrpou = [server_hits.get(f"/ua/{e}", 0) for e in edrpous]
+    total_outbound = sum(outbound_urls.values())
+    done = parser.store.counts().get("done", 0)
+
+    print(f"EDRPOU:                 {n} (done: {done})")
+    print(f"fixture hits total:     {sum(per_edrpou)}")
+    print(f"fixture hits / EDRPOU:  min={min(per_edrpou)} max={max(per_edrpou)}")
+    print(f"outbound HTTP total:    {total_outbound} ({total_outbound / n:.2f} / EDRPOU)")
+    print(f"elapsed:                {elapsed:.2f}s ({n / elapsed:.1f} companies/s)")
+    print(f"workdir:                {workdir}")
+
+    foreign = {u: c for u, c in outbound_urls.items() if not u.startswith(f"http://127.0.0.1:{port}/")}
+    if foreign:
+        print("[X] Запити повз fixture-сервер:")
+        for u, c in foreign.items():
+            print(f"    {c:>4}  {u}")
+
+    if max(per_edrpou) > 1 or total_outbound > n:
+        print("[X] REGRESSION: більше одного HTTP-запиту на ЄДРПОУ")
+        return 1
+    print("[OK] 1 HTTP-запит на ЄДРПОУ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
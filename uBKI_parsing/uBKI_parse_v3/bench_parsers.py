@@ -0,0 +1,63 @@
+"""
+Мікробенчмарк бекендів парсера: ms/page на побудову DOM і на кожен блок окремо.
+
+Запуск: python bench_parsers.py [corpus_dir] [repeats]    (за замовчуванням fixtures/, 20)
+"""
+import sys, time
+
+import parser_blocks
+import parser_blocks_lxml
+from parity_check import DEFAULT_CORPUS, load_corpus
+
+BACKENDS = {
+    "bs4": parser_blocks,
+    "lxml": parser_blocks_lxml,
+}
+
+
+def bench_backend(module, pages, repeats):
+    """{stage: сумарний час у секундах} по всіх сторінках і повторах."""
+    totals = {"dom": 0.0, **{name: 0.0 for name, _ in module.BLOCKS}}
+    for _ in range(repeats):
+        for edrpou, html in pages:
+            t0 = time.perf_counter()
+            doc = module.make_document(html)
+            totals["dom"] += time.perf_counter() - t0
+            for name, block in module.BLOCKS:
+                t0 = time.perf_counter()
+                try:
+                    block(doc, edrpou)
+                except Exception:
+                    pass
+                totals[name] += time.perf_counter() - t0
+    return totals
+
+
+def main(corpus_dir=DEFAULT_CORPUS, repeats=20):
+    pages = []
+    for edrpou, path in load_corpus(corpus_dir):
+        with open(path, "rb") as f:
+            pages.append((edrpou, f.read()))
+    if not pages:
+        print(f"[!] Порожній корпус: {corpus_dir}")
+        return 1
+
+    n = len(pages) * repeats
+    results = {name: bench_backend(module, pages, repeats) for name, module in BACKENDS.items()}
+    stages = list(results["bs4"])
+
+    print(f"Сторінок: {len(pages)} x {repeats} повторів, ms/page")
+    print(f"{'stage':<12}" + "".join(f"{b:>12}" for b in BACKENDS) + f"{'speedup':>10}")
+    for stage in stages + ["TOTAL"]:
+        row = {
+            b: (sum(results[b].values()) if stage == "TOTAL" else results[b][stage]) * 1000 / n
+            for b in BACKENDS
+        }
+        speedup = row["bs4"] / row["lxml"] if row["lxml"] else float("inf")
+        print(f"{stage:<12}" + "".join(f"{row[b]:>12.3f}" for b in BACKENDS) + f"{speedup:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(args[0] if args else DEFAULT_CORPUS, int(args[1]) if len(args) > 1 else 20))
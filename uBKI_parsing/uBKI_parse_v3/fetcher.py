@@ -1,4 +1,6 @@
 import asyncio, random, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import httpx
 from bs4 import BeautifulSoup
 from typing import Optional
@@ -8,6 +10,9 @@ try:
 except Exception:
     CLOUDSCRAPER_AVAILABLE = False
 
+SCRAPER_POOL_SIZE = 4            # скільки "прогрітих" cloudscraper-сесій тримати одночасно
+SCRAPER_MAX_FAILURES = 3         # стільки невдач поспіль — сесію викидаємо
+SCRAPER_MAX_IDLE = 20 * 60       # сек; довше без успіху — clearance, найімовірніше, протух
 REALISTIC_PREFETCH_PROB = 0.12   # ймовірність робити "реалістичний трафік" перед запитом
 MOBILE_UA_PROB = 0.25   
 MOBILE_USER_AGENTS = [
@@ -42,6 +47,134 @@ def get_scraper_with_cookies(existing_cookies: dict = None):
     return scraper
 
 
+class ScraperPool:
+    """
+    Обмежений пул прогрітих cloudscraper-сесій для фолбеку fetch_page.
+
+    Сесія створюється (і проходить челендж) один раз, далі перевикористовується.
+    Вільні сесії лежать в OrderedDict у порядку останнього успіху: беремо найсвіжішу,
+    з LRU-кінця викидаємо ті, що SCRAPER_MAX_FAILURES разів поспіль впали або
+    простояли без успіху довше SCRAPER_MAX_IDLE. Після успіху cookies сесії
+    (cf_clearance та ін.) копіюються в httpx.AsyncClient — наступні запити йдуть
+    основним шляхом без фолбеку.
+
+    Сесія прив'язана до проксі, з яким її створили (cf_clearance дійсний лише для того IP):
+    get(proxy=...) бере лише сесію цього проксі, прямі сесії — лише для прямих запитів.
+    """
+
+    def __init__(self, size=SCRAPER_POOL_SIZE, max_failures=SCRAPER_MAX_FAILURES, max_idle=SCRAPER_MAX_IDLE):
+        self.size = size
+        self.max_failures = max_failures
+        self.max_idle = max_idle
+        self.idle = OrderedDict()       # id -> entry, останній — найсвіжіший успіх
+        self.total = 0                  # створені й не викинуті (вільні + зайняті)
+        self.created = self.evicted = 0
+        self.user_agent = None          # UA останньої успішної сесії: cf_clearance прив'язаний до нього
+        self._sem = asyncio.Semaphore(size)
+        # власний executor: фолбек не відбирає потоки в дефолтного пулу
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="scraper")
+
+    def _evict(self, entry):
+        self.total -= 1
+        self.evicted += 1
+        try:
+            entry["scraper"].close()
+        except Exception:
+            pass
+
+    def _take(self, proxy=None):
+        now = time.monotonic()
+        # LRU-кінець: найдовше без успіху
+        for key in list(self.idle):
+            entry = self.idle[key]
+            if now - entry["last_ok"] > self.max_idle:
+                del self.idle[key]
+                self._evict(entry)
+        for key in reversed(self.idle):
+            if self.idle[key]["proxy"] == proxy:
+                return self.idle.pop(key)
+        # сесії іншого проксі не підходять; щоб пул не ріс із кількістю проксі — звільняємо LRU
+        if self.total >= self.size and self.idle:
+            _, entry = self.idle.popitem(last=False)
+            self._evict(entry)
+        return None
+
+    async def get(self, url, cookies, client=None, timeout=20, proxy=None):
+        """
+        GET через сесію з пулу. Повертає requests.Response або None (cloudscraper
+        недоступний / сесія впала). cookies — спільний dict сесійних cookies парсера,
+        client — httpx.AsyncClient, куди після успіху копіюються cookies сесії.
+        proxy — URL проксі: запит іде через нього (proxies=), а clearance і UA цієї сесії
+        не потрапляють у спільні cookies / user_agent прямого шляху — лише в client (клієнт проксі).
+        """
+        if not CLOUDSCRAPER_AVAILABLE:
+            return None
+        loop = asyncio.get_running_loop()
+        proxies = {"http": proxy, "https": proxy} if proxy else None
+        async with self._sem:
+            entry = self._take(proxy)
+            if entry is None:
+                seed = cookies if proxy is None else {k: v for k, v in cookies.items() if k != "cf_clearance"}
+                scraper = await loop.run_in_executor(self._executor, get_scraper_with_cookies, seed)
+                if scraper is None:
+                    return None
+                entry = {"id": self.created, "scraper": scraper, "proxy": proxy, "failures": 0,
+                         "last_ok": time.monotonic()}
+                self.created += 1
+                self.total += 1
+
+            try:
+                resp = await loop.run_in_executor(
+                    self._executor, lambda: entry["scraper"].get(url, timeout=timeout, proxies=proxies))
+                ok = resp.status_code == 200
+            except Exception:
+                resp, ok = None, False
+
+            if ok:
+                entry["failures"] = 0
+                entry["last_ok"] = time.monotonic()
+                if proxy is None:
+                    self.user_agent = entry["scraper"].headers.get("User-Agent")
+                self._share_cookies(entry["scraper"], client, cookies if proxy is None else None)
+            else:
+                entry["failures"] += 1
+            if entry["failures"] >= self.max_failures:
+                self._evict(entry)
+            else:
+                self.idle[entry["id"]] = entry
+                self.idle.move_to_end(entry["id"], last=ok)
+            return resp
+
+    @staticmethod
+    def _share_cookies(scraper, client, cookies):
+        """Cookies сесії (разом із cf_clearance) -> спільний dict (якщо є) і cookie jar httpx-клієнта."""
+        for c in scraper.cookies:
+            if cookies is not None:
+                cookies[c.name] = c.value
+            if client is not None:
+                client.cookies.set(c.name, c.value, domain=c.domain or "", path=c.path or "/")
+
+    def stats(self):
+        return {"size": self.total, "idle": len(self.idle), "created": self.created, "evicted": self.evicted}
+
+    def close(self):
+        while self.idle:
+            _, entry = self.idle.popitem()
+            self._evict(entry)
+        self._executor.shutdown(wait=False)
+
+
+_default_scraper_pool = None
+
+
+def default_scraper_pool():
+    """Спільний пул на процес для викликів fetch_page без явного scraper_pool."""
+    global _default_scraper_pool
+    if _default_scraper_pool is None:
+        _default_scraper_pool = ScraperPool()
+    return _default_scraper_pool
+
+
 async def human_delay(base: float = 0.6, var: float = 1.5):
     """
     Імітація людської затримки перед читанням сторінки.
@@ -110,15 +243,51 @@ async def realistic_prefetch(client: "httpx.AsyncClient", realistic_prefer_prob)
             pass
 
 
+async def _get_via(client, url, headers, proxy_pool, proxy):
+    """GET напряму (proxy None) або клієнтом проксі; результат одразу йде в статистику проксі,
+    тож слот звільняється до паузи ретраю, а пауза не потрапляє в латентність."""
+    if proxy is None:
+        return await client.get(url, headers=headers, timeout=20)
+    t0 = time.monotonic()
+    try:
+        resp = await proxy_pool.session(proxy).get(url, headers=headers, timeout=20)
+    except Exception as e:
+        proxy_pool.report(proxy, None, time.monotonic() - t0, e)
+        raise
+    proxy_pool.report(proxy, resp.status_code, time.monotonic() - t0)
+    return resp
+
+
 # --- посильний ретрай у fetch_page ---
-async def fetch_page(client, url, cookies, attempt=1, max_attempts=3):
+async def fetch_page(client, url, cookies, attempt=1, max_attempts=3, as_bytes=False, limiter=None,
+                     scraper_pool=None, proxy_pool=None, proxy_key=None):
+    """
+    as_bytes=True — повертає сирі байти відповіді (для передачі в процес-парсер без перекодування).
+    limiter — AdaptiveLimiter (limiter.py): кожна спроба займає слот і звітує статус/латентність,
+    темп задає AIMD-ліміт, тож фіксовані human_delay / sleep між ретраями не потрібні.
+    Без limiter-а — стара поведінка з паузами.
+    scraper_pool — ScraperPool для фолбеку на cloudscraper (за замовчуванням спільний на процес).
+    proxy_pool — ProxyPool (../../proxy_pool.py): кожна спроба йде через зважено обраний здоровий
+    проксі його власним клієнтом (proxy_pool.session), статус/латентність — у статистику проксі.
+    Без нього чи з порожнім пулом — напряму через client.
+    proxy_key — ключ воркера: поки проксі здоровий, воркер лишається на ньому (і на його cookie jar).
+    """
+    pool = scraper_pool or default_scraper_pool()
     for att in range(1, max_attempts + 1):
-        await human_delay()
+        if limiter is None:
+            await human_delay()
+        else:
+            await limiter.acquire()
+        proxy = await proxy_pool.acquire(proxy_key) if proxy_pool is not None else None
         headers = rotate_browser_fingerprint()
+        if proxy is None and pool.user_agent and "cf_clearance" in cookies:
+            # clearance дійсний лише з тим UA (і IP), з яким його отримали
+            headers["User-Agent"] = pool.user_agent
+        status, t0 = None, time.monotonic()
         try:
-            resp = await client.get(url, headers=headers, timeout=20)
+            resp = await _get_via(client, url, headers, proxy_pool, proxy)
             status = resp.status_code
-            html = resp.text or ""
+            html = (resp.content if as_bytes else resp.text) or ""
 
             # Успіх
             if status == 200 and html.strip():
@@ -126,7 +295,8 @@ async def fetch_page(client, url, cookies, attempt=1, max_attempts=3):
 
             # Тимчасові помилки / бан — підретраїмо
             if status in (403, 429) or status >= 500:
-                await asyncio.sleep(random.uniform(1.5, 3.5) * att)
+                if limiter is None:
+                    await asyncio.sleep(random.uniform(1.5, 3.5) * att)
                 continue
 
             # 404/інше — сенсу ретраїти мало
@@ -134,16 +304,26 @@ async def fetch_page(client, url, cookies, attempt=1, max_attempts=3):
                 return None
 
         except Exception:
-            # один раз пробуємо cloudscraper як фолбек
+            # один раз пробуємо cloudscraper як фолбек — через проксі з пулу, як і основний запит:
+            # напряму він світив би реальний IP і обходив облік проксі
+            resp = fb_proxy = None
             if CLOUDSCRAPER_AVAILABLE:
-                scraper = await asyncio.get_event_loop().run_in_executor(None, get_scraper_with_cookies, cookies)
-                if scraper:
-                    try:
-                        html = await asyncio.get_event_loop().run_in_executor(None, lambda: scraper.get(url, timeout=20).text)
-                        cookies.update(scraper.cookies.get_dict())
-                        if html and html.strip():
-                            return html
-                    except Exception:
-                        pass
-            await asyncio.sleep(random.uniform(1.0, 2.5) * att)
+                fb_proxy = await proxy_pool.acquire(proxy_key) if proxy_pool is not None else None
+                try:
+                    fb_client = proxy_pool.session(fb_proxy) if fb_proxy else client
+                    resp = await pool.get(url, cookies, fb_client, proxy=fb_proxy)
+                finally:
+                    # латентність не пишемо: розв'язання челенджу спотворило б EWMA проксі
+                    if fb_proxy is not None:
+                        proxy_pool.report(fb_proxy, resp.status_code if resp is not None else None, None,
+                                          None if resp is not None else "cloudscraper fallback failed")
+            if resp is not None and resp.status_code == 200:
+                html = resp.content if as_bytes else resp.text
+                if html and html.strip():
+                    return html
+            if limiter is None:
+                await asyncio.sleep(random.uniform(1.0, 2.5) * att)
+        finally:
+            if limiter is not None:
+                await limiter.release(status, time.monotonic() - t0)
     return None
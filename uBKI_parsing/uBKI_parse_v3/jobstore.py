@@ -0,0 +1,206 @@
+"""
+Сховища задач для UBKIParser.
+
+MemoryJobStore  — один процес: черги в пам'яті + StatusJournal на диску (як раніше).
+SQLiteJobStore  — SQLite у WAL-режимі: кілька процесів main.py на одній машині
+                  атомарно забирають пачки ЄДРПОУ з однієї бази, стан не живе в пам'яті.
+
+Спільний інтерфейс:
+  claim_batch(n)  -> [(edrpou, meta)], meta["attempts"] вже збільшено, статус = in_progress
+  mark(edrpou, status, attempts, next_try_ts=None)   status: done / failed / not_found / retry
+                  done лише буферизується: на диск потрапляє у flush(), який викликається
+                  після дописування рядків у CSV — падіння не "загубить" оброблені, але не збережені компанії
+  next_due_in()   -> 0, якщо є що брати зараз; секунди до найближчого ретраю; None — роботи немає
+  counts()        -> {status: кількість}
+  flush(), close()
+"""
+import heapq, os, socket, sqlite3, time
+from collections import deque
+
+from utils import logger, StatusJournal
+
+JOBSTORE_DB = "ubki_jobs.sqlite"
+STALE_CLAIM_SECONDS = 30 * 60     # in_progress довше за це (процес упав) — повертаємо в pending
+STALE_CHECK_EVERY = 60            # сек між перевірками "завислих" задач
+
+
+class MemoryJobStore:
+    def __init__(self, edrpou_list, journal=None):
+        self.journal = journal or StatusJournal()
+        self.processed = self.journal.replay()
+        self.pending = deque()       # (edrpou, meta)
+        self._done = []              # (edrpou, attempts): done, які ще не в CSV — у журнал пише flush()
+        self.retry_heap = []         # (next_try_ts, edrpou, meta)
+        for e in edrpou_list:
+            meta = self.processed.get(e)
+            if meta is None:
+                self.pending.append((e, {"attempts": 0}))
+            elif meta["status"] in ("in_progress", "retry"):
+                # процес впав посеред задачі / до ретраю — беремо в роботу ще раз
+                self.pending.append((e, {"attempts": meta["attempts"]}))
+
+    def claim_batch(self, n):
+        now = time.time()
+        batch = []
+        while len(batch) < n and self.pending:
+            batch.append(self.pending.popleft())
+        while len(batch) < n and self.retry_heap and self.retry_heap[0][0] <= now:
+            _, e, meta = heapq.heappop(self.retry_heap)
+            batch.append((e, meta))
+        for e, meta in batch:
+            meta["attempts"] += 1
+            self.mark(e, "in_progress", meta["attempts"])
+        return batch
+
+    def mark(self, edrpou, status, attempts, next_try_ts=None):
+        self.processed[edrpou] = {"status": status, "attempts": attempts}
+        if status == "done":
+            self._done.append((edrpou, attempts))
+            return
+        self.journal.record(edrpou, status, attempts)
+        if status == "retry":
+            heapq.heappush(self.retry_heap, (next_try_ts or time.time(), edrpou, {"attempts": attempts}))
+
+    def next_due_in(self):
+        if self.pending:
+            return 0
+        if self.retry_heap:
+            return max(0.0, self.retry_heap[0][0] - time.time())
+        return None
+
+    def counts(self):
+        out = {}
+        for meta in self.processed.values():
+            out[meta["status"]] = out.get(meta["status"], 0) + 1
+        out["pending"] = len(self.pending)
+        return out
+
+    def flush(self):
+        for edrpou, attempts in self._done:
+            self.journal.record(edrpou, "done", attempts)
+        self._done.clear()
+        self.journal.sync()
+        if self.journal.needs_compaction(len(self.processed)):
+            self.journal.compact(self.processed)
+
+    def close(self):
+        self.journal.close()
+
+
+class SQLiteJobStore:
+    def __init__(self, path=JOBSTORE_DB, worker_id=None):
+        self.path = path
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        # autocommit: транзакції відкриваємо явно (BEGIN IMMEDIATE для claim)
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                edrpou      TEXT PRIMARY KEY,
+                status      TEXT NOT NULL DEFAULT 'pending',
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                next_try_ts REAL NOT NULL DEFAULT 0,
+                claimed_by  TEXT,
+                claimed_at  REAL,
+                updated_at  REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_try_ts);
+            CREATE INDEX IF NOT EXISTS jobs_claimed ON jobs (status, claimed_at);
+        """)
+        self._last_stale_check = 0.0
+        self._done = []              # done, які ще не в CSV цього процесу — комітить flush()
+
+    def seed(self, edrpou_list, chunk=10000):
+        """Ідемпотентно додає ЄДРПОУ (вже наявні не чіпає) — можна викликати з кожного процесу."""
+        added = 0
+        for i in range(0, len(edrpou_list), chunk):
+            rows = [(e,) for e in edrpou_list[i:i + chunk]]
+            self.conn.execute("BEGIN IMMEDIATE")
+            cur = self.conn.executemany("INSERT OR IGNORE INTO jobs (edrpou) VALUES (?)", rows)
+            self.conn.execute("COMMIT")
+            added += cur.rowcount
+        logger.info(f"Job store {self.path}: seeded {added} new EDRPOU")
+        return added
+
+    def reclaim_stale(self, older_than=STALE_CLAIM_SECONDS):
+        """in_progress від процесів, що впали, повертаємо в pending."""
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = 'pending', claimed_by = NULL "
+            "WHERE status = 'in_progress' AND claimed_at < ?",
+            (time.time() - older_than,),
+        )
+        if cur.rowcount:
+            logger.info(f"Job store: reclaimed {cur.rowcount} stale in_progress jobs")
+        self._last_stale_check = time.time()
+
+    def claim_batch(self, n):
+        now = time.time()
+        if now - self._last_stale_check > STALE_CHECK_EVERY:
+            self.reclaim_stale()
+        # BEGIN IMMEDIATE бере write-lock одразу: два процеси не заберуть ту саму пачку
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT edrpou, attempts FROM jobs "
+                "WHERE status IN ('pending', 'retry') AND next_try_ts <= ? "
+                "ORDER BY next_try_ts LIMIT ?",
+                (now, n),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'in_progress', attempts = attempts + 1, "
+                "claimed_by = ?, claimed_at = ?, updated_at = ? WHERE edrpou = ?",
+                [(self.worker_id, now, now, e) for e, _ in rows],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [(e, {"attempts": attempts + 1}) for e, attempts in rows]
+
+    _MARK_SQL = "UPDATE jobs SET status = ?, attempts = ?, next_try_ts = ?, updated_at = ? WHERE edrpou = ?"
+
+    def mark(self, edrpou, status, attempts, next_try_ts=None):
+        if status == "done":
+            self._done.append((status, attempts, 0, time.time(), edrpou))
+            return
+        self.conn.execute(self._MARK_SQL, (status, attempts, next_try_ts or 0, time.time(), edrpou))
+
+    def next_due_in(self):
+        row = self.conn.execute(
+            "SELECT MIN(next_try_ts) FROM jobs WHERE status IN ('pending', 'retry')"
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def release(self, edrpous):
+        """
+        Повертає взяті, але не оброблені задачі (при зупинці процесу). Спробу, яку
+        claim_batch вже зарахував, віддаємо назад — зупинка не з'їдає ретраї.
+        """
+        self.conn.executemany(
+            "UPDATE jobs SET status = 'pending', claimed_by = NULL, attempts = MAX(attempts - 1, 0) "
+            "WHERE edrpou = ? AND status = 'in_progress'",
+            [(e,) for e in edrpous],
+        )
+
+    def flush(self):
+        """Комітить буферизовані done однією транзакцією (викликати після дописування CSV)."""
+        if not self._done:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(self._MARK_SQL, self._done)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self._done.clear()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,120 @@
+"""
+Адаптивний ліміт одночасних запитів (AIMD) для fetcher-а.
+
+- Additive increase: поки p95 латентності й частка 2xx у вікні в нормі — +1 слот
+  приблизно раз на "раунд" (кожні `limit` успішних відповідей).
+- Multiplicative decrease: 429 / 403 / 5xx / мережева помилка — limit * decrease_factor,
+  не частіше ніж раз на decrease_interval (пачка одночасних відмов = одне зменшення).
+- Cooldown: якщо помилок у вікні error_window >= error_threshold — нові запити не
+  стартують cooldown секунд; кожне наступне спрацювання подвоює паузу (до max_cooldown).
+
+Поточний ліміт — limiter.limit, повний знімок метрик — limiter.snapshot().
+"""
+import asyncio, math, time
+from collections import deque
+
+
+def is_throttle_status(status):
+    """None — виняток (таймаут, обрив з'єднання)."""
+    return status is None or status in (403, 429) or status >= 500
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial=10, min_limit=1, max_limit=40,
+                 latency_p95_target=3.0, success_rate_target=0.95,
+                 decrease_factor=0.5, decrease_interval=2.0,
+                 error_window=120, error_threshold=8,
+                 cooldown=60, max_cooldown=900):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_p95_target = latency_p95_target
+        self.success_rate_target = success_rate_target
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.error_window = error_window
+        self.error_threshold = error_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self._next_cooldown = cooldown
+        self._samples = deque()        # (ts, latency, status)
+        self._since_increase = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    # --- слоти ---
+    async def acquire(self):
+        async with self._cond:
+            while True:
+                wait = self.cooldown_until - time.monotonic()
+                if wait <= 0 and self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                try:
+                    await asyncio.wait_for(self._cond.wait(), wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, status, latency):
+        async with self._cond:
+            self.in_flight -= 1
+            self._observe(status, latency)
+            self._cond.notify_all()
+
+    # --- логіка AIMD ---
+    def _trim(self, now):
+        while self._samples and now - self._samples[0][0] > self.error_window:
+            self._samples.popleft()
+
+    def _observe(self, status, latency):
+        now = time.monotonic()
+        self._samples.append((now, latency, status))
+        self._trim(now)
+
+        if is_throttle_status(status):
+            self._since_increase = 0
+            if now - self._last_decrease >= self.decrease_interval:
+                self.limit = max(self.min_limit, math.floor(self.limit * self.decrease_factor))
+                self._last_decrease = now
+            errors = sum(1 for _, _, s in self._samples if is_throttle_status(s))
+            if errors >= self.error_threshold and now >= self.cooldown_until:
+                self.cooldown_until = now + self._next_cooldown
+                self.limit = self.min_limit
+                self._next_cooldown = min(self._next_cooldown * 2, self.max_cooldown)
+                # після паузи старі помилки не мають знову запускати cooldown
+                self._samples.clear()
+            return
+
+        self._since_increase += 1
+        if self._since_increase >= self.limit and self._healthy():
+            self._since_increase = 0
+            if self.limit < self.max_limit:
+                self.limit += 1
+            # довго здорові — скидаємо ескалацію cooldown
+            self._next_cooldown = self.base_cooldown
+
+    def _p95(self):
+        lat = sorted(l for _, l, _ in self._samples)
+        if not lat:
+            return 0.0
+        return lat[min(len(lat) - 1, int(math.ceil(0.95 * len(lat))) - 1)]
+
+    def _ok_rate(self):
+        if not self._samples:
+            return 1.0
+        return sum(1 for _, _, s in self._samples if s is not None and 200 <= s < 300) / len(self._samples)
+
+    def _healthy(self):
+        return self._p95() <= self.latency_p95_target and self._ok_rate() >= self.success_rate_target
+
+    def snapshot(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "p95_latency": round(self._p95(), 3),
+            "ok_rate": round(self._ok_rate(), 3),
+            "cooldown_left": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+        }
@@ -1,17 +1,62 @@
+import argparse
 import asyncio
+import os
+import sys
 import pandas as pd
-from orchestrator import UBKIParser
+from orchestrator import UBKIParser, OUTPUT_CSV, replay_from_cache
+from jobstore import SQLiteJobStore, JOBSTORE_DB
 from utils import logger
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from html_cache import HtmlCache, HTML_CACHE_DIR
+from proxy_pool import load_proxy_file
+
+INPUT_CSV = r"C:\OTP Draft\YouControl\uBKI_parsing\production\companies.csv"
+
 def read_input_csv(path: str):
     df = pd.read_csv(path, dtype=str)
     return df["IDENTIFYCODE"].dropna().astype(str).tolist()
 
+def parse_args():
+    ap = argparse.ArgumentParser(description="UBKI parser")
+    ap.add_argument("--input", default=INPUT_CSV, help="CSV з колонкою IDENTIFYCODE")
+    ap.add_argument("--jobs", nargs="?", const=JOBSTORE_DB, default=None,
+                    help="SQLite-сховище задач: кілька процесів main.py з тим самим --jobs ділять одну чергу")
+    ap.add_argument("--no-seed", action="store_true",
+                    help="не додавати --input у сховище (база вже заповнена іншим процесом)")
+    ap.add_argument("--cache", nargs="?", const=HTML_CACHE_DIR, default=None,
+                    help="зберігати завантажені сторінки в спільний HTML-кеш")
+    ap.add_argument("--replay", nargs="?", const=HTML_CACHE_DIR, default=None,
+                    help="без мережі: перепарсити всі сторінки uBKI з HTML-кешу в OUTPUT_CSV")
+    ap.add_argument("--proxies", default=None,
+                    help="файл проксі (рядок 'host:port [cap]'), замість PROXIES з orchestrator.py")
+    return ap.parse_args()
+
 async def main():
+    args = parse_args()
+    if args.replay:
+        cache = HtmlCache(args.replay)
+        logger.info(f"Replay from {args.replay}: {cache.stats()}")
+        replay_from_cache(cache)
+        cache.close()
+        return
     logger.info("Starting UBKI Parser...")
-    edrpous = read_input_csv(r"C:\OTP Draft\YouControl\uBKI_parsing\production\companies.csv")
-    parser = UBKIParser(edrpous)
+    cache = HtmlCache(args.cache) if args.cache else None
+    proxies = load_proxy_file(args.proxies) if args.proxies else None
+    if args.jobs:
+        store = SQLiteJobStore(args.jobs)
+        if not args.no_seed:
+            store.seed(read_input_csv(args.input))
+        logger.info(f"Job store {args.jobs} as {store.worker_id}: {store.counts()}")
+        # кожен процес пише свій CSV, щоб не змішувати рядки при паралельному дописуванні
+        root, ext = os.path.splitext(OUTPUT_CSV)
+        parser = UBKIParser([], job_store=store, output_csv=f"{root}.{store.worker_id}{ext}",
+                            html_cache=cache, proxies=proxies)
+    else:
+        parser = UBKIParser(read_input_csv(args.input), html_cache=cache, proxies=proxies)
     await parser.run()
+    if cache is not None:
+        cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
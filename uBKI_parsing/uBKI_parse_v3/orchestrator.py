@@ -1,37 +1,51 @@
-import asyncio, time, random
+import asyncio, time
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
-from bs4 import BeautifulSoup
-from fetcher import fetch_page, realistic_prefetch
-from parser_blocks import parse_ubki_full
-from utils import logger, backoff_delay, load_checkpoint, save_checkpoint
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fetcher import fetch_page, realistic_prefetch, ScraperPool
+from parser_blocks import parse_html
+from utils import logger, backoff_delay, StageMeter
+from jobstore import MemoryJobStore
+from limiter import AdaptiveLimiter
 import httpx
 import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from proxy_pool import ProxyPool
 
 BASE_URL_TEMPLATE = "https://edrpou.ubki.ua/ua/{edrpou}"
-SAVE_EVERY = 50
+SAVE_EVERY = 50                     # чекпоінт: зберігати кожні 50 компаній
 
 INPUT_CSV = r"C:\OTP Draft\YouControl\uBKI_parsing\production\companies.csv"   
 OUTPUT_CSV = "ubki_parsed_results.csv"
 CHECKPOINT_FILE = "ubki_checkpoint.json"
 LOG_FILE = "ubki_parser.log"
 
-CONCURRENCY = 10                    # скільки одночасних запитів
+CONCURRENCY = 10                    # стартовий ліміт одночасних запитів (далі його веде AdaptiveLimiter)
+MIN_CONCURRENCY = 1                 # нижче AIMD не опускає
+MAX_CONCURRENCY = 40                # вище AIMD не піднімає (= кількість fetch-воркерів)
+LATENCY_P95_TARGET = 3.0            # сек, p95 латентності у вікні, при якому ще можна рости
+SUCCESS_RATE_TARGET = 0.95          # частка 2xx у вікні, при якій ще можна рости
 REQUEST_TIMEOUT = 20                # сек
 RETRY_MAX = 4                       # скільки повторів при помилках
 RETRY_BACKOFF_BASE = 2.0            # степінь для backoff
 RETRY_JITTER = 1.0                  # додаткові секунди jitter
-SAVE_EVERY = 50                     # чекпоінт: зберігати кожні 50 компаній
 RETRY_FOR_NOT_FOUND = 3             # скільки разів переспробувати коли "Дані не знайдено"
 NOT_FOUND_RETRY_DELAY = 5          # секунда початкова затримка перед повторним парсингом (буде зростати)
-ERROR_WINDOW_SECONDS = 120       # вікно для recent_errors
+ERROR_WINDOW_SECONDS = 120       # вікно для recent_errors (і для p95 / частки 2xx)
 ERROR_THRESHOLD = 8              # якщо більше помилок за вікно -> включити cooldown
 COOLDOWN_SECONDS = 60            # початковий cooldown при перевищенні порогу
 REALISTIC_PREFETCH_PROB = 0.12   # ймовірність робити "реалістичний трафік" перед запитом
 MOBILE_UA_PROB = 0.25    
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # процеси для парсингу HTML
+PARSER_BACKEND = "bs4"              # "bs4" або "lxml" (швидкий, див. parity_check.py)
+PARSE_QUEUE_SIZE = MAX_CONCURRENCY  # скільки сторінок може чекати на парсинг (backpressure для fetch)
+THROUGHPUT_REPORT_EVERY = 60        # сек, як часто логувати pages/s
+CLAIM_BATCH = 50                    # скільки ЄДРПОУ забирати зі сховища задач за раз
 
 
-PROXIES = []  
+PROXIES = []                        # URL-и або {url: cap}; порожньо — напряму (main.py --proxies FILE)
+PROXY_STATS_FILE = "ubki_proxy_stats.csv"   # здоров'я проксі, оновлюється разом зі звітом throughput
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0 Safari/537.36",
@@ -39,93 +53,221 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:116.0) Gecko/20100101 Firefox/116.0",
 ]
 
-BASE_URL_TEMPLATE = "https://edrpou.ubki.ua/ua/{edrpou}"
-
 class UBKIParser:
-    def __init__(self, edrpou_list):
-        self.edrpou_list = edrpou_list
+    """
+    job_store: MemoryJobStore (за замовчуванням, один процес) або SQLiteJobStore
+    (кілька процесів main.py на одну базу задач). output_csv — свій файл на процес.
+    html_cache: HtmlCache (../../html_cache.py) — кожна завантажена сторінка зберігається
+    для повторного парсингу без мережі (replay_from_cache).
+    proxies: список / {url: cap} для ProxyPool (../../proxy_pool.py), за замовчуванням PROXIES.
+    """
+
+    def __init__(self, edrpou_list, parse_workers=PARSE_WORKERS, job_store=None, output_csv=OUTPUT_CSV,
+                 html_cache=None, proxies=None):
+        self.parse_workers = parse_workers
+        self.proxies = PROXIES if proxies is None else proxies
+        self.output_csv = output_csv
+        self.html_cache = html_cache
         self.results = []
-        self.processed, self.pending, self.retry_queue = {}, {}, {}
+        self.store = job_store if job_store is not None else MemoryJobStore(edrpou_list)
+        self.pending = []     # локальна пачка, забрана зі сховища
         self._lock = asyncio.Lock()
         self._save_counter = 0
-        self._load_state()
+        self._in_flight = 0   # взяті зі сховища, але ще не завершені (fetch -> parse -> результат)
         self.session_cookies = {}
+        self.fetch_meter = StageMeter("fetch")
+        self.parse_meter = StageMeter("parse")
+        self.limiter = None   # AdaptiveLimiter, створюється в run()
+        self.scraper_pool = None   # ScraperPool для cloudscraper-фолбеку, створюється в run()
+        self.proxy_pool = None     # ProxyPool, створюється в run() (порожній — запити напряму)
 
-    def _load_state(self):
-        state = load_checkpoint()
-        self.processed = state.get("processed", {})
-        for e in self.edrpou_list:
-            if e not in self.processed:
-                self.pending[e] = {"attempts": 0}
+    async def _finish(self, edrpou, meta, status, retry_delay=None):
+        """Фіксує результат задачі у сховищі; retry — повернення в чергу через retry_delay сек."""
+        async with self._lock:
+            next_try_ts = time.time() + retry_delay if status == "retry" else None
+            self.store.mark(edrpou, status, meta["attempts"], next_try_ts)
+            self._in_flight -= 1
 
-    async def worker(self, client, sem):
-        counter = 0
+    async def worker(self, client, html_queue, worker_id=0):
+        """Fetch-етап: качає сторінки і кладе сирі байти в html_queue. worker_id — sticky-ключ проксі."""
         while True:
+            edrpou, wait = None, 1
             async with self._lock:
                 if not self.pending:
-                    return
-                edrpou, meta = self.pending.popitem()
-                meta["attempts"] += 1
-                self.processed[edrpou] = {"status": "in_progress", "attempts": meta["attempts"]}
+                    self.pending = self.store.claim_batch(CLAIM_BATCH)
+                if self.pending:
+                    edrpou, meta = self.pending.pop()
+                    self._in_flight += 1
+                else:
+                    due_in = self.store.next_due_in()
+                    if due_in is None and self._in_flight == 0:
+                        return
+                    if due_in is not None:
+                        wait = min(max(due_in, 0.1), 5)
 
-            counter += 1
-            if counter % 200 == 0:
-                logger.info("Resting 20 sec after 200 companies")
-                await asyncio.sleep(random.randint(10, 30))
+            if edrpou is None:
+                # нічого готового: щось ще парситься або чекає ретраю — воно може повернутися
+                await asyncio.sleep(wait)
+                continue
 
             await realistic_prefetch(client, REALISTIC_PREFETCH_PROB)
 
-            async with sem:
-                url = BASE_URL_TEMPLATE.format(edrpou=edrpou)
-                html = await fetch_page(client, url, self.session_cookies)
-                if not html:
-                    # повернемо у чергу з затримкою
-                    if meta["attempts"] < RETRY_MAX:
-                        await asyncio.sleep(NOT_FOUND_RETRY_DELAY * meta["attempts"])
-                        async with self._lock:
-                            self.pending[edrpou] = meta
-                    else:
-                        logger.warning(f"[!] Порожня відповідь для {edrpou} після {meta['attempts']} спроб")
-                    continue
-
-                soup = BeautifulSoup(html, "html.parser")
-                parsed = parse_ubki_full(soup, edrpou)
-
-                # Якщо базових даних немає — це неуспішний парсинг, ретраїмо
-                if not parsed or not parsed.get("Повна назва"):
-                    if meta["attempts"] < RETRY_FOR_NOT_FOUND:
-                        delay = NOT_FOUND_RETRY_DELAY * meta["attempts"]
-                        logger.info(f"[!] Дані не знайдено для {edrpou} — ретрай через {delay}s")
-                        await asyncio.sleep(delay)
-                        async with self._lock:
-                            self.pending[edrpou] = meta
-                    else:
-                        logger.warning(f"[X] Дані не знайдено для {edrpou} після {meta['attempts']} спроб")
-                    continue
-
-                async with self._lock:
-                    self.results.append(parsed)
-                    self.processed[edrpou] = {"status": "done", "attempts": meta["attempts"]}
-                    self._save_counter += 1
-
-                if self._save_counter >= SAVE_EVERY:
-                    await self.save_progress()
+            url = BASE_URL_TEMPLATE.format(edrpou=edrpou)
+            html = await fetch_page(client, url, self.session_cookies, as_bytes=True,
+                                    limiter=self.limiter, scraper_pool=self.scraper_pool,
+                                    proxy_pool=self.proxy_pool, proxy_key=f"fetch-{worker_id}")
+
+            if not html:
+                # повернемо у чергу з затримкою
+                if meta["attempts"] < RETRY_MAX:
+                    await self._finish(edrpou, meta, "retry", NOT_FOUND_RETRY_DELAY * meta["attempts"])
+                else:
+                    logger.warning(f"[!] Порожня відповідь для {edrpou} після {meta['attempts']} спроб")
+                    await self._finish(edrpou, meta, "failed")
+                continue
+
+            self.fetch_meter.tick()
+            if self.html_cache is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.html_cache.put, url, html)
+            # bounded queue: якщо парсери не встигають — fetch чекає тут
+            await html_queue.put((edrpou, meta, html))
+
+    async def parse_worker(self, pool, html_queue):
+        """Parse-етап: віддає байти в ProcessPoolExecutor, отримує plain dict."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await html_queue.get()
+            if item is None:
+                return
+            edrpou, meta, html = item
+            try:
+                parsed = await loop.run_in_executor(pool, parse_html, html, edrpou, PARSER_BACKEND)
+            except Exception as e:
+                logger.warning(f"[!] Помилка парсингу {edrpou}: {e}")
+                parsed = None
+            self.parse_meter.tick()
+
+            # Якщо базових даних немає — це неуспішний парсинг, ретраїмо
+            if not parsed or not parsed.get("Повна назва"):
+                if meta["attempts"] < RETRY_FOR_NOT_FOUND:
+                    delay = NOT_FOUND_RETRY_DELAY * meta["attempts"]
+                    logger.info(f"[!] Дані не знайдено для {edrpou} — ретрай через {delay}s")
+                    await self._finish(edrpou, meta, "retry", delay)
+                else:
+                    logger.warning(f"[X] Дані не знайдено для {edrpou} після {meta['attempts']} спроб")
+                    await self._finish(edrpou, meta, "not_found")
+                continue
+
+            async with self._lock:
+                self.results.append(parsed)
+                self._save_counter += 1
+            await self._finish(edrpou, meta, "done")
+
+            if self._save_counter >= SAVE_EVERY:
+                await self.save_progress()
+
+    async def report_throughput(self):
+        while True:
+            await asyncio.sleep(THROUGHPUT_REPORT_EVERY)
+            logger.info(
+                f"Throughput: fetch {self.fetch_meter.window_rate():.2f} pages/s, "
+                f"parse {self.parse_meter.window_rate():.2f} pages/s, "
+                f"limiter {self.limiter.snapshot()}, scrapers {self.scraper_pool.stats()}"
+                + (f", {self.proxy_pool.summary()}" if self.proxy_pool.enabled else "")
+            )
+            if self.proxy_pool.enabled:
+                self.proxy_pool.export_stats(PROXY_STATS_FILE)
 
     async def save_progress(self):
         async with self._lock:
             if not self.results:
                 return
             df_new = pd.DataFrame(self.results)
-            first_write = not os.path.exists(OUTPUT_CSV)
-            df_new.to_csv(OUTPUT_CSV, mode="a", index=False, header=first_write)
-            save_checkpoint({"processed": self.processed})
+            first_write = not os.path.exists(self.output_csv)
+            df_new.to_csv(self.output_csv, mode="a", index=False, header=first_write)
+            self.store.flush()
             self.results.clear()
             self._save_counter = 0
             logger.info("Checkpoint saved")
 
     async def run(self):
-        sem = asyncio.Semaphore(CONCURRENCY)
-        async with httpx.AsyncClient() as client:
-            tasks = [asyncio.create_task(self.worker(client, sem)) for _ in range(CONCURRENCY)]
-            await asyncio.gather(*tasks)
-            await self.save_progress()
\ No newline at end of file
+        self.limiter = AdaptiveLimiter(
+            initial=CONCURRENCY, min_limit=MIN_CONCURRENCY, max_limit=MAX_CONCURRENCY,
+            latency_p95_target=LATENCY_P95_TARGET, success_rate_target=SUCCESS_RATE_TARGET,
+            error_window=ERROR_WINDOW_SECONDS, error_threshold=ERROR_THRESHOLD, cooldown=COOLDOWN_SECONDS,
+        )
+        self.scraper_pool = ScraperPool()
+        # окремий httpx-клієнт (і cookie jar) на кожен проксі
+        self.proxy_pool = ProxyPool(self.proxies, session_factory=lambda p: httpx.AsyncClient(proxy=p))
+        html_queue = asyncio.Queue(maxsize=PARSE_QUEUE_SIZE)
+        reporter = asyncio.create_task(self.report_throughput())
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+                async with httpx.AsyncClient() as client:
+                    parsers = [asyncio.create_task(self.parse_worker(pool, html_queue)) for _ in range(self.parse_workers)]
+                    fetchers = [asyncio.create_task(self.worker(client, html_queue, i)) for i in range(MAX_CONCURRENCY)]
+                    await asyncio.gather(*fetchers)
+                    # fetch-воркери виходять лише коли _in_flight == 0, тож черга вже порожня
+                    for _ in parsers:
+                        await html_queue.put(None)
+                    await asyncio.gather(*parsers)
+                    await self.save_progress()
+        finally:
+            # забрані, але не початі задачі — назад у спільну чергу (для SQLiteJobStore)
+            if self.pending and hasattr(self.store, "release"):
+                self.store.release([e for e, _ in self.pending])
+            self.store.close()
+            self.scraper_pool.close()
+            reporter.cancel()
+            if self.proxy_pool.enabled:
+                self.proxy_pool.export_stats(PROXY_STATS_FILE)
+                logger.info(f"Proxy stats -> {PROXY_STATS_FILE}: {self.proxy_pool.summary()}")
+            await self.proxy_pool.aclose()
+        logger.info(
+            f"Throughput total: fetch {self.fetch_meter.count} pages "
+            f"({self.fetch_meter.total_rate():.2f} pages/s), "
+            f"parse {self.parse_meter.count} pages ({self.parse_meter.total_rate():.2f} pages/s), "
+            f"final concurrency limit {self.limiter.limit}"
+        )
+
+
+def _parse_cached(item):
+    edrpou, html = item
+    try:
+        return parse_html(html, edrpou, PARSER_BACKEND)
+    except Exception:
+        return None
+
+
+def replay_from_cache(html_cache, output_csv=OUTPUT_CSV, parse_workers=PARSE_WORKERS, chunk=SAVE_EVERY * 10):
+    """
+    Перепарсинг без мережі: найсвіжіша збережена сторінка кожного ЄДРПОУ з html_cache
+    -> parse_html у ProcessPoolExecutor -> output_csv (перезаписується).
+    """
+    prefix = BASE_URL_TEMPLATE.split("{edrpou}")[0]
+    pages = ((url[len(prefix):].strip("/"), body) for url, _, body in html_cache.iter_latest(prefix))
+    if os.path.exists(output_csv):
+        os.remove(output_csv)
+
+    meter = StageMeter("replay")
+    parsed_total = empty = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        for parsed in pool.map(_parse_cached, pages, chunksize=32):
+            meter.tick()
+            if not parsed or not parsed.get("Повна назва"):
+                empty += 1
+                continue
+            batch.append(parsed)
+            if len(batch) >= chunk:
+                pd.DataFrame(batch).to_csv(output_csv, mode="a", index=False, header=not os.path.exists(output_csv))
+                parsed_total += len(batch)
+                batch.clear()
+    if batch:
+        pd.DataFrame(batch).to_csv(output_csv, mode="a", index=False, header=not os.path.exists(output_csv))
+        parsed_total += len(batch)
+    logger.info(
+        f"Replay: {meter.count} pages ({meter.total_rate():.1f} pages/s), "
+        f"parsed {parsed_total}, no data {empty} -> {output_csv}"
+    )
+    return parsed_total
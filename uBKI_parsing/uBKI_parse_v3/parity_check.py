@@ -0,0 +1,90 @@
+"""
+Паритет бекендів парсера: проганяє bs4 (еталон) і lxml по корпусу збережених сторінок uBKI
+і порівнює вихідні dict-и поле за полем.
+
+Запуск: python parity_check.py [corpus_dir]     (за замовчуванням fixtures/)
+Exit code 1, якщо хоч одна сторінка відрізняється.
+"""
+import glob, os, re, sys
+
+from parser_blocks import parse_html
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(HERE, "fixtures")
+
+
+def load_corpus(corpus_dir):
+    """[(edrpou, path)] — ЄДРПОУ береться з цифр у назві файлу, інакше з самої назви."""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "**", "*.htm*"), recursive=True)):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        m = re.search(r"\d{6,10}", stem)
+        pages.append((m.group(0) if m else stem, path))
+    return pages
+
+
+def diff_values(a, b, path="$"):
+    """Список розбіжностей між двома структурами (dict / list / скаляри)."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        out = []
+        for k in a.keys() | b.keys():
+            if k not in b:
+                out.append(f"{path}.{k}: тільки в bs4 = {a[k]!r}")
+            elif k not in a:
+                out.append(f"{path}.{k}: тільки в lxml = {b[k]!r}")
+            else:
+                out.extend(diff_values(a[k], b[k], f"{path}.{k}"))
+        if not out and list(a) != list(b):
+            out.append(f"{path}: різний порядок ключів")
+        return out
+    if isinstance(a, list) and isinstance(b, list):
+        out = []
+        if len(a) != len(b):
+            out.append(f"{path}: довжина {len(a)} != {len(b)}")
+        for i, (x, y) in enumerate(zip(a, b)):
+            out.extend(diff_values(x, y, f"{path}[{i}]"))
+        return out
+    return [] if a == b else [f"{path}: bs4={a!r} lxml={b!r}"]
+
+
+def run_backend(html_bytes, edrpou, backend):
+    try:
+        return parse_html(html_bytes, edrpou, backend), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def main(corpus_dir=DEFAULT_CORPUS):
+    pages = load_corpus(corpus_dir)
+    if not pages:
+        print(f"[!] Порожній корпус: {corpus_dir}")
+        return 1
+
+    mismatched = 0
+    for edrpou, path in pages:
+        with open(path, "rb") as f:
+            html = f.read()
+        ref, ref_err = run_backend(html, edrpou, "bs4")
+        fast, fast_err = run_backend(html, edrpou, "lxml")
+
+        if ref_err or fast_err:
+            # обидва впали — поведінка однакова; впав лише один — це розбіжність
+            diffs = [] if (ref_err and fast_err) else [f"bs4 error={ref_err} lxml error={fast_err}"]
+        else:
+            diffs = diff_values(ref, fast)
+
+        name = os.path.relpath(path, corpus_dir)
+        if diffs:
+            mismatched += 1
+            print(f"[X] {name}")
+            for d in diffs:
+                print(f"      {d}")
+        else:
+            print(f"[OK] {name} ({len(ref or {})} полів)")
+
+    print(f"\nСторінок: {len(pages)}, розбіжностей: {mismatched}")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CORPUS))
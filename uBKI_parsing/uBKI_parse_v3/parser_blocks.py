@@ -1,6 +1,5 @@
-from bs4 import BeautifulSoup
 import re
-import cloudscraper
+from bs4 import BeautifulSoup
 
 def clean_text(text: str) -> str:
     if not text:
@@ -9,12 +8,7 @@ def clean_text(text: str) -> str:
 
 
 def parse_ubki_universal(soup, edrpou):
-    """Парсить дані про компанію UBKI за ЄДРПОУ"""
-    url = f"https://edrpou.ubki.ua/ua/{edrpou}"
-    scraper = cloudscraper.create_scraper()
-    html = scraper.get(url).text
-    soup = BeautifulSoup(html, "html.parser")
-
+    """Парсить дані про компанію UBKI за ЄДРПОУ (з уже завантаженого soup)"""
     card = soup.find("div", id="anchor_ident")
     if not card:
         print(f"[!] Дані не знайдено для {edrpou}")
@@ -140,11 +134,6 @@ def parse_ubki_universal(soup, edrpou):
 
 def parse_ubki_violations(soup, edrpou):
     """Парсить блок 'Заборона брати участь у тендерах від АМКУ'"""
-    url = f"https://edrpou.ubki.ua/ua/{edrpou}"
-    scraper = cloudscraper.create_scraper()
-    html = scraper.get(url).text
-    soup = BeautifulSoup(html, "html.parser")
-
     card = soup.find("div", id="anchor_violations")
     data = {"ЄДРПОУ": edrpou}
 
@@ -322,16 +311,44 @@ def parse_courts(soup, edrpou):
 
     return {"ЄДРПОУ": edrpou, "Суди (справи)": cases}
 
-def parse_ubki_full(soup, edrpou):
+BLOCKS = [
+    ("universal", parse_ubki_universal),
+    ("violations", parse_ubki_violations),
+    ("msb_score", parse_msb_score),
+    ("bankruptcy", parse_bankruptcy),
+    ("finrep", parse_finrep),
+    ("tax_data", parse_tax_data),
+    ("courts", parse_courts),
+]
+
+PARSER_BACKENDS = ("bs4", "lxml")
+
 
-    # окремі блоки
-    base = parse_ubki_universal(soup, edrpou)
-    score = parse_msb_score(soup, edrpou)
-    bankrupt = parse_bankruptcy(soup, edrpou)
-    finrep = parse_finrep(soup, edrpou)
-    tax = parse_tax_data(soup, edrpou)
-    courts = parse_courts(soup, edrpou)
+def make_document(html_bytes):
+    html = html_bytes.decode("utf-8", errors="replace")
+    return BeautifulSoup(html, "html.parser")
 
-    merged = {**(base or {}), **(score or {}), **(bankrupt or {}), **(finrep or {}), **(tax or {}), **(courts or {})}
+
+def parse_ubki_full(soup, edrpou):
+    """
+    Один soup на компанію — всі блоки парсяться з нього ж,
+    жодних повторних запитів на сторінку.
+    """
+    merged = {}
+    for _, block in BLOCKS:
+        merged.update(block(soup, edrpou) or {})
     return merged
 
+
+def parse_html(html_bytes, edrpou, backend="bs4"):
+    """
+    Точка входу для ProcessPoolExecutor: сирі байти сторінки -> plain dict.
+    DOM живе тільки всередині процесу-парсера, назад повертається лише dict.
+    backend: "bs4" (еталон) або "lxml" (скомпільовані XPath, parser_blocks_lxml).
+    """
+    if backend == "lxml":
+        import parser_blocks_lxml   # lxml потрібен лише для швидкого бекенду
+        return parser_blocks_lxml.parse_html(html_bytes, edrpou)
+    if backend != "bs4":
+        raise ValueError(f"Unknown parser backend: {backend!r}, expected one of {PARSER_BACKENDS}")
+    return parse_ubki_full(make_document(html_bytes), edrpou)
@@ -0,0 +1,406 @@
+"""
+Швидкий бекенд parser_blocks на lxml: ті самі блоки, ті самі ключі й та сама поведінка,
+але замість BeautifulSoup(html.parser) + find(..., string=lambda ...) — скомпільовані XPath.
+
+Паритет із bs4-версією перевіряється parity_check.py на корпусі збережених сторінок.
+"""
+from lxml import etree
+import lxml.html
+
+from parser_blocks import clean_text
+
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+
+def _cls(*names):
+    """XPath-умова 'має всі ці класи' (як class_=... / .a.b у bs4)."""
+    return " and ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {n} ')" for n in names
+    )
+
+
+# --- скомпільовані селектори ---
+X_IDENT = etree.XPath("//div[@id='anchor_ident']")
+X_VIOLATIONS = etree.XPath("//div[@id='anchor_violations']")
+X_SCORE = etree.XPath("//div[@id='anchor_score']")
+X_BANKRUPTCY = etree.XPath("//div[@id='anchor_bankruptcy']")
+X_FINREP = etree.XPath("//div[@id='anchor_finrep']")
+X_PODATKI = etree.XPath("//div[@id='anchor_podatki']")
+X_SUSD = etree.XPath("//div[@id='anchor_susd']")
+
+X_SCORE_VALUE = etree.XPath("//span[@id='scoremsb']")
+X_SCORE_LEVEL = etree.XPath(f"//div[{_cls('vw-rating-value-text')}]")
+X_SCORE_DATE = etree.XPath(f"//div[{_cls('vw-rating-datecnt')}]")
+
+X_HEADER = etree.XPath(f".//div[{_cls('dr_row_spacebetween')}]")
+X_TITLE = etree.XPath(f".//h2[{_cls('dr_value_title')}]")
+X_STATE_DIV = etree.XPath(f".//div[{_cls('dr_value_state')}]")
+X_STATE_B = etree.XPath(f".//b[{_cls('dr_value_state')}]")
+X_MARGIN_16 = etree.XPath(f".//*[{_cls('dr_margin_16')}]")
+X_PADDING_COLS = etree.XPath(f".//*[{_cls('dr_column', 'dr_padding_1')}]")
+X_FIN_COLS = etree.XPath(f".//*[{_cls('dr_column', 'dr_fin_column_1')}]")
+X_SUBTITLE = etree.XPath(f".//div[{_cls('dr_value_subtitle')}]")
+X_VALUE = etree.XPath(f".//div[{_cls('dr_value')}]")
+X_VALUE_SMALL = etree.XPath(f".//div[{_cls('dr_value_small')}]")
+X_TEXT_TAGS = etree.XPath(".//text")
+X_ZASNOVNIKI = etree.XPath(".//div[@id='anchor_zasovniki']")
+X_ALL_SUBTITLES = etree.XPath(f"//div[{_cls('dr_value_subtitle')}]")
+X_NEXT_MARGIN_12 = etree.XPath(f"(descendant::div | following::div)[{_cls('dr_margin_12')}]")
+X_NEXT_UL = etree.XPath("(descendant::ul | following::ul)[1]")
+X_NEXT_STATE_DIV = etree.XPath(f"(descendant::div | following::div)[{_cls('dr_value_state')}][1]")
+X_PARENT_TEXT = etree.XPath("ancestor::text[1]")
+X_PARENT_CARD = etree.XPath(f"ancestor::div[{_cls('dr_card')}][1]")
+X_LI = etree.XPath(".//li")
+X_SPAN = etree.XPath(".//span")
+X_SIGNER_ROLE = etree.XPath(f".//span[{_cls('dr_signer_role')}]")
+X_B = etree.XPath(".//b")
+X_STRONG = etree.XPath(".//strong")
+X_KVED_LINKS = etree.XPath(f".//a[{_cls('dr_kved_blk_lnk')}]")
+X_ORANGE_PANEL = etree.XPath(f".//div[{_cls('dr_orange_panel')}]")
+X_CASES_BODY = etree.XPath(".//*[@id='tsusd_cases_table_body']")
+X_COURT_ROWS = etree.XPath(f"div[{_cls('dr_court-table-row')}]")
+X_CHILD_DIVS = etree.XPath("div")
+
+
+# --- аналоги bs4-примітивів ---
+def _first(xpath, el):
+    found = xpath(el)
+    return found[0] if found else None
+
+
+def _text(el):
+    """Tag.get_text()"""
+    return "".join(el.itertext())
+
+
+def _text_strip(el, sep=""):
+    """Tag.get_text(sep, strip=True)"""
+    return sep.join(s.strip() for s in el.itertext() if s.strip())
+
+
+def _bs_string(el):
+    """Tag.string: якщо вузол має рівно одну дитину — її текст (рекурсивно), інакше None."""
+    while True:
+        n_nodes = (1 if el.text else 0) + sum(1 + (1 if c.tail else 0) for c in el)
+        if n_nodes != 1:
+            return None
+        if el.text:
+            return el.text
+        el = el[0]
+        if not isinstance(el.tag, str):   # коментар / PI
+            return el.text
+
+
+def _find_by_string(xpath, el, needle):
+    """find(..., string=lambda s: s and needle in s)"""
+    for node in xpath(el):
+        s = _bs_string(node)
+        if s and needle in s:
+            return node
+    return None
+
+
+def parse_ubki_universal(doc, edrpou):
+    """Парсить дані про компанію UBKI за ЄДРПОУ"""
+    card = _first(X_IDENT, doc)
+    if card is None:
+        print(f"[!] Дані не знайдено для {edrpou}")
+        return None
+
+    data = {"ЄДРПОУ": edrpou}
+
+    # --- Основна інформація ---
+    header_block = _first(X_HEADER, card)
+    if header_block is not None:
+        title = _first(X_TITLE, header_block)
+        if title is not None:
+            data["Повна назва"] = " ".join(_text(title).split())
+
+        status = _first(X_STATE_DIV, header_block)
+        if status is not None:
+            data["Статус"] = " ".join(_text(status).split())
+
+        for div in X_MARGIN_16(header_block):
+            txt = " ".join(_text(div).split())
+            if "Актуально" in txt:
+                data["Актуально на"] = txt.replace("Актуально на", "").strip(". ")
+            elif "Останні зміни" in txt:
+                data["Останні зміни"] = txt.replace("Останні зміни", "").strip(". ")
+
+    # --- Простi поля ---
+    for block in X_PADDING_COLS(card):
+        subtitle = _first(X_SUBTITLE, block)
+        value = _first(X_VALUE, block)
+        if subtitle is not None and value is not None:
+            data[_text_strip(subtitle)] = " ".join(_text(value).split())
+
+    # --- Статутний капітал ---
+    statcap_text = _find_by_string(X_TEXT_TAGS, card, "грн")
+    if statcap_text is not None:
+        parent = _first(X_PARENT_TEXT, statcap_text)
+        if parent is not None:
+            for part in _text_strip(parent, " ").split():
+                if "," in part and any(ch.isdigit() for ch in part):
+                    data["Статутний капітал"] = part + " грн"
+                    break
+
+    # --- Уповноважені особи ---
+    authorized_block = _find_by_string(X_SUBTITLE, card, "Уповноважені особи")
+    if authorized_block is not None:
+        authorized_list = []
+        ul = _first(X_NEXT_UL, authorized_block)
+        # bs4-версія падає з AttributeError, якщо ul немає — зберігаємо ту саму поведінку
+        for li in X_LI(ul):
+            person = {}
+            name_span = _first(X_SPAN, li)
+            role_span = _first(X_SIGNER_ROLE, li)
+            if name_span is not None:
+                person["ПІБ"] = _text_strip(name_span)
+            if role_span is not None:
+                person["Роль"] = _text_strip(role_span)
+            if person:
+                authorized_list.append(person)
+        if authorized_list:
+            data["Уповноважені особи"] = authorized_list
+
+    # --- Засновники ---
+    founders_block = _first(X_ZASNOVNIKI, card)
+    if founders_block is not None:
+        # Зупинка перед "Бенефіціари": усе, що йде в документі після першого такого підзаголовка
+        first_ben = _find_by_string(X_ALL_SUBTITLES, doc, "Бенефіціари")
+        after_ben = set(X_NEXT_MARGIN_12(first_ben)) if first_ben is not None else set()
+        founders = []
+        for f in X_NEXT_MARGIN_12(founders_block):
+            if f in after_ben:
+                break
+
+            person = {}
+            name_tag = _first(X_VALUE, f)
+            if name_tag is not None:
+                person["ПІБ / Назва"] = _text_strip(name_tag)
+
+            country_tag = _find_by_string(X_VALUE_SMALL, f, "Країна")
+            if country_tag is not None and _first(X_B, country_tag) is not None:
+                person["Країна"] = _text_strip(_first(X_B, country_tag))
+
+            contrib_tag = _find_by_string(X_VALUE_SMALL, f, "Розмір внеску")
+            if contrib_tag is not None and _first(X_B, contrib_tag) is not None:
+                person["Розмір внеску"] = _text_strip(_first(X_B, contrib_tag)).replace(u'\xa0', ' ')
+
+            if person:
+                founders.append(person)
+        if founders:
+            data["Засновники"] = founders
+
+    # --- Бенефіціари ---
+    ben_block = _find_by_string(X_SUBTITLE, card, "Бенефіціари")
+    if ben_block is not None:
+        beneficiaries = []
+        for b in X_NEXT_MARGIN_12(ben_block):
+            person = {}
+            name_tag = _first(X_VALUE, b)
+            if name_tag is not None:
+                person["ПІБ"] = _text_strip(name_tag)
+
+            country_tag = _find_by_string(X_VALUE_SMALL, b, "громадянства")
+            if country_tag is not None and _first(X_B, country_tag) is not None:
+                person["Країна"] = _text_strip(_first(X_B, country_tag))
+
+            type_tag = _find_by_string(X_VALUE_SMALL, b, "Тип бенефіціарного")
+            if type_tag is not None and _first(X_B, type_tag) is not None:
+                person["Тип володіння"] = _text_strip(_first(X_B, type_tag))
+
+            share_tag = _find_by_string(X_VALUE_SMALL, b, "Відсоток")
+            if share_tag is not None:
+                person["Частка"] = _text_strip(share_tag).split(":")[-1].strip()
+
+            if person:
+                beneficiaries.append(person)
+        if beneficiaries:
+            data["Бенефіціари"] = beneficiaries
+
+    # --- Види діяльності ---
+    kveds = [_text_strip(a) for a in X_KVED_LINKS(card)]
+    if kveds:
+        data["Види діяльності"] = "; ".join(kveds)
+
+    return data
+
+
+def parse_ubki_violations(doc, edrpou):
+    """Парсить блок 'Заборона брати участь у тендерах від АМКУ'"""
+    card = _first(X_VIOLATIONS, doc)
+    data = {"ЄДРПОУ": edrpou}
+
+    if card is None:
+        data["АМКУ тендери"] = "Блок не знайдено"
+        return data
+
+    text_block = _first(X_NEXT_STATE_DIV, card)
+    if text_block is not None:
+        data["АМКУ тендери"] = " ".join(_text(text_block).split())
+    else:
+        data["АМКУ тендери"] = "Інформація відсутня"
+
+    return data
+
+
+def parse_msb_score(doc, edrpou):
+    data = {"ЄДРПОУ": edrpou}
+
+    if _first(X_SCORE, doc) is None:
+        return {}
+
+    score_value = _first(X_SCORE_VALUE, doc)
+    if score_value is not None:
+        data["МСБ скоринг (балів)"] = _text_strip(score_value)
+
+    score_level = _first(X_SCORE_LEVEL, doc)
+    if score_level is not None:
+        data["МСБ скоринг (рівень)"] = _text_strip(score_level)
+
+    score_date = _first(X_SCORE_DATE, doc)
+    if score_date is not None and "Дата розрахунку" in _text(score_date):
+        strong = _first(X_STRONG, score_date)
+        if strong is not None:
+            data["Дата скорингу"] = _text_strip(strong)
+
+    return data
+
+
+def parse_bankruptcy(doc, edrpou):
+    """Парсить блок 'Процедура банкрутства'"""
+    data = {"ЄДРПОУ": edrpou}
+    card = _first(X_BANKRUPTCY, doc)
+    if card is None:
+        return {}
+
+    info_block = _first(X_NEXT_STATE_DIV, card)
+    if info_block is not None:
+        data["Банкрутство"] = clean_text(_text(info_block))
+    return data
+
+
+def parse_finrep(doc, edrpou):
+    """Парсить блок 'Фінансова звітність' (до поля 'Дохід' включно)."""
+    data = {"ЄДРПОУ": edrpou}
+
+    anchor = _first(X_FINREP, doc)
+    if anchor is None:
+        return {}
+
+    card = _first(X_PARENT_CARD, anchor)
+    if card is None:
+        return {}
+
+    for col in X_FIN_COLS(card):
+        subtitle = _first(X_SUBTITLE, col)
+        value = _first(X_VALUE, col)
+        if subtitle is not None and value is not None:
+            key = clean_text(_text(subtitle))
+            data[key] = clean_text(_text(value))
+
+            # Зупиняємось після поля "Дохід"
+            if key.strip().lower().startswith("дохід"):
+                break
+
+    return data
+
+
+def parse_tax_data(doc, edrpou):
+    """Парсить блок 'Податкові дані' (anchor_podatki)."""
+    data = {"ЄДРПОУ": edrpou}
+
+    anchor = _first(X_PODATKI, doc)
+    if anchor is None:
+        return {}
+
+    card = _first(X_PARENT_CARD, anchor)
+    if card is None:
+        return {}
+
+    title = _first(X_TITLE, anchor)
+    if title is not None:
+        data["Податкові дані (назва)"] = clean_text(_text(title))
+
+    orange_panel = _first(X_ORANGE_PANEL, card)
+    if orange_panel is not None:
+        data["Податкові дані (примітка)"] = clean_text(_text(orange_panel))
+
+    vat_state = _first(X_STATE_B, card)
+    if vat_state is not None:
+        data["Статус ПДВ"] = clean_text(_text(vat_state))
+
+    for col in X_PADDING_COLS(card):
+        subtitle = _first(X_SUBTITLE, col)
+        value = _first(X_VALUE, col)
+        if subtitle is not None and value is not None:
+            data[clean_text(_text(subtitle))] = clean_text(_text(value))
+
+    return data
+
+
+def parse_courts(doc, edrpou):
+    """Парсить блок 'Суди' (id='anchor_susd') — табличну частину зі вкладеними документами."""
+    block = _first(X_SUSD, doc)
+    if block is None:
+        return {}
+
+    table_body = _first(X_CASES_BODY, block)
+    if table_body is None:
+        return {"ЄДРПОУ": edrpou, "Суди (справи)": []}
+
+    cases = []
+    current_case = None
+
+    for row in X_COURT_ROWS(table_body):
+        cols = X_CHILD_DIVS(row)
+
+        # якщо це основна справа (має лінк або роль)
+        if len(cols) >= 5 and "Номер справи" not in _text(row):
+            current_case = {
+                "Номер справи": clean_text(_text(cols[1])),
+                "Роль": clean_text(_text(cols[2])),
+                "Інстанція": clean_text(_text(cols[3])),
+                "Стан розгляду": clean_text(_text(cols[4])),
+                "Документи": []
+            }
+            cases.append(current_case)
+
+        elif "dr_court-subtable-row" in (row.get("class") or "").split():
+            if len(cols) >= 5 and current_case:
+                current_case["Документи"].append({
+                    "№": clean_text(_text(cols[0])),
+                    "Номер документа": clean_text(_text(cols[1])),
+                    "Дата": clean_text(_text(cols[2])),
+                    "Тип": clean_text(_text(cols[3])),
+                    "Суд": clean_text(_text(cols[4]))
+                })
+
+    return {"ЄДРПОУ": edrpou, "Суди (справи)": cases}
+
+
+BLOCKS = [
+    ("universal", parse_ubki_universal),
+    ("violations", parse_ubki_violations),
+    ("msb_score", parse_msb_score),
+    ("bankruptcy", parse_bankruptcy),
+    ("finrep", parse_finrep),
+    ("tax_data", parse_tax_data),
+    ("courts", parse_courts),
+]
+
+
+def make_document(html_bytes):
+    return lxml.html.fromstring(html_bytes, parser=_HTML_PARSER)
+
+
+def parse_ubki_full(doc, edrpou):
+    merged = {}
+    for _, block in BLOCKS:
+        merged.update(block(doc, edrpou) or {})
+    return merged
+
+
+def parse_html(html_bytes, edrpou):
+    return parse_ubki_full(make_document(html_bytes), edrpou)
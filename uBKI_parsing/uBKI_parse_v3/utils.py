@@ -1,6 +1,7 @@
-import os, json, random, logging
+import os, json, random, logging, time
 
-CHECKPOINT_FILE = "ubki_checkpoint.json"
+CHECKPOINT_FILE = "ubki_checkpoint.json"          # старий формат (повний dict), лише для міграції
+CHECKPOINT_JOURNAL = "ubki_checkpoint.jsonl"      # append-only журнал статусів
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,8 +19,99 @@ def load_checkpoint():
             return json.load(f)
     return {"processed": {}, "pending": {}, "retry": {}}
 
-def save_checkpoint(state):
-    tmp = CHECKPOINT_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, CHECKPOINT_FILE)
+class StatusJournal:
+    """
+    Log-structured чекпоінт: один компактний JSON-рядок на кожну зміну статусу ЄДРПОУ.
+    record() дописує рядок одразу (write + flush), sync() робить fsync пачкою,
+    compact() перезаписує журнал знімком останніх статусів, коли він розростається.
+    Вартість запису не залежить від кількості вже оброблених компаній.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_JOURNAL, compact_ratio: float = 2.0, compact_min: int = 10000):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self.lines = 0
+        self._fp = None
+
+    def replay(self) -> dict:
+        """Відновлює {edrpou: {"status", "attempts"}}; обрізаний останній рядок ігнорується."""
+        state = {}
+        if not os.path.exists(self.path):
+            # одноразова міграція зі старого ubki_checkpoint.json
+            state = load_checkpoint().get("processed", {})
+            if state:
+                self.compact(state)
+            return state
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Journal: skipping broken record (crash during write?)")
+                    continue
+                state[rec["e"]] = {"status": rec["s"], "attempts": rec["a"]}
+                self.lines += 1
+        return state
+
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.path, "a", encoding="utf-8")
+        return self._fp
+
+    def record(self, edrpou: str, status: str, attempts: int):
+        fp = self._open()
+        fp.write(json.dumps({"e": edrpou, "s": status, "a": attempts}, ensure_ascii=False, separators=(",", ":")) + "\n")
+        fp.flush()
+        self.lines += 1
+
+    def sync(self):
+        if self._fp is not None:
+            os.fsync(self._fp.fileno())
+
+    def needs_compaction(self, live_entries: int) -> bool:
+        return self.lines > max(self.compact_min, self.compact_ratio * live_entries)
+
+    def compact(self, state: dict):
+        """Атомарно замінює журнал знімком: по одному рядку на ЄДРПОУ."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for edrpou, meta in state.items():
+                f.write(json.dumps({"e": edrpou, "s": meta["status"], "a": meta["attempts"]},
+                                   ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        os.replace(tmp, self.path)
+        self.lines = len(state)
+
+    def close(self):
+        if self._fp is not None:
+            self.sync()
+            self._fp.close()
+            self._fp = None
+
+
+class StageMeter:
+    """Лічильник пропускної здатності одного етапу (fetch / parse) у pages/s."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.started = time.monotonic()
+        self._window_count = 0
+        self._window_started = self.started
+
+    def tick(self, n: int = 1):
+        self.count += n
+        self._window_count += n
+
+    def window_rate(self) -> float:
+        """pages/s з моменту попереднього виклику; вікно скидається."""
+        now = time.monotonic()
+        rate = self._window_count / max(now - self._window_started, 1e-9)
+        self._window_count, self._window_started = 0, now
+        return rate
+
+    def total_rate(self) -> float:
+        return self.count / max(time.monotonic() - self.started, 1e-9)
@@ -1,12 +1,17 @@
 # ubki_big_parser.py
 import asyncio
 import csv
+import heapq
+import itertools
 import json
 import logging
 import math
 import os
 import random
+import sys
 import time
+from abc import ABC, abstractmethod
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
@@ -16,6 +21,9 @@ import httpx
 import pandas as pd
 from bs4 import BeautifulSoup
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from proxy_pool import ProxyPool
+
 # Optional: cloudscraper for fallback when Cloudflare blocks
 try:
     import cloudscraper
@@ -23,11 +31,22 @@ try:
 except Exception:
     CLOUDSCRAPER_AVAILABLE = False
 
+# Optional: pyarrow for the append-only Parquet dataset output
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
 # ----------------------
 # CONFIG
 # ----------------------
 INPUT_CSV = r"C:\OTP Draft\YouControl\uBKI_parsing\production\companies.csv"   
-OUTPUT_CSV = "ubki_parsed_results.csv"
+OUTPUT_FORMAT = "parquet"           # "parquet" (папка з part-файлами) або "jsonl"
+OUTPUT_PARQUET_DIR = "ubki_parsed_results.parquet"
+PARQUET_ROWS_PER_FILE = 100_000     # part-файл закривається після стількох рядків (row group на кожен flush)
+OUTPUT_JSONL = "ubki_parsed_results.jsonl"
 CHECKPOINT_FILE = "ubki_checkpoint.json"
 LOG_FILE = "ubki_parser.log"
 
@@ -40,7 +59,8 @@ SAVE_EVERY = 50                     # чекпоінт: зберігати ко
 RETRY_FOR_NOT_FOUND = 3             # скільки разів переспробувати коли "Дані не знайдено"
 NOT_FOUND_RETRY_DELAY = 60          # секунда початкова затримка перед повторним парсингом (буде зростати)
 
-PROXIES = []  
+PROXIES = []                        # URL-и або {url: cap} для ProxyPool (../proxy_pool.py); порожньо — напряму
+PROXY_STATS_FILE = "ubki_proxy_stats.csv"
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0 Safari/537.36",
@@ -90,13 +110,8 @@ import pandas as pd
 from pprint import pprint
 
 
-def parse_ubki_universal(edrpou):
-    """Парсить дані про компанію UBKI за ЄДРПОУ"""
-    url = f"https://edrpou.ubki.ua/ua/{edrpou}"
-    scraper = cloudscraper.create_scraper()
-    html = scraper.get(url).text
-    soup = BeautifulSoup(html, "html.parser")
-
+def parse_ubki_universal(soup, edrpou):
+    """Парсить дані про компанію UBKI за ЄДРПОУ (з уже завантаженого soup)"""
     card = soup.find("div", id="anchor_ident")
     if not card:
         print(f"[!] Дані не знайдено для {edrpou}")
@@ -220,13 +235,8 @@ def parse_ubki_universal(edrpou):
 
     return data
 
-def parse_ubki_violations(edrpou):
+def parse_ubki_violations(soup, edrpou):
     """Парсить блок 'Заборона брати участь у тендерах від АМКУ'"""
-    url = f"https://edrpou.ubki.ua/ua/{edrpou}"
-    scraper = cloudscraper.create_scraper()
-    html = scraper.get(url).text
-    soup = BeautifulSoup(html, "html.parser")
-
     card = soup.find("div", id="anchor_violations")
     data = {"ЄДРПОУ": edrpou}
 
@@ -420,14 +430,15 @@ def parse_courts(soup, edrpou):
 def parse_ubki_full(soup, edrpou):
 
     # окремі блоки
-    base = parse_ubki_universal(edrpou)
+    base = parse_ubki_universal(soup, edrpou)
+    violations = parse_ubki_violations(soup, edrpou)
     score = parse_msb_score(soup, edrpou)
     bankrupt = parse_bankruptcy(soup, edrpou)
     finrep = parse_finrep(soup, edrpou)
     tax = parse_tax_data(soup, edrpou)
     courts = parse_courts(soup, edrpou)
 
-    merged = {**(base or {}), **(score or {}), **(bankrupt or {}), **(finrep or {}), **(tax or {}), **(courts or {})}
+    merged = {**(base or {}), **(violations or {}), **(score or {}), **(bankrupt or {}), **(finrep or {}), **(tax or {}), **(courts or {})}
     return merged
 
 # ----------------------
@@ -437,25 +448,32 @@ def pick_user_agent() -> str:
     return random.choice(USER_AGENTS)
 
 
-def pick_proxy() -> Optional[str]:
-    if not PROXIES:
-        return None
-    return random.choice(PROXIES)
+# ProxyPool з PROXIES, створюється в UBKIParser.run(): окремий httpx-клієнт на кожен проксі
+PROXY_POOL: Optional[ProxyPool] = None
 
 
-async def fetch_with_httpx(client: httpx.AsyncClient, url: str, edrpou: str, attempt: int) -> Optional[str]:
+async def fetch_with_httpx(client: httpx.AsyncClient, url: str, edrpou: str, attempt: int,
+                           proxy_key: Optional[str] = None) -> Optional[str]:
+    """proxy_key — ключ воркера: він тримається свого проксі (і його cookie jar), поки той здоровий."""
     headers = {"User-Agent": pick_user_agent(), "Accept-Language": "uk-UA,uk;q=0.9,en;q=0.8"}
-    proxy = pick_proxy()
+    proxy = await PROXY_POOL.acquire(proxy_key) if PROXY_POOL is not None else None
+    status, error, t0 = None, None, time.monotonic()
     try:
-        resp = await client.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        resp = await (PROXY_POOL.session(proxy) if proxy else client).get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        status = resp.status_code
         text = resp.text
         return text
     except httpx.HTTPStatusError as e:
         logger.warning("HTTP error for %s (attempt %d): %s", edrpou, attempt, e)
     except (httpx.TransportError, httpx.ReadTimeout) as e:
+        error = e
         logger.warning("Transport/Timeout for %s (attempt %d): %s", edrpou, attempt, e)
     except Exception as e:
+        error = e
         logger.exception("Unexpected fetch error for %s (attempt %d): %s", edrpou, attempt, e)
+    finally:
+        if PROXY_POOL is not None:
+            PROXY_POOL.report(proxy, status, time.monotonic() - t0, error)
     return None
 
 
@@ -496,6 +514,234 @@ def save_checkpoint(state: Dict[str, Any]):
     os.replace(tmp, CHECKPOINT_FILE)
 
 
+# ----------------------
+# Output sinks
+# ----------------------
+class OutputSink(ABC):
+    """
+    Append-only вихід: write(rows) на кожен flush, вартість залежить лише від len(rows),
+    а не від розміру вже записаного файлу.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_written = 0
+
+    @abstractmethod
+    def write(self, rows: List[Dict[str, Any]]):
+        """Дописує rows; після повернення вони мають пережити падіння процесу (далі йде чекпоінт)."""
+
+    def close(self):
+        pass
+
+
+class JsonlSink(OutputSink):
+    """Один JSON-рядок на компанію; нові ключі блоків просто з'являються в нових рядках."""
+    def __init__(self, path: str = OUTPUT_JSONL):
+        super().__init__(path)
+        self._fp = open(path, "a", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self._fp.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self.rows_written += len(rows)
+
+    def close(self):
+        self._fp.close()
+
+
+def _flat_value(v: Any) -> Optional[str]:
+    # вкладені блоки (Засновники, Суди, ...) -> JSON-рядок, решта -> str; схема = лише string-колонки
+    if v is None:
+        return None
+    if isinstance(v, (list, dict)):
+        return json.dumps(v, ensure_ascii=False, default=str)
+    return str(v)
+
+
+class ParquetDatasetSink(OutputSink):
+    """
+    Parquet-датасет: один відкритий pq.ParquetWriter, кожен flush = нова row group у ньому.
+    Новий part-файл — лише коли з'являються нові колонки (схема writer-а фіксована), після
+    PARQUET_ROWS_PER_FILE рядків і при close(). Усі колонки — nullable string; схеми
+    part-файлів об'єднує load_results().
+
+    Відкритий файл (part-N.parquet.inprogress) без footer-а не читається, тому його рядки
+    ще й дописуються в part-N.jsonl (fsync на кожен flush): після падіння конструктор
+    відновлює з нього part-N.parquet, і чекпоінт, збережений після write(), не бреше.
+    """
+    def __init__(self, path: str = OUTPUT_PARQUET_DIR, rows_per_file: int = PARQUET_ROWS_PER_FILE):
+        super().__init__(path)
+        self.rows_per_file = rows_per_file
+        os.makedirs(path, exist_ok=True)
+        self._writer = None
+        self._schema = None
+        self._journal = None
+        self._file_rows = 0
+        self._recover()
+        seqs = [int(f.split(".")[0][5:]) for f in os.listdir(path) if re.match(r"part-\d+\.", f)]
+        self._seq = max(seqs, default=-1) + 1
+
+    def _part(self, seq: int, suffix: str) -> str:
+        return os.path.join(self.path, f"part-{seq:06d}{suffix}")
+
+    def _recover(self):
+        """part-N.jsonl, що лишився після падіння -> part-N.parquet."""
+        for name in sorted(os.listdir(self.path)):
+            if not re.fullmatch(r"part-\d+\.jsonl", name):
+                continue
+            jsonl = os.path.join(self.path, name)
+            base = jsonl[:-len(".jsonl")]
+            rows = []
+            with open(jsonl, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass    # обрізаний останній рядок — його не встигли зачекпоінтити
+            if rows:
+                columns: Dict[str, None] = {}
+                for row in rows:
+                    columns.update(dict.fromkeys(row))
+                pq.write_table(self._table(rows, list(columns)), base + ".parquet.tmp")
+                os.replace(base + ".parquet.tmp", base + ".parquet")
+            for leftover in (base + ".parquet.inprogress", jsonl):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            logger.info("Recovered %d rows of unclosed part file -> %s.parquet", len(rows), base)
+
+    @staticmethod
+    def _table(flat_rows: List[Dict[str, Any]], columns: List[str]):
+        return pa.table({c: pa.array([r.get(c) for r in flat_rows], type=pa.string()) for c in columns})
+
+    def _open_file(self, columns: List[str]):
+        self._schema = pa.schema([(c, pa.string()) for c in columns])
+        self._writer = pq.ParquetWriter(self._part(self._seq, ".parquet.inprogress"), self._schema)
+        self._journal = open(self._part(self._seq, ".jsonl"), "a", encoding="utf-8")
+        self._file_rows = 0
+
+    def _close_file(self):
+        self._writer.close()
+        os.replace(self._part(self._seq, ".parquet.inprogress"), self._part(self._seq, ".parquet"))
+        self._journal.close()
+        os.remove(self._part(self._seq, ".jsonl"))
+        self._writer = self._schema = self._journal = None
+        self._seq += 1
+
+    def write(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        flat = [{k: _flat_value(v) for k, v in row.items()} for row in rows]
+        columns: Dict[str, None] = dict.fromkeys(self._schema.names) if self._schema is not None else {}
+        for row in flat:
+            columns.update(dict.fromkeys(row))
+        if self._writer is not None and (len(columns) > len(self._schema.names)
+                                         or self._file_rows >= self.rows_per_file):
+            self._close_file()
+        if self._writer is None:
+            self._open_file(list(columns))
+        for row in flat:
+            self._journal.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._writer.write_table(self._table(flat, self._schema.names), row_group_size=len(flat))
+        self._file_rows += len(flat)
+        self.rows_written += len(flat)
+
+    def close(self):
+        if self._writer is not None:
+            self._close_file()
+
+
+def make_sink(fmt: str = OUTPUT_FORMAT) -> OutputSink:
+    if fmt == "parquet":
+        if PYARROW_AVAILABLE:
+            return ParquetDatasetSink()
+        logger.warning("pyarrow not available, falling back to JSONL output: %s", OUTPUT_JSONL)
+    return JsonlSink()
+
+
+def load_results(path: str) -> pd.DataFrame:
+    """Зчитує результат будь-якого sink-а в один DataFrame (з уніфікацією колонок)."""
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".parquet"))
+        if not files:
+            return pd.DataFrame()
+        # відсутні в старих part-файлах колонки доповнюються null-ами
+        return pa.concat_tables([pq.read_table(f) for f in files], promote_options="default").to_pandas()
+    return pd.read_json(path, lines=True, dtype=False)
+
+
+# ----------------------
+# Job scheduler
+# ----------------------
+class JobScheduler:
+    """
+    Черга задач для воркерів:
+      - FIFO (deque) для свіжих ЄДРПОУ;
+      - min-heap по next_try_ts для ретраїв — O(log n) на push/pop.
+    Якщо готових задач немає, get() спить до найближчого ретраю (або до нової задачі),
+    а повертає None лише коли черги порожні і жодна задача не в роботі.
+    """
+
+    def __init__(self):
+        self.fresh = deque()   # (edrpou, meta)
+        self.retry_heap = []   # (next_try_ts, seq, edrpou, meta)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+
+    def __len__(self):
+        return len(self.fresh) + len(self.retry_heap)
+
+    def add_fresh(self, edrpou: str, meta: Dict[str, Any]):
+        self.fresh.append((edrpou, meta))
+
+    async def add_retry(self, edrpou: str, meta: Dict[str, Any], next_try_ts: float):
+        async with self._cond:
+            heapq.heappush(self.retry_heap, (next_try_ts, next(self._seq), edrpou, meta))
+            self._cond.notify_all()
+
+    def push_retry_nowait(self, edrpou: str, meta: Dict[str, Any], next_try_ts: float):
+        """Для заповнення з чекпоінта до старту воркерів."""
+        heapq.heappush(self.retry_heap, (next_try_ts, next(self._seq), edrpou, meta))
+
+    async def get(self):
+        """Наступна (edrpou, meta) або None, якщо роботи більше не буде."""
+        async with self._cond:
+            while True:
+                if self.fresh:
+                    self._in_flight += 1
+                    return self.fresh.popleft()
+                now_ts = time.time()
+                if self.retry_heap and self.retry_heap[0][0] <= now_ts:
+                    _, _, edrpou, meta = heapq.heappop(self.retry_heap)
+                    self._in_flight += 1
+                    return edrpou, meta
+                if not self.retry_heap and self._in_flight == 0:
+                    # будимо інших, щоб теж завершились
+                    self._cond.notify_all()
+                    return None
+                timeout = self.retry_heap[0][0] - now_ts if self.retry_heap else None
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def task_done(self):
+        """Викликати після того, як задачу завершено або перенесено в ретрай."""
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """pending / retry у форматі чекпоінта."""
+        pending = {e: meta for e, meta in self.fresh}
+        retry = {e: {**meta, "next_try_ts": ts} for ts, _, e, meta in self.retry_heap}
+        return pending, retry
+
+
 # ----------------------
 # Main worker logic
 # ----------------------
@@ -504,8 +750,8 @@ class UBKIParser:
         self.edrpou_list = edrpou_list
         self.results: List[Dict[str, Any]] = []
         self.processed = {}   # edrpou -> metadata
-        self.pending = {}     # edrpou -> metadata
-        self.retry_queue = {} # edrpou -> {"attempts": int, "next_try_ts": float}
+        self.scheduler = JobScheduler()
+        self.sink = make_sink()
         self._load_state()
         self._lock = asyncio.Lock()
         self._save_counter = 0
@@ -513,105 +759,107 @@ class UBKIParser:
     def _load_state(self):
         state = load_checkpoint()
         self.processed = state.get("processed", {})
-        self.pending = state.get("pending", {})
-        self.retry_queue = state.get("retry", {})
-        # fill pending from input if not present and not processed
+        pending = state.get("pending", {})
+        retry = state.get("retry", {})
+        for e, meta in pending.items():
+            self.scheduler.add_fresh(e, meta)
+        for e, meta in retry.items():
+            self.scheduler.push_retry_nowait(e, meta, meta.get("next_try_ts", 0))
+        # fill pending from input if not present and not processed;
+        # in_progress з попереднього запуску (впав посеред задачі) — теж повертаємо в роботу
         for e in self.edrpou_list:
-            if e not in self.processed and e not in self.pending and e not in self.retry_queue:
-                self.pending[e] = {"attempts": 0}
-
-    async def worker(self, client: httpx.AsyncClient, sem: asyncio.Semaphore, thread_pool: ThreadPoolExecutor):
+            if e in pending or e in retry:
+                continue
+            status = self.processed.get(e, {}).get("status")
+            if status is None:
+                self.scheduler.add_fresh(e, {"attempts": 0})
+            elif status == "in_progress":
+                self.scheduler.add_fresh(e, {"attempts": self.processed[e].get("attempts", 0)})
+
+    async def worker(self, client: httpx.AsyncClient, sem: asyncio.Semaphore, thread_pool: ThreadPoolExecutor,
+                     worker_id: int = 0):
         while True:
-            # choose next edrpou that is ready to try (pending or retry whose time has come)
-            edrpou = None
+            # next edrpou: fresh FIFO first, then due retries; sleeps until the next retry is due
+            job = await self.scheduler.get()
+            if job is None:
+                return
+            edrpou, meta = job
             now_ts = time.time()
             async with self._lock:
-                # first try pending list
-                for e, meta in list(self.pending.items()):
-                    edrpou = e
-                    break
-                # if no pending, try retry queue whose next_try_ts <= now
-                if edrpou is None:
-                    for e, meta in list(self.retry_queue.items()):
-                        if meta.get("next_try_ts", 0) <= now_ts:
-                            edrpou = e
-                            break
-                if edrpou is None:
-                    # nothing to do
-                    return
-                # reserve it
-                if edrpou in self.pending:
-                    meta = self.pending.pop(edrpou)
-                else:
-                    meta = self.retry_queue.pop(edrpou)
-
+                meta.pop("next_try_ts", None)
                 meta.setdefault("attempts", 0)
                 meta["attempts"] += 1
                 # store as in-progress in processed with 'in_progress': True (checkpointing)
                 self.processed[edrpou] = {"status": "in_progress", "attempts": meta["attempts"], "last_try": now_ts}
 
-            url = BASE_URL_TEMPLATE.format(edrpou=edrpou)
-            async with sem:
-                success = False
-                for attempt in range(1, RETRY_MAX + 1):
-                    html = await fetch_with_httpx(client, url, edrpou, attempt)
-                    if html is None:
-                        # try backoff then retry
-                        await asyncio.sleep(backoff_delay(attempt))
-                        continue
-
-                    # got html — parse
-                    soup = BeautifulSoup(html, "html.parser")
-                    # Quick heuristics for "Дані не знайдено" — налаштуй під конкретний текст сторінки
-                    page_text = soup.get_text(separator=" ").strip().lower()
-                    if "дані не знайдено" in page_text or "інформація відсутня" in page_text or "не знайдено" in page_text:
-                        logger.info("[!] Дані не знайдено для %s (attempt %d)", edrpou, meta["attempts"])
-                        # schedule retry with exponential delay
-                        next_delay = NOT_FOUND_RETRY_DELAY * (2 ** (meta["attempts"] - 1))
-                        next_ts = time.time() + next_delay
-                        async with self._lock:
+            try:
+                url = BASE_URL_TEMPLATE.format(edrpou=edrpou)
+                async with sem:
+                    success = False
+                    for attempt in range(1, RETRY_MAX + 1):
+                        html = await fetch_with_httpx(client, url, edrpou, attempt, f"worker-{worker_id}")
+                        if html is None:
+                            # try backoff then retry
+                            await asyncio.sleep(backoff_delay(attempt))
+                            continue
+
+                        # got html — parse
+                        soup = BeautifulSoup(html, "html.parser")
+                        # Quick heuristics for "Дані не знайдено" — налаштуй під конкретний текст сторінки
+                        page_text = soup.get_text(separator=" ").strip().lower()
+                        if "дані не знайдено" in page_text or "інформація відсутня" in page_text or "не знайдено" in page_text:
+                            logger.info("[!] Дані не знайдено для %s (attempt %d)", edrpou, meta["attempts"])
+                            # schedule retry with exponential delay
+                            next_delay = NOT_FOUND_RETRY_DELAY * (2 ** (meta["attempts"] - 1))
+                            next_ts = time.time() + next_delay
                             if meta["attempts"] < RETRY_FOR_NOT_FOUND:
-                                self.retry_queue[edrpou] = {"attempts": meta["attempts"], "next_try_ts": next_ts}
-                                self.processed[edrpou] = {"status": "scheduled_retry_not_found", "attempts": meta["attempts"], "next_try": next_ts}
-                            else:
-                                # mark as not_found_final
-                                self.processed[edrpou] = {"status": "not_found_final", "attempts": meta["attempts"], "last_try": time.time()}
-                        success = True
-                        break
+                                await self.scheduler.add_retry(edrpou, {"attempts": meta["attempts"]}, next_ts)
+                            async with self._lock:
+                                if meta["attempts"] < RETRY_FOR_NOT_FOUND:
+                                    self.processed[edrpou] = {"status": "scheduled_retry_not_found", "attempts": meta["attempts"], "next_try": next_ts}
+                                else:
+                                    # mark as not_found_final
+                                    self.processed[edrpou] = {"status": "not_found_final", "attempts": meta["attempts"], "last_try": time.time()}
+                            success = True
+                            break
 
-                    # If page seems valid, call parse function
-                    try:
-                        parsed = parse_ubki_full(soup, edrpou)
-                        if not parsed or len(parsed.keys()) <= 1:
-                            # fallback to cloudscraper sync in threadpool
-                            if CLOUDSCRAPER_AVAILABLE:
-                                html_cs = await asyncio.get_event_loop().run_in_executor(thread_pool, fetch_with_cloudscraper_sync, url, edrpou)
-                                if html_cs:
-                                    soup_cs = BeautifulSoup(html_cs, "html.parser")
-                                    parsed = parse_ubki_full(soup_cs, edrpou)
-                        # save parsed result
-                        async with self._lock:
-                            self.results.append(parsed)
-                            self.processed[edrpou] = {"status": "done", "attempts": meta["attempts"], "last_try": time.time()}
-                            self._save_counter += 1
-                        logger.info("✅ Parsed %s (attempts=%d)", edrpou, meta["attempts"])
-                        success = True
-                        break
-                    except Exception as e:
-                        logger.exception("Parser error for %s on attempt %d: %s", edrpou, attempt, e)
-                        await asyncio.sleep(backoff_delay(attempt))
-
-                if not success:
-                    # exhausted attempts: schedule retry with backoff or mark failed
-                    async with self._lock:
+                        # If page seems valid, call parse function
+                        try:
+                            parsed = parse_ubki_full(soup, edrpou)
+                            if not parsed or len(parsed.keys()) <= 1:
+                                # fallback to cloudscraper sync in threadpool
+                                if CLOUDSCRAPER_AVAILABLE:
+                                    html_cs = await asyncio.get_event_loop().run_in_executor(thread_pool, fetch_with_cloudscraper_sync, url, edrpou)
+                                    if html_cs:
+                                        soup_cs = BeautifulSoup(html_cs, "html.parser")
+                                        parsed = parse_ubki_full(soup_cs, edrpou)
+                            # save parsed result
+                            async with self._lock:
+                                self.results.append(parsed)
+                                self.processed[edrpou] = {"status": "done", "attempts": meta["attempts"], "last_try": time.time()}
+                                self._save_counter += 1
+                            logger.info("✅ Parsed %s (attempts=%d)", edrpou, meta["attempts"])
+                            success = True
+                            break
+                        except Exception as e:
+                            logger.exception("Parser error for %s on attempt %d: %s", edrpou, attempt, e)
+                            await asyncio.sleep(backoff_delay(attempt))
+
+                    if not success:
+                        # exhausted attempts: schedule retry with backoff or mark failed
                         if meta["attempts"] < RETRY_FOR_NOT_FOUND + 2:
                             delay = NOT_FOUND_RETRY_DELAY * (2 ** (meta["attempts"] - 1))
-                            self.retry_queue[edrpou] = {"attempts": meta["attempts"], "next_try_ts": time.time() + delay}
-                            self.processed[edrpou] = {"status": "scheduled_retry_error", "attempts": meta["attempts"], "next_try": time.time() + delay}
-                            logger.info("Scheduled retry for %s after failure (attempts=%d)", edrpou, meta["attempts"])
-                        else:
-                            self.processed[edrpou] = {"status": "failed_final", "attempts": meta["attempts"], "last_try": time.time()}
-                            logger.error("Failed final for %s (attempts=%d)", edrpou, meta["attempts"])
+                            await self.scheduler.add_retry(edrpou, {"attempts": meta["attempts"]}, time.time() + delay)
+                        async with self._lock:
+                            if meta["attempts"] < RETRY_FOR_NOT_FOUND + 2:
+                                self.processed[edrpou] = {"status": "scheduled_retry_error", "attempts": meta["attempts"], "next_try": time.time() + delay}
+                                logger.info("Scheduled retry for %s after failure (attempts=%d)", edrpou, meta["attempts"])
+                            else:
+                                self.processed[edrpou] = {"status": "failed_final", "attempts": meta["attempts"], "last_try": time.time()}
+                                logger.error("Failed final for %s (attempts=%d)", edrpou, meta["attempts"])
+            finally:
+                # job is either finished or already re-pushed into the retry heap
+                await self.scheduler.task_done()
 
             # checkpoint save periodically
             if self._save_counter >= SAVE_EVERY:
@@ -619,35 +867,39 @@ class UBKIParser:
 
     async def save_progress(self):
         async with self._lock:
-            # merge results into dataframe safe format
-            df_new = pd.DataFrame(self.results)
-            if os.path.exists(OUTPUT_CSV):
-                df_old = pd.read_csv(OUTPUT_CSV)
-                df = pd.concat([df_old, df_new], ignore_index=True)
-            else:
-                df = df_new
-            df.to_csv(OUTPUT_CSV, index=False)
+            # append-only: constant cost per flush regardless of output size
+            if self.results:
+                self.sink.write(self.results)
             # save checkpoint state
-            state = {"processed": self.processed, "pending": self.pending, "retry": self.retry_queue}
+            pending, retry = self.scheduler.snapshot()
+            state = {"processed": self.processed, "pending": pending, "retry": retry}
             save_checkpoint(state)
-            logger.info("Checkpoint saved: %s (total saved rows ~%d)", OUTPUT_CSV, len(df))
+            logger.info("Checkpoint saved: %s (rows written this run: %d)", self.sink.path, self.sink.rows_written)
             # clear in-memory results buffer
             self.results = []
             self._save_counter = 0
 
     async def run(self):
+        global PROXY_POOL
         sem = asyncio.Semaphore(CONCURRENCY)
         timeout = httpx.Timeout(REQUEST_TIMEOUT)
         limits = httpx.Limits(max_keepalive_connections=CONCURRENCY, max_connections=CONCURRENCY * 2)
         # setup client with optional proxies
         client_args = {"timeout": timeout, "limits": limits}
+        if PROXIES:
+            PROXY_POOL = ProxyPool(PROXIES, session_factory=lambda p: httpx.AsyncClient(proxy=p, **client_args))
         async with httpx.AsyncClient(**client_args) as client:
             thread_pool = ThreadPoolExecutor(max_workers=4)
             # start workers
-            workers = [asyncio.create_task(self.worker(client, sem, thread_pool)) for _ in range(CONCURRENCY)]
+            workers = [asyncio.create_task(self.worker(client, sem, thread_pool, i)) for i in range(CONCURRENCY)]
             await asyncio.gather(*workers)
             # final save (for any remaining results)
             await self.save_progress()
+        if PROXY_POOL is not None:
+            PROXY_POOL.export_stats(PROXY_STATS_FILE)
+            logger.info("Proxy stats -> %s: %s", PROXY_STATS_FILE, PROXY_POOL.summary())
+            await PROXY_POOL.aclose()
+        self.sink.close()
 
 # ----------------------
 # RUN SCRIPT
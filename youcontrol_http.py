@@ -0,0 +1,206 @@
+"""
+Нативний async-транспорт для каталогу YouControl (v4 / v5 / v6).
+
+Усі запити йдуть через один httpx.AsyncClient в одному потоці: пул з'єднань, keep-alive,
+HTTP/2 (якщо встановлено h2). cloudscraper лише проходить челендж Cloudflare — у потоці
+робить GET на URL_BASE, після чого його cookies (cf_clearance, __cf_bm, ...) і User-Agent,
+до якого прив'язаний cf_clearance, переносяться в async-клієнт.
+
+Відповідь-челендж (403/503 з cf-mitigated або сторінкою "Just a moment") -> одна на всіх
+повторна clearance (решта корутин чекає її, а не запускає свою) і один повтор запиту.
+Без httpx скрипти лишаються на cloudscraper у ThreadPoolExecutor (HTTPX_AVAILABLE).
+
+З proxy_pool (proxy_pool.py) — окремий клієнт і clearance на кожен проксі. Sticky-ключ
+проксі — get(key=...) або PROXY_KEY.set(...) на початку воркера (contextvar, свій у кожної
+asyncio-задачі), тож ключ не треба протягувати через fetch_async / click_on_link_async.
+"""
+import asyncio, contextvars, logging, time
+
+from proxy_pool import ProxyPool, mask_proxy
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except Exception:
+    HTTPX_AVAILABLE = False
+try:
+    import h2  # noqa: F401 — потрібен httpx для http2=True
+    H2_AVAILABLE = True
+except Exception:
+    H2_AVAILABLE = False
+try:
+    import cloudscraper
+    CLOUDSCRAPER_AVAILABLE = True
+except Exception:
+    CLOUDSCRAPER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+URL_BASE = "https://youcontrol.com.ua/catalog/kved/"
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_TIMEOUT = 30
+PROXY_KEY = contextvars.ContextVar("youcontrol_proxy_key", default=None)
+CLEARANCE_MAX_AGE = 25 * 60      # сек; cf_clearance живе ~30 хв, оновлюємо трохи раніше
+PROXY_STATS_FILE = "youcontrol_proxy_stats.csv"   # здоров'я проксі, пишеться в aclose()
+
+
+def is_challenge(status, headers, text):
+    """Cloudflare віддав челендж замість сторінки."""
+    if status not in (403, 503):
+        return False
+    if headers.get("cf-mitigated") == "challenge":
+        return True
+    head = (text or "")[:4000]
+    return "Just a moment" in head or "cf-chl" in head or "challenge-platform" in head
+
+
+class _Route:
+    """Один вихід у мережу (напряму або через проксі): свій клієнт, cookies і clearance."""
+
+    def __init__(self, client, proxy=None):
+        self.client = client
+        self.proxy = proxy
+        self.user_agent = None          # UA сесії, що отримала cf_clearance
+        self.cleared_at = 0.0
+        self.generation = 0             # +1 на кожну спробу clearance; відсікає повторні оновлення
+        self.lock = asyncio.Lock()
+
+
+class YouControlHttp:
+    def __init__(self, url_base=URL_BASE, max_connections=HTTP_MAX_CONNECTIONS,
+                 max_keepalive=HTTP_MAX_KEEPALIVE, timeout=HTTP_TIMEOUT, proxy_pool=None, proxy_file=None,
+                 proxy_stats_file=PROXY_STATS_FILE):
+        """
+        proxy_pool (або proxy_file для ProxyPool.from_file) — кожен запит іде через зважено обраний
+        здоровий проксі його власним клієнтом, з власною clearance (cf_clearance прив'язаний до IP);
+        челендж після повторної clearance рахується баном проксі. Без них — напряму.
+        """
+        if proxy_pool is None and proxy_file:
+            proxy_pool = ProxyPool.from_file(proxy_file)
+        self.proxy_stats_file = proxy_stats_file
+        self.url_base = url_base
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.proxy_pool = proxy_pool if proxy_pool is not None and proxy_pool.enabled else None
+        if self.proxy_pool is not None and self.proxy_pool.session_factory is None:
+            self.proxy_pool.session_factory = self._new_client
+        self.direct = _Route(self._new_client(None))
+        self.routes = {None: self.direct}
+        self.requests = self.challenges = self.clearances = 0
+
+    def _new_client(self, proxy):
+        return httpx.AsyncClient(
+            proxy=proxy,
+            http2=H2_AVAILABLE,
+            limits=self.limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+
+    def _route(self, proxy):
+        route = self.routes.get(proxy)
+        if route is None:
+            route = self.routes[proxy] = _Route(self.proxy_pool.session(proxy), proxy)
+        return route
+
+    # --- clearance ---
+    def _solve(self, proxy=None):
+        """Блокуюча: cloudscraper проходить челендж. -> (status, [(name, value, domain, path)], ua)."""
+        scraper = cloudscraper.create_scraper(delay=10, browser={
+            'browser': 'chrome', 'platform': 'windows', 'mobile': False
+        })
+        if proxy:
+            scraper.proxies = {"http": proxy, "https": proxy}
+        try:
+            resp = scraper.get(self.url_base, timeout=self.timeout)
+            cookies = [(c.name, c.value, c.domain or "", c.path or "/") for c in scraper.cookies]
+            return resp.status_code, cookies, scraper.headers.get("User-Agent")
+        finally:
+            scraper.close()
+
+    async def clearance(self, route, seen_generation=None):
+        """
+        Нові cookies від cloudscraper для route. seen_generation — покоління, з яким запит отримав
+        челендж: якщо інша корутина вже оновила clearance цього route, повторно не оновлюємо.
+        """
+        async with route.lock:
+            if seen_generation is not None and seen_generation != route.generation:
+                return
+            if not CLOUDSCRAPER_AVAILABLE:
+                logger.warning("cloudscraper не встановлено — запити без clearance cookies")
+                route.cleared_at = time.monotonic()
+                route.generation += 1
+                return
+            try:
+                status, cookies, ua = await asyncio.to_thread(self._solve, route.proxy)
+            except Exception as e:
+                # не пробуємо на кожному запиті: наступна спроба — на челенджі або через CLEARANCE_MAX_AGE
+                logger.warning(f"Clearance failed ({mask_proxy(route.proxy) or 'direct'}): {e}")
+                route.cleared_at = time.monotonic()
+                route.generation += 1
+                return
+            for name, value, domain, path in cookies:
+                route.client.cookies.set(name, value, domain=domain, path=path)
+            route.user_agent = ua or route.user_agent
+            route.cleared_at = time.monotonic()
+            route.generation += 1
+            self.clearances += 1
+            logger.info(f"Clearance #{self.clearances} ({mask_proxy(route.proxy) or 'direct'}): HTTP {status}, "
+                        f"cookies {[c[0] for c in cookies]}")
+
+    # --- запити ---
+    async def get(self, url, headers=None, key=None):
+        """
+        Один GET -> (status, text); (None, None) — мережева помилка. Челендж -> clearance + 1 повтор.
+        key — sticky-ключ проксі (за замовчуванням PROXY_KEY поточної задачі).
+        """
+        key = key if key is not None else PROXY_KEY.get()
+        proxy = await self.proxy_pool.acquire(key) if self.proxy_pool is not None else None
+        route = self._route(proxy)
+        status = error = None
+        banned = False
+        latency = 0.0
+        try:
+            if not route.cleared_at or time.monotonic() - route.cleared_at > CLEARANCE_MAX_AGE:
+                await self.clearance(route, route.generation)
+            for attempt in range(2):
+                generation = route.generation
+                h = dict(headers or {})
+                if route.user_agent:
+                    h["User-Agent"] = route.user_agent
+                t0 = time.monotonic()
+                try:
+                    resp = await route.client.get(url, headers=h)
+                except httpx.HTTPError as e:
+                    error = e
+                    logger.warning(f"GET failed: {e!r} → {url}")
+                    return None, None
+                finally:
+                    latency = time.monotonic() - t0
+                self.requests += 1
+                status = resp.status_code
+                banned = is_challenge(status, resp.headers, resp.text)
+                if attempt == 0 and banned:
+                    self.challenges += 1
+                    await self.clearance(route, generation)
+                    continue
+                return status, resp.text
+        finally:
+            if self.proxy_pool is not None:
+                self.proxy_pool.report(proxy, status, latency, error, banned=banned)
+
+    def stats(self):
+        out = {"requests": self.requests, "challenges": self.challenges, "clearances": self.clearances,
+               "http2": H2_AVAILABLE}
+        if self.proxy_pool is not None:
+            out["proxies"] = self.proxy_pool.summary()
+        return out
+
+    async def aclose(self):
+        await self.direct.client.aclose()
+        if self.proxy_pool is not None:
+            if self.proxy_stats_file:
+                self.proxy_pool.export_stats(self.proxy_stats_file)
+                logger.info(f"Proxy stats → {self.proxy_stats_file}")
+            await self.proxy_pool.aclose()
@@ -0,0 +1,150 @@
+"""
+Однопрохідний lxml-парсер сторінки company_details YouControl (v4 / v5 / v6 / v8).
+
+Замість BeautifulSoup-дерева і до чотирьох row.find(...) на рядок (ще й двічі в comprehension-ах)
+парсимо HTML одразу lxml-ом, скомпільованими XPath знаходимо таблиці
+#catalog-company-file / #catalog-company-beneficiary і за один обхід кожного seo-table-row
+запам'ятовуємо перші потрібні вузли: col-1, span/div.copy-file-field, p.ucfirst copy-file-field,
+col-2 (+ чи має він copy-hover). Текст вузла — як bs4 .text (без коментарів і script/style/template).
+
+Зі знайдених комірок словники збираються з тими ж особливостями, що були в скриптах:
+  profile_dict_zip / beneficiary_dict_zip — v4 / v5 / v6 (колонки і значення зшиваються по позиції)
+  profile_dict_rows / beneficiary_dict_rows — v8 (ключ і значення з того самого рядка)
+
+Перевірка і бенчмарк: python bench_youcontrol_parser.py golden | parity | bench
+"""
+import re
+from collections import namedtuple
+
+from lxml import etree, html as lxml_html
+
+# Комірки одного seo-table-row; текстові поля — сирий текст вузла або None, якщо вузла немає
+Row = namedtuple("Row", "label value span col2 col2_hover")
+# profile / beneficiary — [Row] або None (блоку немає); header — текст h2 з ЄДРПОУ або None
+CompanyPage = namedtuple("CompanyPage", "profile beneficiary header")
+
+_BLOCKS = etree.XPath(
+    "//div[@id='catalog-company-file' or @id='catalog-company-beneficiary']"
+    "[contains(concat(' ', normalize-space(@class), ' '), ' seo-table-contain ')]"
+)
+_ROWS = etree.XPath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' seo-table-row ')]")
+_HEADER = etree.XPath("//h2[normalize-space(@class)='seo-table-name case-icon short']")
+_TEXT = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+
+
+def clean_text(text):
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def node_text(el):
+    """Текст як у bs4 .text: усі нащадки, без коментарів і вмісту script/style/template."""
+    return "".join(_TEXT(el))
+
+
+def _row_cells(row):
+    """Один обхід рядка: перший вузол кожного виду в порядку документа."""
+    label = span = div_copy = p_copy = col2 = None
+    for el in row.iterdescendants():
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue        # коментарі / processing instructions
+        cls = el.get("class")
+        if not cls:
+            continue
+        classes = cls.split()
+        if tag == "div":
+            if label is None and "seo-table-col-1" in classes:
+                label = el
+            if col2 is None and "seo-table-col-2" in classes:
+                col2 = el
+            if div_copy is None and "copy-file-field" in classes:
+                div_copy = el
+        elif tag == "span":
+            if span is None and "copy-file-field" in classes:
+                span = el
+        elif tag == "p":
+            if p_copy is None and " ".join(classes) == "ucfirst copy-file-field":
+                p_copy = el
+    # пріоритет як у ланцюжку find(span) or find(div) or find(p) or find(col-2)
+    value = span if span is not None else div_copy if div_copy is not None else p_copy if p_copy is not None else col2
+    return Row(
+        label=None if label is None else node_text(label),
+        value=None if value is None else node_text(value),
+        span=None if span is None else node_text(span),
+        col2=None if col2 is None else node_text(col2),
+        col2_hover=col2 is not None and "copy-hover" in col2.get("class", "").split(),
+    )
+
+
+def make_document(page):
+    """str | bytes -> lxml-дерево."""
+    try:
+        return lxml_html.fromstring(page)
+    except ValueError:
+        # str з <?xml ... encoding=...?> lxml не приймає
+        return lxml_html.fromstring(page.encode("utf-8"))
+
+
+def parse_company_page(page):
+    """HTML сторінки компанії -> CompanyPage."""
+    doc = make_document(page)
+    blocks = {}
+    for block in _BLOCKS(doc):
+        # як find(): перший блок з таким id
+        blocks.setdefault(block.get("id"), block)
+    profile = blocks.get("catalog-company-file")
+    beneficiary = blocks.get("catalog-company-beneficiary")
+    header = _HEADER(doc)
+    return CompanyPage(
+        profile=None if profile is None else [_row_cells(r) for r in _ROWS(profile)],
+        beneficiary=None if beneficiary is None else [_row_cells(r) for r in _ROWS(beneficiary)],
+        header=node_text(header[0]) if header else None,
+    )
+
+
+def header_edrpou(page):
+    m = re.search(r"\d+", page.header or "")
+    return m.group() if m else None
+
+
+# --- v4 / v5 / v6: позиційне зшивання ---
+def profile_dict_zip(rows, clean_keys=False):
+    """Назви з col-1, значення — лише непорожні; зшиваються по позиції."""
+    if not rows:
+        return {}
+    key = clean_text if clean_keys else (lambda s: (s or "").strip())   # рядок без col-1 -> ""
+    columns = [key(r.label) for r in rows]
+    values = [clean_text(r.value) for r in rows if r.value is not None and r.value.strip()]
+    return dict(zip(columns, values))
+
+
+def beneficiary_dict_zip(rows, edrpou, clean_keys=False, require_edrpou=False):
+    """
+    Назви з col-1 + "EDRPOU_CODE"; значення — усі span.copy-file-field, далі col-2 без copy-hover,
+    далі edrpou. require_edrpou (v6) — EDRPOU_CODE лише коли він знайдений у заголовку.
+    rows None — блоку немає; порожній блок все одно дає EDRPOU_CODE.
+    """
+    if rows is None:
+        return {}
+    key = clean_text if clean_keys else (lambda s: (s or "").strip())   # рядок без col-1 -> ""
+    columns = [key(r.label) for r in rows]
+    values = [clean_text(r.span) for r in rows if r.span is not None]
+    values += [clean_text(r.col2) for r in rows if r.col2 is not None and not r.col2_hover]
+    if edrpou or not require_edrpou:
+        columns.append("EDRPOU_CODE")
+        values.append(edrpou)
+    return dict(zip(columns, values))
+
+
+# --- v8: рядок за рядком ---
+def profile_dict_rows(rows):
+    return {clean_text(r.label): clean_text(r.value) for r in rows or () if r.value is not None}
+
+
+def beneficiary_dict_rows(rows):
+    out = {}
+    for r in rows or ():
+        val = r.span if r.span is not None else r.col2
+        if val is not None:
+            out[clean_text(r.label)] = clean_text(val)
+    return out